@@ -7,61 +7,313 @@ if sys.stdout.encoding.lower() not in ('utf-8', 'utf8'):
 
 import asyncio
 import os
-import undetected_chromedriver as uc # pyright: ignore[reportMissingImports]
 from utils import *
-from selenium.webdriver.support.ui import Select # pyright: ignore[reportMissingImports]
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import (
-    TimeoutException, 
-    NoSuchElementException, 
-    WebDriverException,
-    ElementNotInteractableException,
-    StaleElementReferenceException,
-    ElementClickInterceptedException,
-    InvalidElementStateException,
-    SessionNotCreatedException
-)
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackContext
-from configparser import ConfigParser
+with import_timer('undetected_chromedriver'):
+    import undetected_chromedriver as uc # pyright: ignore[reportMissingImports]
+with import_timer('selenium'):
+    from selenium.webdriver.support.ui import Select # pyright: ignore[reportMissingImports]
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.support.events import EventFiringWebDriver, AbstractEventListener
+    from selenium.common.exceptions import (
+        TimeoutException, 
+        NoSuchElementException, 
+        WebDriverException,
+        ElementNotInteractableException,
+        StaleElementReferenceException,
+        InvalidElementStateException,
+        SessionNotCreatedException
+    )
+with import_timer('telegram.ext'):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackContext
 import logging
+import time
+import base64
+import random
+import threading
+import queue
+import multiprocessing
+from types import SimpleNamespace
+from contextlib import nullcontext
 from datetime import datetime
 
 # Get logger from utils
 logger = logging.getLogger('VFSBot')
 
+# Resolves a prioritized list of Selenium locators in a single round trip.
+# arguments: [[by, value], ...], clickable, option_texts -> [index, element] or null
+FIND_ANY_SCRIPT = """
+const specs = arguments[0], clickable = arguments[1], optionTexts = arguments[2];
+function resolve(by, value) {
+    try {
+        switch (by) {
+            case 'id': { const el = document.getElementById(value); return el ? [el] : []; }
+            case 'name': return Array.from(document.getElementsByName(value));
+            case 'css selector': return Array.from(document.querySelectorAll(value));
+            case 'class name': return Array.from(document.getElementsByClassName(value));
+            case 'tag name': return Array.from(document.getElementsByTagName(value));
+            case 'link text': return Array.from(document.links).filter(a => a.textContent.trim() === value);
+            case 'partial link text': return Array.from(document.links).filter(a => a.textContent.includes(value));
+            case 'xpath': {
+                const snapshot = document.evaluate(value, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+                const nodes = [];
+                for (let i = 0; i < snapshot.snapshotLength; i++) nodes.push(snapshot.snapshotItem(i));
+                return nodes;
+            }
+        }
+    } catch (e) {}
+    return [];
+}
+function withOption(el) {
+    if (!optionTexts.length) return el;
+    if (el.tagName === 'OPTION') el = el.closest('select');
+    if (!el || el.tagName !== 'SELECT') return null;
+    return Array.from(el.options).some(o => optionTexts.some(t => o.text.includes(t))) ? el : null;
+}
+function usable(el) {
+    if (!clickable) return true;
+    return el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden' && !el.disabled;
+}
+for (let i = 0; i < specs.length; i++) {
+    for (const found of resolve(specs[i][0], specs[i][1])) {
+        const el = withOption(found);
+        if (el && usable(el)) return [i, el];
+    }
+}
+return null;
+"""
+
+
+# Reads the selected appointment category in one round trip.
+# arguments: [id, name] of the select remembered from the last check, or null to scan all selects
+CATEGORY_STATE_SCRIPT = """
+const wanted = arguments[0];
+let selects = Array.from(document.querySelectorAll('select'));
+if (wanted) selects = selects.filter(s => (wanted[0] && s.id === wanted[0]) || (wanted[1] && s.name === wanted[1]));
+for (const s of selects) {
+    const o = s.options[s.selectedIndex];
+    if (o && o.text.includes('Latvia') && o.text.includes('Temporary')) {
+        return {href: location.href, text: o.text, id: s.id, name: s.name};
+    }
+}
+return {href: location.href, text: null};
+"""
+
+
+# Whole page structure report in one round trip (see _collect_page_diagnostics)
+PAGE_DIAGNOSTICS_SCRIPT = """
+const clip = (t, n) => (t || '').replace(/\\s+/g, ' ').trim().slice(0, n);
+const count = sel => document.querySelectorAll(sel).length;
+const selects = Array.from(document.querySelectorAll('select')).map(s => ({
+    id: s.id || null,
+    name: s.name || null,
+    cls: clip(s.className, 60) || null,
+    selected: s.selectedIndex >= 0 ? clip(s.options[s.selectedIndex].text, 80) : null,
+    options: Array.from(s.options).map(o => clip(o.text, 80)).filter(Boolean).slice(0, 20),
+    n_options: s.options.length,
+    latvia: Array.from(s.options).some(o => o.text.includes('Latvia')),
+}));
+const body = document.body ? document.body.innerText : '';
+const lower = body.toLowerCase();
+return {
+    url: location.href,
+    title: clip(document.title, 120),
+    ready_state: document.readyState,
+    counts: {select: selects.length, input: count('input'), button: count('button'),
+             form: count('form'), combobox: count('[role="combobox"]'), dropdown: count('.dropdown')},
+    selects: selects,
+    latvia_text: (body.match(/Latvia/g) || []).length,
+    login_markers: ['email', 'password', 'login', 'signin', 'username'].filter(m => lower.includes(m)),
+};
+"""
+
+
+# Applies a compiled fill plan (utils.compile_fill_plan) in one round trip:
+# finds each field, sets its value / picks the option by normalized text,
+# fires the events the page listens to and reads every value back.
+FILL_PLAN_SCRIPT = """
+const plan = arguments[0];
+const norm = t => (t || '').replace(/\\s+/g, ' ').trim().toLowerCase();
+const visible = el => !el.disabled && !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+const attrs = el => ((el.name || '') + ' ' + (el.id || '')).toLowerCase();
+const accepts = {
+    select: el => el.tagName === 'SELECT',
+    date: el => el.tagName === 'INPUT' && (el.type === 'date' || /date|expiry|validity/.test(attrs(el))),
+    email: el => (el.tagName === 'INPUT' && el.type === 'email') || attrs(el).includes('email'),
+    phone: el => (el.tagName === 'INPUT' && ['tel', 'text'].includes(el.type)) || /phone|mobile/.test(el.name || ''),
+    textarea: el => ['TEXTAREA', 'INPUT'].includes(el.tagName),
+    text: el => el.tagName === 'INPUT' && ['text', 'email', 'tel'].includes(el.type),
+};
+const fire = (el, names) => names.forEach(n => el.dispatchEvent(new Event(n, {bubbles: true})));
+const setNative = (el, value) => {
+    const proto = el.tagName === 'TEXTAREA' ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+    Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, value);
+};
+const used = new Set();
+const results = [];
+for (const step of plan) {
+    let el = null, selector = null;
+    for (const sel of step.selectors) {
+        let found;
+        try { found = Array.from(document.querySelectorAll(sel)); } catch (e) { continue; }
+        el = found.find(c => !used.has(c) && visible(c) && accepts[step.kind](c)) || null;
+        if (el) { selector = sel; break; }
+    }
+    if (!el) { results.push({field: step.field, status: 'not_found'}); continue; }
+    used.add(el);
+    if (el.tagName === 'SELECT') {
+        const options = Array.from(el.options);
+        const option = options.find(o => norm(o.text) === step.match)
+            || options.find(o => norm(o.value) === step.match)
+            || options.find(o => norm(o.text) && (norm(o.text).includes(step.match) || step.match.includes(norm(o.text))));
+        if (!option) { results.push({field: step.field, selector, status: 'no_option'}); continue; }
+        el.focus();
+        el.value = option.value;
+        option.selected = true;
+        fire(el, ['input', 'change', 'blur']);
+        const current = el.options[el.selectedIndex];
+        results.push({field: step.field, selector, status: current === option ? 'filled' : 'mismatch',
+                      value: current ? current.text.trim() : null});
+    } else {
+        // Native date inputs drop anything that is not YYYY-MM-DD
+        const value = el.type === 'date' && step.iso ? step.iso : step.value;
+        el.focus();
+        setNative(el, value);
+        fire(el, ['input', 'change', 'blur']);
+        results.push({field: step.field, selector, status: el.value === value ? 'filled' : 'mismatch', value: el.value});
+    }
+}
+return results;
+"""
+
+
+# Hot-path page reads in one round trip (see _hot_read), over CDP or execute_script.
+HOT_READ_SCRIPT = """
+return {
+    url: location.href,
+    ready_state: document.readyState,
+    title: document.title,
+};
+"""
+
+
+# In-page availability watcher (see _wait_for_availability). A MutationObserver on the
+# page classifies it as no_seats / date / pending and pushes every change to waiting
+# AVAILABILITY_WAIT_SCRIPT calls, so Python does not poll the DOM.
+# arguments: [no-seats text of the watch target]; returns the current state event
+AVAILABILITY_WATCHER_SCRIPT = """
+let w = window.__vfsAvailability;
+if (!w) {
+    w = window.__vfsAvailability = {seq: 0, key: null, last: null, waiters: [], timer: null};
+    const classify = () => {
+        const label = document.getElementById('lblDate');
+        const date = label && document.getElementById('dvEarliestDateLnk') ? label.innerHTML.trim() : '';
+        if (date) return {state: 'date', date};
+        if (document.body && document.body.textContent.includes(w.noSeats)) return {state: 'no_seats'};
+        return {state: 'pending'};
+    };
+    w.check = () => {
+        const event = classify();
+        const key = event.state + '|' + (event.date || '');
+        if (key === w.key) return;
+        w.key = key;
+        event.seq = ++w.seq;
+        event.ts = Date.now();
+        w.last = event;
+        const waiters = w.waiters;
+        w.waiters = [];
+        waiters.forEach(cb => cb(event));
+    };
+    // Bursts of mutations are classified once
+    new MutationObserver(() => {
+        if (!w.timer) w.timer = setTimeout(() => { w.timer = null; w.check(); }, 50);
+    }).observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+}
+w.noSeats = arguments[0];
+w.check();
+return w.last;
+"""
+
+# Long poll on the watcher: resolves with the first event newer than seq arguments[0],
+# or with the latest event once arguments[1] ms have passed (null without a watcher)
+AVAILABILITY_WAIT_SCRIPT = """
+const [since, timeout, done] = arguments;
+const w = window.__vfsAvailability;
+if (!w) return done(null);
+if (w.last && w.last.seq > since) return done(w.last);
+const resolve = event => { clearTimeout(timer); done(event); };
+const timer = setTimeout(() => { w.waiters = w.waiters.filter(cb => cb !== resolve); done(w.last); }, timeout);
+w.waiters.push(resolve);
+"""
+
+# Scripts that only read the page: running them keeps the DOM mirror snapshot valid
+READ_ONLY_SCRIPTS = frozenset({
+    FIND_ANY_SCRIPT, CATEGORY_STATE_SCRIPT, PAGE_DIAGNOSTICS_SCRIPT, HOT_READ_SCRIPT,
+    AVAILABILITY_WATCHER_SCRIPT, AVAILABILITY_WAIT_SCRIPT,
+})
+
+# Longest single long poll (seconds): chromedriver runs one command at a time, so browser
+# calls from Telegram handlers (e.g. /diag) wait for at most one poll
+AVAILABILITY_POLL_SLICE = 5
+
+
+class DomMirrorListener(AbstractEventListener):
+    """Reports navigation and drops the DOM mirror snapshot (if any) whenever the page may have changed"""
+    
+    def __init__(self, mirror=None, on_navigate=None):
+        self.mirror = mirror
+        self.on_navigate = on_navigate
+    
+    def _changed(self):
+        if self.mirror is not None:
+            self.mirror.invalidate()
+    
+    def _navigated(self):
+        self._changed()
+        if self.on_navigate:
+            self.on_navigate()
+    
+    def after_navigate_to(self, url, driver):
+        self._navigated()
+    
+    def after_navigate_back(self, driver):
+        self._navigated()
+    
+    def after_navigate_forward(self, driver):
+        self._navigated()
+    
+    def after_click(self, element, driver):
+        self._changed()
+    
+    def after_change_value_of(self, element, driver):
+        self._changed()
+    
+    def after_execute_script(self, script, driver):
+        if script not in READ_ONLY_SCRIPTS:
+            self._changed()
 
 
 class VFSBot:
-    def __init__(self):
+    def __init__(self, shard=None):
+        self._startup_started = time.monotonic()
+        # (index, count, outbox, inbox) when running as a shard worker under ShardSupervisor
+        self.shard = shard
         logger.info("="*60)
         logger.info("🤖 ИНИЦИАЛИЗАЦИЯ БОТА")
         logger.info("="*60)
         
-        self.config = ConfigParser()
-        
         # Get the directory where the script is located
         import os
         script_dir = os.path.dirname(os.path.abspath(__file__))
         config_path = os.path.join(script_dir, 'config.ini')
         
-        # Try different encodings for config file
-        config_loaded = False
-        for encoding in ['utf-8', 'utf-8-sig', 'cp1251', 'latin-1']:
-            try:
-                self.config.read(config_path, encoding=encoding)
-                if 'VFS' in self.config.sections():
-                    logger.info(f"✅ Конфигурация загружена из {config_path} (кодировка: {encoding})")
-                    config_loaded = True
-                    break
-            except Exception as e:
-                logger.debug(f"Не удалось загрузить с кодировкой {encoding}: {e}")
-        
-        if not config_loaded:
+        # Shared with utils (OCR settings), so config.ini is parsed only once
+        self.config = load_config(config_path)
+        if self.config is None:
             raise Exception(f"❌ Не удалось загрузить {config_path} с поддерживаемыми кодировками")
     
         self.url = self.config.get('VFS', 'url')
@@ -73,6 +325,9 @@ class VFSBot:
         self.auto_login = self.config.getboolean('VFS', 'auto_login', fallback=True)
         self.captcha_enabled = self.config.getboolean('VFS', 'captcha_enabled', fallback=True)
         self.captcha_auto_solve = self.config.getboolean('VFS', 'captcha_auto_solve', fallback=True)
+        # Manual captcha: seconds to wait for an admin's Telegram reply before falling back to OCR
+        self.captcha_manual_timeout = self.config.getint('VFS', 'captcha_manual_timeout', fallback=60)
+        self.captcha_broker = CaptchaBroker()
         self.channel_id = self.config.get('TELEGRAM', 'channel_id')
         token = self.config.get('TELEGRAM', 'auth_token')
         # Fix admin_ids parsing - handle empty strings and extra spaces
@@ -85,6 +340,37 @@ class VFSBot:
         self.started = False
         self.admin_handler = AdminHandler(admin_ids)
         self.browser = None  # Initialize browser attribute
+        
+        # Learned order of click methods per (page, element kind)
+        self.click_strategies = ClickStrategyCache()
+        
+        # Latvia category selection known for the current page/session (see _read_category_selection)
+        self._category_state = None
+        
+        # Local DOM snapshot used to prune long selector lists before asking the browser
+        self.dom_mirror = DomMirror(
+            self._fetch_dom_html,
+            max_age=self.config.getfloat('DOM_MIRROR', 'max_age', fallback=2.0),
+            enabled=self.config.getboolean('DOM_MIRROR', 'enabled', fallback=True),
+        )
+        # Optional Selenium Grid backend: sessions are placed on the node with the most idle slots
+        self.grid = None
+        self.grid_node = None  # id of the node running the current remote session
+        if self.config.getboolean('REMOTE_GRID', 'enabled', fallback=False):
+            self.grid = GridClient(
+                self.config.get('REMOTE_GRID', 'hub_url', fallback='http://localhost:4444'),
+                browser_name=self.config.get('REMOTE_GRID', 'browser_name', fallback='chrome'),
+                timeout=self.config.getfloat('REMOTE_GRID', 'status_timeout', fallback=3),
+                node_cooldown=self.config.getint('REMOTE_GRID', 'node_cooldown', fallback=300),
+            )
+        # Hot standby: one pre-launched spare driver promoted the moment the active one dies
+        self.standby_enabled = self.config.getboolean('BROWSER_STANDBY', 'enabled', fallback=False)
+        self.standby_health_interval = self.config.getint('BROWSER_STANDBY', 'health_interval', fallback=60)
+        self._standby = None  # (driver, grid node id)
+        self._standby_lock = threading.Lock()
+        self._standby_wake = threading.Event()
+        self._standby_thread = None
+        self._driver_launch_lock = threading.Lock()  # undetected_chromedriver patches its binary on launch
         self.thr = None  # Initialize thread/task attribute
         
         # Statistics for reporting
@@ -94,6 +380,125 @@ class VFSBot:
         self.report_task = None  # Initialize report task
         self.last_cleanup = datetime.now()  # Track cleanup operations
         
+        # Structured per-check / per-login event stream (JSONL), one file set per shard
+        events_path = self.config.get('EVENTS', 'path', fallback='events/events.jsonl')
+        if self.shard:
+            events_path = shard_path(events_path, self.shard[0])
+        self.event_log = EventLog(
+            path=events_path,
+            max_bytes=self.config.getint('EVENTS', 'max_bytes', fallback=5 * 1024 * 1024),
+            backup_count=self.config.getint('EVENTS', 'backup_count', fallback=10),
+            compress=self.config.getboolean('EVENTS', 'compress', fallback=True),
+            enabled=self.config.getboolean('EVENTS', 'enabled', fallback=True),
+        )
+        self._trace = None  # EventTrace of the check/login currently running
+        # Page structure diagnostics: always on failure, sampled on the normal path
+        self.diagnostics_sample_rate = self.config.getfloat('EVENTS', 'diagnostics_sample_rate', fallback=0.0)
+        self.diagnostics_on_failure = self.config.getboolean('EVENTS', 'diagnostics_on_failure', fallback=True)
+        
+        # Adaptive polling: backoff on throttling, faster in learned release windows, hourly budget
+        self.scheduler = PollScheduler(
+            base_interval=self.interval,
+            min_interval=self.config.getint('SCHEDULER', 'min_interval', fallback=30),
+            max_interval=self.config.getint('SCHEDULER', 'max_interval', fallback=1800),
+            backoff_factor=self.config.getfloat('SCHEDULER', 'backoff_factor', fallback=2.0),
+            jitter=self.config.getfloat('SCHEDULER', 'jitter', fallback=0.2),
+            hot_factor=self.config.getfloat('SCHEDULER', 'hot_factor', fallback=0.5),
+            hot_min_interval=self.config.getint('SCHEDULER', 'hot_min_interval', fallback=10),
+            hot_min_releases=self.config.getint('SCHEDULER', 'hot_min_releases', fallback=2),
+            hourly_budget=self.config.getint('SCHEDULER', 'hourly_budget', fallback=0),
+            enabled=self.config.getboolean('SCHEDULER', 'enabled', fallback=True),
+        )
+        logger.info(f"🗓️ Адаптивный планировщик: {'включен' if self.scheduler.enabled else 'выключен'}"
+                    f" (бюджет: {self.scheduler.hourly_budget or '∞'} проверок/час)")
+        
+        # Applicant selection: weighted round-robin, boosted as deadlines approach
+        self.person_queue = WeightedRoundRobin()
+        self.urgency_horizon_days = self.config.getint('SCHEDULER', 'urgency_horizon_days', fallback=90)
+        self.urgency_boost = self.config.getfloat('SCHEDULER', 'urgency_boost', fallback=2.0)
+        # Checks per applicant turn before rotating to the next one; weights only take
+        # effect through rotation (0 = stay until an error)
+        self.checks_per_turn = self.config.getint('SCHEDULER', 'checks_per_turn', fallback=3)
+        self._cycle_served = set()
+        
+        # Per-applicant circuit breakers: a locked or looping account is skipped, not waited for
+        self.breakers = {}
+        self.breaker_failure_threshold = self.config.getint('SCHEDULER', 'breaker_failure_threshold', fallback=5)
+        self.breaker_cooldown = self.config.getint('SCHEDULER', 'breaker_cooldown', fallback=600)
+        self.breaker_max_cooldown = self.config.getint('SCHEDULER', 'breaker_max_cooldown', fallback=3600)
+        self.locked_cooldown = self.config.getint('SCHEDULER', 'locked_cooldown', fallback=120)
+        
+        # Multi-node coordination: applicants are leased to nodes through a shared store
+        self.cluster = None
+        self.cluster_heartbeat_interval = self.config.getint('CLUSTER', 'heartbeat_interval', fallback=30)
+        self.cluster_alert_ttl = self.config.getint('CLUSTER', 'alert_ttl', fallback=86400)
+        self.cluster_task = None
+        if self.config.getboolean('CLUSTER', 'enabled', fallback=False):
+            import socket
+            node_id = self.config.get('CLUSTER', 'node_id', fallback='') or f"{socket.gethostname()}-{os.getpid()}"
+            try:
+                self.cluster = LeaseStore(
+                    node_id,
+                    backend=self.config.get('CLUSTER', 'backend', fallback='sqlite'),
+                    path=self.config.get('CLUSTER', 'path', fallback='cluster/leases.db'),
+                    url=self.config.get('CLUSTER', 'redis_url', fallback='redis://localhost:6379/0'),
+                    ttl=self.config.getint('CLUSTER', 'lease_ttl', fallback=90),
+                )
+                logger.info(f"🕸️ Кластер: узел {node_id}, хранилище {self.cluster.backend_name}")
+            except Exception as e:
+                logger.error(f"❌ Хранилище кластера недоступно ({e}) - работа без координации")
+        
+        # Check coalescing: applicants with the same center, category and type share one check
+        self.coalescer = CheckCoalescer(
+            max_age=self.config.getint('COALESCE', 'max_age', fallback=0),
+            enabled=self.config.getboolean('COALESCE', 'enabled', fallback=True),
+        )
+        
+        # In-page availability watcher: DOM changes are pushed instead of polled
+        self.availability_watcher = self.config.getboolean('PAGE_WATCHER', 'enabled', fallback=True)
+        self.availability_settle_timeout = self.config.getfloat('PAGE_WATCHER', 'settle_timeout', fallback=3)
+        self.availability_date_timeout = self.config.getfloat('PAGE_WATCHER', 'date_timeout', fallback=100)
+        
+        # Availability read from the page's own API responses (Chrome performance log + CDP)
+        self.network_capture = self.config.getboolean('NETWORK_CAPTURE', 'enabled', fallback=False)
+        self.network_url_patterns = [pattern.strip() for pattern in self.config.get(
+            'NETWORK_CAPTURE', 'url_patterns', fallback=','.join(AVAILABILITY_URL_PATTERNS)).split(',') if pattern.strip()]
+        self.network_timeout = self.config.getfloat('NETWORK_CAPTURE', 'timeout', fallback=10)
+        
+        # Direct DevTools websocket for hot-path reads (Selenium keeps all actions)
+        self.cdp_enabled = self.config.getboolean('CDP', 'enabled', fallback=True)
+        self.cdp_timeout = self.config.getfloat('CDP', 'timeout', fallback=5)
+        self.cdp = None
+        self._cdp_key = None  # WebDriver session the CDP session belongs to
+        self._cdp_failed_for = None  # session for which connecting failed (not retried)
+        
+        # Watch matrix: [WATCHn] (url, center, category) targets, [VFS] url alone by default
+        self.watch = WatchMatrix(self._load_watch_targets())
+        self.watch_target = self.watch.default
+        self.selected_center = None  # full LocationId option text of the last center selection
+        for target in self.watch.targets.values():
+            logger.info(f"🎯 Цель {target['name']}: {target['url'] or self.url} | центр: "
+                        f"{target['center'] or 'первый в списке'} | категория: {target['category']}")
+        
+        # Startup orchestration metrics
+        self.startup_timings = {}  # step name -> seconds
+        self.time_to_first_check = None
+        self._startup_futures = {}
+        
+        # Document preflight: one dokuments index, JPG->PDF conversions cached by content hash
+        self.document_index = {}
+        # Relative paths are resolved against the script directory, like dokuments/ itself
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 self.config.get('DOCUMENTS', 'cache_dir', fallback=os.path.join('dokuments', '.cache')))
+        self.document_cache = DocumentCache(
+            cache_dir=os.path.join(cache_dir, f'shard{self.shard[0]}') if self.shard else cache_dir,
+            workers=self.config.getint('DOCUMENTS', 'workers', fallback=2),
+        )
+        
+        # Booking-stage documents: path -> ((size, mtime), sha256), (session, applicant, field) -> sha256
+        self._document_digests = {}
+        self._staged_uploads = {}
+        
         logger.info(f"📋 Параметры VFS: URL={self.url}")
         logger.info(f"⏱️  Интервал проверки: {self.interval} сек")
         logger.info(f"🔧 Авто-заполнение: {'ВКЛЮЧЕНО' if self.auto_fill else 'ОТКЛЮЧЕНО'}")
@@ -101,11 +506,26 @@ class VFSBot:
         logger.info(f"🔐 Автоматический вход: {'ВКЛЮЧЕН' if self.auto_login else 'ОТКЛЮЧЕН'}")
         logger.info(f"🤖 Обработка капчи: {'ВКЛЮЧЕНА' if self.captcha_enabled else 'ОТКЛЮЧЕНА'}")
         logger.info(f"🧠 Автоматическое решение капчи: {'ВКЛЮЧЕНО' if self.captcha_auto_solve else 'ОТКЛЮЧЕНО'}")
+        logger.info(f"🧾 Журнал событий: {self.event_log.path if self.event_log.enabled else 'ОТКЛЮЧЕН'}")
         
         # Load persons data (VFS + PERSON1, PERSON2, etc.)
         self.persons = []
         self._load_persons()
         self.current_person_index = 0
+        
+        if self.shard:
+            # Telegram belongs to the supervisor: this worker checks its shard of applicants
+            # and forwards every bot call over IPC
+            index, count, outbox, inbox = self.shard
+            self.persons = self.persons[index::count]
+            logger.info(f"🧩 Шард {index + 1}/{count}: {', '.join(p['name'] for p in self.persons) or 'нет заявителей'}")
+            self.shard_heartbeat_interval = self.config.getint('SHARDING', 'heartbeat_interval', fallback=10)
+            self.auto_login = True  # there is no /start in a worker
+            self.app = SimpleNamespace(bot=ShardBotProxy(index, outbox))
+            self._start_startup_orchestrator()
+            log_startup_profile()
+            asyncio.run(self._run_shard())
+            return
 
         logger.info(f"🔐 Telegram канал: {self.channel_id}")
         self.app = ApplicationBuilder().token(token).build()
@@ -123,6 +543,14 @@ class VFSBot:
         self.app.add_handler(CommandHandler("report", self.send_applicant_report))
         self.app.add_handler(CommandHandler("dilshodjon", self.send_dilshodjon_all_reports))
         self.app.add_handler(CommandHandler("sendreport", self.force_send_report))
+        self.app.add_handler(CommandHandler("events", self.events_command))
+        self.app.add_handler(CommandHandler("diag", self.diag_command))
+        self.app.add_handler(CommandHandler("watch", self.watch_command))
+        
+        # Admin replies to captcha photos (must come before the catch-all handler below)
+        self.app.add_handler(MessageHandler(
+                self.admin_handler.filter_admin() & filters.REPLY & filters.TEXT & ~filters.COMMAND,
+                self.captcha_reply))
         
         # Add message handler LAST (lowest priority - for blocking unauthorized users)
         self.app.add_handler(MessageHandler(
@@ -131,39 +559,134 @@ class VFSBot:
         
         logger.info("✅ Обработчики команд зарегистрированы")
         
-        self._check_and_log_remote_grid()
+        # Browser launch, grid probe and document preflight run in the background
+        # while run_polling() bootstraps Telegram
+        self._start_startup_orchestrator()
         
         # Set up post_init callback to start bot automatically
         self.app.post_init = self.post_init
         
+        log_startup_profile()
+        
         logger.info("="*60)
         logger.info("🟢 БОТ ГОТОВ К ЗАПУСКУ")
         logger.info("="*60)
         self.app.run_polling()
     
-    def _find_pdf_for_person(self, first_name, last_name):
+    def _find_pdf_for_person(self, first_name, last_name, listing=None, extension='pdf'):
         """Automatically find PDF file for person in dokuments folder"""
-        import glob
+        import fnmatch
         
         if not first_name or not last_name:
             return ''
         
         dokuments_path = os.path.join(os.path.dirname(__file__), 'dokuments')
-        if not os.path.exists(dokuments_path):
-            return ''
+        if listing is None:
+            if not os.path.exists(dokuments_path):
+                return ''
+            listing = sorted(os.listdir(dokuments_path))
         
         # Try exact match with last name (case-insensitive)
         last_name_lower = last_name.lower()
         first_name_lower = first_name.lower()
         
         # Look for files like foto_bobir.pdf or foto_bobir.jpg
-        for pattern in [f'foto_{first_name_lower}*.pdf', f'foto_{last_name_lower}*.pdf']:
-            files = glob.glob(os.path.join(dokuments_path, pattern))
+        for pattern in [f'foto_{first_name_lower}*.{extension}', f'foto_{last_name_lower}*.{extension}']:
+            files = fnmatch.filter(listing, pattern)
             if files:
-                return os.path.abspath(files[0])
+                return os.path.abspath(os.path.join(dokuments_path, files[0]))
         
         return ''
     
+    def _preflight_documents(self):
+        """Resolve and pre-convert photo PDFs for all applicants from a single index of the dokuments folder"""
+        dokuments_path = os.path.join(os.path.dirname(__file__), 'dokuments')
+        self.document_index = DocumentCache.scan(dokuments_path)
+        listing = sorted(self.document_index)
+        
+        for person in self.persons:
+            if person['photo_pdf_path']:
+                continue
+            # Prefer a ready PDF; fall back to a photo that will be converted below
+            auto_pdf = ''
+            for extension in ('pdf',) + tuple(ext.lstrip('.') for ext in DocumentCache.IMAGE_EXTENSIONS):
+                auto_pdf = self._find_pdf_for_person(person['first_name'], person['last_name'], listing, extension)
+                if auto_pdf:
+                    break
+            if auto_pdf:
+                person['photo_pdf_path'] = auto_pdf
+                logger.info(f"  🔍 Найден PDF для {person['name']}: {auto_pdf}")
+            else:
+                logger.info(f"  ⚠️ PDF не найден для {person['name']} ({person['first_name']} {person['last_name']})")
+        
+        # Convert image sources once, in a process pool; cached by content hash across restarts
+        images = [person['photo_pdf_path'] for person in self.persons
+                  if person['photo_pdf_path'].lower().endswith(DocumentCache.IMAGE_EXTENSIONS)]
+        ready = self.document_cache.prepare(images) if images else {}
+        for person in self.persons:
+            source = os.path.abspath(person['photo_pdf_path']) if person['photo_pdf_path'] else ''
+            if source in ready:
+                person['photo_pdf_path'] = ready[source]
+                logger.info(f"  📄 {person['name']}: PDF готов из {os.path.basename(source)}")
+        if self.persons and getattr(self, 'person_id', None):
+            # Keep the active applicant's attributes in sync with the resolved paths
+            current = next((person for person in self.persons if person['name'] == self.person_id), None)
+            if current:
+                self.photo_pdf_path = current['photo_pdf_path']
+        return len(ready)
+    
+    def _run_startup_step(self, name, step):
+        """Run one startup step, recording its duration; failures are logged, not raised"""
+        started = time.monotonic()
+        try:
+            return step()
+        except Exception as e:
+            logger.warning(f"⚠️ Шаг запуска '{name}' завершился с ошибкой: {e}")
+            return None
+        finally:
+            self.startup_timings[name] = time.monotonic() - started
+            logger.info(f"⏱️ Шаг запуска '{name}': {self.startup_timings[name]:.1f} сек")
+    
+    def _start_startup_orchestrator(self):
+        """Kick off browser launch, grid probe and document preflight concurrently"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        steps = {
+            'documents': self._preflight_documents,
+            'grid_probe': self._check_and_log_remote_grid,
+        }
+        if self.scheduler.enabled:
+            steps['slot_history'] = lambda: self.scheduler.learn_from_events(event_log_files(self.event_log.path))
+        if self.auto_login:
+            steps['browser'] = self._init_browser
+        
+        self._startup_executor = ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix='startup')
+        for name, step in steps.items():
+            self._startup_futures[name] = self._startup_executor.submit(self._run_startup_step, name, step)
+        self._startup_executor.shutdown(wait=False)
+        logger.info(f"🚀 Параллельный запуск: {', '.join(steps)}")
+    
+    async def _await_startup_step(self, name):
+        """Await a background startup step (returns None if it was never started)"""
+        future = self._startup_futures.get(name)
+        if future is None:
+            return None
+        return await asyncio.wrap_future(future)
+    
+    def _record_first_check(self):
+        """Record time-to-first-check once per process"""
+        if self.time_to_first_check is not None:
+            return
+        self.time_to_first_check = time.monotonic() - self._startup_started
+        timings = ', '.join(f"{name}={seconds:.1f}s" for name, seconds in self.startup_timings.items())
+        logger.info(f"🏁 Время до первой проверки: {self.time_to_first_check:.1f} сек ({timings})")
+        self.event_log.write({
+            'ts': round(time.time(), 3),
+            'kind': 'startup',
+            'time_to_first_check_s': round(self.time_to_first_check, 2),
+            'phases': {name: round(seconds * 1000, 1) for name, seconds in self.startup_timings.items()},
+        })
+    
     def _load_persons(self):
         """Load all persons (VFS + PERSON1, PERSON2, etc.)"""
         logger.debug("👥 Начало загрузки заявителей...")
@@ -186,16 +709,12 @@ class VFSBot:
             'photo_path': self.config.get('VFS', 'photo_path') if self.config.has_option('VFS', 'photo_path') else '',
             'photo_pdf_path': self.config.get('VFS', 'photo_pdf_path') if self.config.has_option('VFS', 'photo_pdf_path') else '',
             'confirm_appointment': self.config.getboolean('VFS', 'confirm_appointment', fallback=False),
+            'weight': self.config.getfloat('VFS', 'weight', fallback=1.0),
+            'deadline': self.config.get('VFS', 'deadline', fallback=''),
+            'watch': self.config.get('VFS', 'watch', fallback=''),
         }
         
-        # Auto-find PDF if not configured
-        if not vfs_person['photo_pdf_path']:
-            auto_pdf = self._find_pdf_for_person(vfs_person['first_name'], vfs_person['last_name'])
-            if auto_pdf:
-                vfs_person['photo_pdf_path'] = auto_pdf
-                logger.info(f"  🔍 Найден PDF для VFS: {auto_pdf}")
-            else:
-                logger.info(f"  ⚠️ PDF не найден для VFS ({vfs_person['first_name']} {vfs_person['last_name']})")
+        # Missing photo PDFs are resolved later by _preflight_documents (one folder scan for all)
         
         if vfs_person['first_name']:  # Only add if has data
             self.persons.append(vfs_person)
@@ -222,28 +741,57 @@ class VFSBot:
                 'confirm_appointment': self.config.getboolean(section, 'confirm_appointment', fallback=True),
                 'photo_path': self.config.get(section, 'photo_path') if self.config.has_option(section, 'photo_path') else '',
                 'photo_pdf_path': self.config.get(section, 'photo_pdf_path') if self.config.has_option(section, 'photo_pdf_path') else '',
+                'weight': self.config.getfloat(section, 'weight', fallback=1.0),
+                'deadline': self.config.get(section, 'deadline', fallback=''),
+                'watch': self.config.get(section, 'watch', fallback=''),
             }
             
-            # Auto-find PDF if not configured
-            if not person_data['photo_pdf_path']:
-                auto_pdf = self._find_pdf_for_person(person_data['first_name'], person_data['last_name'])
-                if auto_pdf:
-                    person_data['photo_pdf_path'] = auto_pdf
-                    logger.info(f"  🔍 Найден PDF для {section}: {auto_pdf}")
-                else:
-                    logger.info(f"  ⚠️ PDF не найден для {section} ({person_data['first_name']} {person_data['last_name']})")
-            
             if person_data['first_name']:  # Only add if has data
                 self.persons.append(person_data)
                 logger.debug(f"  ✅ {section} загружен: {person_data['first_name']} {person_data['last_name']}")
             person_index += 1
         
+        # Form values are compiled once here; fill_form only ships the plan to the page
+        for person in self.persons:
+            person['fill_plan'] = compile_fill_plan(self._person_fill_values(person))
+        
         logger.info(f"👥 Всего загружено заявителей: {len(self.persons)}")
         for i, person in enumerate(self.persons):
-            logger.info(f"   [{i}] {person['name']} - {person['first_name']} {person['last_name']} (Migris: {person['migris_code']})")
+            logger.info(f"   [{i}] {person['name']} - {person['first_name']} {person['last_name']} (Migris: {person['migris_code']}, вес: {self._applicant_weight(person):.2f})")
+        if self.coalescer.enabled:
+            for group in CheckCoalescer.groups(self.persons, self._availability_key).values():
+                if len(group) > 1:
+                    logger.info(f"🔗 Общая проверка доступности: {', '.join(person['name'] for person in group)}")
+    
+    def _load_watch_targets(self):
+        """Watch targets from [WATCH1], [WATCH2], ... sections (an empty url means [VFS] url)"""
+        targets = []
+        index = 1
+        while self.config.has_section(f'WATCH{index}'):
+            section = f'WATCH{index}'
+            targets.append({
+                'name': section,
+                'url': self.config.get(section, 'url', fallback=''),
+                'center': self.config.get(section, 'center', fallback=''),
+                'category': self.config.get(section, 'category', fallback=''),
+                'no_seats_text': self.config.get(section, 'no_seats_text', fallback=''),
+            })
+            index += 1
+        return targets
+    
+    def _no_seats_text(self):
+        """"No seats" page text of the current target and selected center"""
+        return self.watch.no_seats_text(self.watch_target, self.selected_center)
+    
+    def _target_url(self, target):
+        return target['url'] or self.config.get('VFS', 'url')
     
     def _set_current_person(self, person_data):
         """Set the current person's data as instance variables"""
+        self._invalidate_category_state('applicant switch')
+        self.person_id = person_data['name']
+        self.watch_target = self.watch.get(person_data.get('watch'))
+        self.url = self._target_url(self.watch_target)
         self.first_name = person_data['first_name']
         self.last_name = person_data['last_name']
         self.contact_phone = person_data['contact_phone']
@@ -263,28 +811,244 @@ class VFSBot:
         self.nationality = person_data.get('nationality', person_data.get('country', 'UZBEKISTAN'))
         self.address = person_data.get('address', '')
         self.purpose_of_travel = person_data.get('purpose', 'Temporary Residence')
+        self.fill_plan = person_data.get('fill_plan') or compile_fill_plan(self._person_fill_values(person_data))
+    
+    @staticmethod
+    def _person_fill_values(person):
+        """Form field name -> configured value for one applicant"""
+        return {
+            'firstName': person.get('first_name'),
+            'lastName': person.get('last_name'),
+            'phoneNumber': person.get('contact_phone'),
+            'email': person.get('contact_email'),
+            'dateOfBirth': person.get('date_of_birth'),
+            'passportNumber': person.get('passport_number'),
+            'country': person.get('country'),
+            'passportValidityDate': person.get('passport_validity_date'),
+            'appointmentCategory': person.get('appointment_category'),
+            'nationality': person.get('nationality', person.get('country', 'UZBEKISTAN')),
+            'address': person.get('address', ''),
+            'purpose': person.get('purpose', 'Temporary Residence'),
+        }
+    
+    def _applicant_weight(self, person):
+        """Effective scheduling weight: configured weight scaled by deadline urgency"""
+        # An explicit deadline wins; otherwise an expiring passport makes the applicant urgent
+        deadline = parse_date(person.get('deadline')) or parse_date(person.get('passport_validity_date'))
+        return person.get('weight', 1.0) * urgency_multiplier(deadline, self.urgency_horizon_days, self.urgency_boost)
+    
+    def _breaker(self, name=None):
+        """Circuit breaker of an applicant (the current one by default)"""
+        name = name or getattr(self, 'person_id', None)
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name, self.breaker_failure_threshold,
+                                                 self.breaker_cooldown, self.breaker_max_cooldown)
+        return self.breakers[name]
+    
+    def _cluster_key(self, person):
+        """Applicant identity shared by all nodes (PERSONn numbering may differ between configs)"""
+        return f"{person['first_name']} {person['last_name']}".strip().upper()
+    
+    def _leased(self, person):
+        return self.cluster is None or self._cluster_key(person) in self.cluster.held
+    
+    def _refresh_leases(self):
+        """Heartbeat this node and rebalance applicant leases (blocking store I/O)"""
+        before = set(self.cluster.held)
+        held = self.cluster.rebalance([self._cluster_key(person) for person in self.persons])
+        if held != before:
+            logger.info(f"🕸️ Аренда заявителей ({len(self.cluster.live_nodes())} узл.): "
+                        f"{', '.join(sorted(held)) or 'нет'}")
+        return held
+    
+    async def cluster_heartbeat_task(self):
+        """Keep this node's heartbeat and applicant leases fresh"""
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self._refresh_leases)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка обновления аренды кластера: {e}")
+            await asyncio.sleep(self.cluster_heartbeat_interval)
+    
+    def _leave_cluster(self):
+        """Hand this node's leases back immediately instead of letting them expire"""
+        if self.cluster is None:
+            return
+        if self.cluster_task is not None:
+            self.cluster_task.cancel()
+            self.cluster_task = None
+        try:
+            self.cluster.release_all()
+            logger.info("🕸️ Аренда заявителей освобождена")
+        except Exception as e:
+            logger.debug(f"⚠️ Не удалось освободить аренду: {e}")
+    
+    def _availability_key(self, person):
+        """Applicants with the same key see exactly the same availability"""
+        target = self.watch.get(person.get('watch'))
+        return CheckCoalescer.key(self._target_url(target), f"{target['center']}/{target['category']}/{person.get('appointment_category')}",
+                                  person.get('appointment_type'))
+    
+    def _share_check_result(self, trace, delay):
+        """Fan the current applicant's check result out to its group; True if group members must book"""
+        person = self.persons[self.current_person_index]
+        key = self._availability_key(person)
+        slot_date = trace.record.get('slot_date')
+        # The checker sleeps `delay` before anyone else is scheduled, so coverage has to
+        # outlast that sleep by one interval to keep the other members from re-checking
+        if self.coalescer.record(key, trace.outcome, slot_date=slot_date, checked_by=self.person_id,
+                                 ttl=delay + self.interval) is None:
+            return False
+        members = [other for other in self.persons
+                   if other is not person and self._leased(other) and self._availability_key(other) == key]
+        for other in members:
+            record = {'ts': round(time.time(), 3), 'kind': 'coalesced', 'applicant': other['name'],
+                      'outcome': trace.outcome, 'checked_by': self.person_id}
+            if slot_date:
+                record['slot_date'] = slot_date
+            self.event_log.write(record)
+        if members:
+            logger.debug(f"🔗 Результат проверки ({trace.outcome}) распространен на: {', '.join(other['name'] for other in members)}")
+        return trace.outcome == 'slot_found' and bool(members)
+    
+    def _claim_slot_alert(self, slot_date):
+        """False when another node already reported this slot for the current applicant"""
+        if self.cluster is None:
+            return True
+        key = f"alert:{self._cluster_key({'first_name': self.first_name, 'last_name': self.last_name})}:{slot_date}"
+        try:
+            if self.cluster.claim_once(key, self.cluster_alert_ttl):
+                return True
+        except Exception as e:
+            logger.warning(f"⚠️ Хранилище кластера недоступно, уведомление отправляется без дедупликации: {e}")
+            return True
+        logger.info(f"🕸️ Слот {slot_date} уже обработан другим узлом - уведомление пропущено")
+        return False
+    
+    async def _wait_for_available_applicant(self):
+        """If every applicant's circuit is open, sleep until the first one becomes half-open"""
+        # Without leased applicants this node stays idle until a lease frees up
+        while self.cluster is not None and self.started and not any(self._leased(person) for person in self.persons):
+            logger.info(f"🕸️ Нет арендованных заявителей, ожидание {self.cluster_heartbeat_interval} сек")
+            await asyncio.sleep(self.cluster_heartbeat_interval)
+        # Applicants whose group was just checked by another member wait for the group's next check
+        while self.coalescer.enabled and self.started:
+            schedulable = [person for person in self.persons
+                           if self._leased(person) and self._breaker(person['name']).allow()]
+            keys = {self._availability_key(person) for person in schedulable}
+            if not keys or not all(self.coalescer.covered(key) for key in keys):
+                break
+            wait = max(1.0, min(self.coalescer.remaining(key) for key in keys))
+            logger.info(f"🔗 Доступность всех групп заявителей проверена, следующая проверка через {wait:.0f} сек")
+            await asyncio.sleep(wait)
+        if not self.persons or any(self._breaker(person['name']).allow() for person in self.persons if self._leased(person)):
+            return
+        wait = min(self._breaker(person['name']).remaining() for person in self.persons if self._leased(person))
+        logger.warning(f"⛔ Все заявители временно отключены, ожидание {wait:.0f} сек")
+        await asyncio.sleep(wait)
     
     def _get_next_person(self):
-        """Get the next person and rotate to the next one"""
+        """Get the next person by weighted round-robin over applicant weights"""
         if not self.persons:
             return None
         
-        # Check if we're completing a full cycle (back to index 0)
-        completing_cycle = self.current_person_index == 0 and hasattr(self, '_cycle_started')
-        
-        current = self.persons[self.current_person_index]
-        self.current_person_index = (self.current_person_index + 1) % len(self.persons)
-        
-        # Mark cycle as started after first iteration
-        self._cycle_started = True
+        # Applicants with an open circuit get no turns until their cooldown ends,
+        # applicants leased to other cluster nodes are theirs to check, and applicants
+        # whose availability group was just found empty are covered by that check
+        weights = {person['name']: self._applicant_weight(person)
+                   if self._breaker(person['name']).allow() and self._leased(person)
+                   and not self.coalescer.covered(self._availability_key(person)) else 0
+                   for person in self.persons}
+        chosen = self.person_queue.pick(weights)
+        if chosen is None:
+            return None
+        current = next(person for person in self.persons if person['name'] == chosen)
+        self.current_person_index = self.persons.index(current)
         
-        # If completing full cycle, schedule cycle completion report
-        if completing_cycle:
+        # A cycle is complete once every schedulable applicant has had a turn
+        if self._cycle_served and self._cycle_served >= {name for name, weight in weights.items() if weight > 0}:
+            self._cycle_served = set()
             # Use asyncio to schedule the report without blocking
             asyncio.create_task(self._send_cycle_completion_report())
+        self._cycle_served.add(chosen)
         
         return current
     
+    def _begin_trace(self, kind, **fields):
+        """Start a structured event record for the current applicant"""
+        self._trace = self.event_log.trace(kind, getattr(self, 'person_id', None), **fields)
+        return self._trace
+    
+    def _trace_phase(self, name):
+        """Time a phase of the running check/login (no-op outside a trace)"""
+        if self._trace is None or self._trace.finished:
+            return nullcontext()
+        return self._trace.phase(name)
+    
+    def _trace_lap(self, name):
+        """Close a sequential phase of the running trace (time since the previous lap)"""
+        if self._trace is not None and not self._trace.finished:
+            self._trace.lap(name)
+    
+    def _trace_set(self, **fields):
+        """Attach fields (outcome, selector, page_state, slot_date...) to the running trace"""
+        if self._trace is not None and not self._trace.finished:
+            self._trace.set(**fields)
+    
+    def _scheduler_key(self):
+        """Scheduler key of the current applicant and center"""
+        return PollScheduler.key(getattr(self, 'person_id', None), self.url)
+    
+    def _schedule_next(self, outcome=None, page_state=None, default=None):
+        """Register a check result with the scheduler and return the delay before the next check"""
+        if not self.scheduler.enabled:
+            return self.interval if default is None else default
+        self.scheduler.base_interval = self.interval
+        delay = self.scheduler.record(self._scheduler_key(), self.url, outcome, page_state)
+        if abs(delay - self.interval) >= 1:
+            logger.info(f"🗓️ Следующая проверка через {delay:.0f} сек (результат: {outcome or 'ok'}, страница: {page_state or '-'})")
+        return delay
+    
+    async def _wait_for_schedule(self):
+        """Sleep until the current applicant is due according to the scheduler"""
+        delay = self.scheduler.delay(self._scheduler_key())
+        if delay >= 1:
+            logger.info(f"🗓️ Ожидание {delay:.0f} сек по расписанию перед проверкой {self.person_id}")
+            await asyncio.sleep(delay)
+    
+    def _detect_page_state(self, page_source=None):
+        """Classify the current page from a single page_source read"""
+        try:
+            if page_source is None:
+                page_source = self.browser.page_source
+        except Exception:
+            return 'unreachable'
+        if "Sorry, looks like you were going too fast." in page_source:
+            return 'throttled'
+        if "Server Error in '/Global-Appointment' Application." in page_source or "Sorry, Something has gone" in page_source:
+            return 'server_error'
+        if "Cloudflare" in page_source:
+            return 'cloudflare'
+        if "Session expired." in page_source:
+            return 'session_expired'
+        if "You are now in line." in page_source:
+            return 'queue'
+        lowered = page_source.lower()
+        if "offline" in lowered:
+            return 'offline'
+        if "no open seats available" in lowered:
+            return 'no_seats'
+        if 'type="password"' in lowered or "emailid" in lowered:
+            return 'login'
+        return 'ok'
+    
+    def _auto_context(self):
+        """Callback context of automatic runs: a shard worker sends through its bot proxy"""
+        if self.shard:
+            return SimpleNamespace(bot=self.app.bot, args=[])
+        return None
+    
     async def _auto_start_browser(self, application):
         """Background task to automatically initialize browser and start login"""
         max_attempts = 3
@@ -294,23 +1058,32 @@ class VFSBot:
             attempt += 1
             try:
                 logger.info(f"⏳ Автоматический запуск браузера (попытка {attempt}/{max_attempts})...")
-                await asyncio.sleep(3)  # Increased delay for stability
                 
-                logger.info("🔧 Инициализация браузера в фоне...")
-                
-                # Force cleanup before initialization
-                self._force_cleanup_browser()
-                await asyncio.sleep(1)
+                if attempt == 1 and 'browser' in self._startup_futures:
+                    # Browser was already launched concurrently with Telegram bootstrap
+                    logger.info("🔧 Ожидание браузера, запущенного параллельно с Telegram...")
+                    result = await self._await_startup_step('browser')
+                else:
+                    await asyncio.sleep(3)  # Increased delay for stability
+                    
+                    logger.info("🔧 Инициализация браузера в фоне...")
+                    
+                    # Force cleanup before initialization
+                    self._force_cleanup_browser()
+                    await asyncio.sleep(1)
+                    
+                    loop = asyncio.get_event_loop()
+                    result = await loop.run_in_executor(None, self._init_browser)
                 
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(None, self._init_browser)
+                # Applicant photo paths must be resolved before the first login
+                await self._await_startup_step('documents')
                 
                 if result and self.browser:
                     logger.info("✅ Браузер инициализирован успешно")
                     logger.info("🔄 Запуск автоматической проверки доступности встреч...")
                     
                     # Start login helper in background
-                    self.auto_task = asyncio.create_task(self.login_helper(None, None))
+                    self.auto_task = asyncio.create_task(self.login_helper(None, self._auto_context()))
                     logger.info("✅ Автоматическая задача запущена")
                     return
                 else:
@@ -334,6 +1107,8 @@ class VFSBot:
         logger.info("="*60)
         logger.info("🚀 БОТ ЗАПУЩЕН И ИНИЦИАЛИЗИРОВАН")
         logger.info("="*60)
+        self.startup_timings['telegram'] = time.monotonic() - self._startup_started
+        logger.info(f"⏱️ Шаг запуска 'telegram': {self.startup_timings['telegram']:.1f} сек")
         logger.info("🔄 Режим многозаявителей активирован")
         logger.info(f"👥 Всего заявителей: {len(self.persons)}")
         logger.info(f"⏱️  Интервал проверки: {self.interval} сек")
@@ -342,6 +1117,11 @@ class VFSBot:
         self.started = True
         logger.debug("✅ Флаг started установлен в True")
         
+        # OCR stack is imported lazily; warm it in the background so the first
+        # auto-solved captcha does not pay the cv2/numpy import on the login path
+        if self.captcha_enabled and self.captcha_auto_solve:
+            asyncio.get_event_loop().run_in_executor(None, load_ocr_stack)
+        
         if self.auto_login:
             logger.info("🔄 Автоматический вход ВКЛЮЧЕН - запуск инициализации браузера в фоне...")
             try:
@@ -356,12 +1136,82 @@ class VFSBot:
         logger.info("📊 Запуск задачи отправки отчетов каждые 20 минут...")
         self.report_task = asyncio.create_task(self.report_status_task(application))
         logger.info("✅ Задача отправки отчетов запущена!")
+        
+        if self.cluster is not None:
+            # Leases are taken before the first check so nodes never start on the same applicant;
+            # an unreachable store must not stop the bot, the heartbeat task keeps retrying
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self._refresh_leases)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка обновления аренды кластера: {e}")
+            self.cluster_task = asyncio.create_task(self.cluster_heartbeat_task())
+    
+    async def _run_shard(self):
+        """Shard worker main loop: run the checks, serve supervisor messages, send heartbeats"""
+        index, count, outbox, inbox = self.shard
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        
+        def read_inbox():
+            while True:
+                message = inbox.get()
+                loop.call_soon_threadsafe(self._handle_supervisor_message, message, stop)
+                if message.get('type') == 'stop':
+                    return
+        
+        threading.Thread(target=read_inbox, name=f'shard{index}-inbox', daemon=True).start()
+        await self.post_init(self.app)
+        
+        # A blocked event loop stops the heartbeats and makes the supervisor restart this worker
+        while not stop.is_set():
+            outbox.put({'type': 'heartbeat', 'shard': index, 'pid': os.getpid(), 'stats': self._shard_stats()})
+            try:
+                await asyncio.wait_for(stop.wait(), self.shard_heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
+        
+        logger.info(f"🛑 Шард {index + 1}/{count} останавливается по команде супервизора")
+        self.started = False
+        for task in (getattr(self, 'auto_task', None), self.report_task, self.thr):
+            if task is not None:
+                task.cancel()
+        if self.browser is not None:
+            self._quit_driver(self.browser)
+            self.browser = None
+        self._discard_standby()
+        self._leave_cluster()
+    
+    def _handle_supervisor_message(self, message, stop):
+        """Apply one supervisor -> worker message (runs on the worker's event loop)"""
+        kind = message.get('type')
+        if kind == 'result':
+            self.app.bot.deliver(message['id'], message['value'])
+        elif kind == 'captcha_reply':
+            self.captcha_broker.resolve(message['message_id'], message['answer'])
+        elif kind == 'stop':
+            stop.set()
     
+    def _shard_stats(self):
+        """Picklable progress snapshot reported to the supervisor with every heartbeat"""
+        return {
+            'applicants': [f"{p['first_name']} {p['last_name']}" for p in self.persons],
+            'check_count': self.check_count,
+            'person_stats': {person_id: count for person_id, count in self.person_stats.items()},
+            'browser': self.browser is not None,
+            'current': getattr(self, 'person_id', None),
+            'time_to_first_check': self.time_to_first_check,
+            'open_breakers': [name for name, breaker in self.breakers.items() if not breaker.allow()],
+            'rss_mb': process_rss_mb(),
+        }
+
     async def login(self, update: Update, context: CallbackContext):
         person_name = f"{self.first_name} {self.last_name}"
         logger.info("="*60)
         logger.info(f"🔐 ВХОД В СИСТЕМУ ДЛЯ: {person_name}")
         logger.info("="*60)
+        await self._wait_for_schedule()
+        trace = self._begin_trace('login', url=self.url)
+        self._invalidate_category_state('login')
         
         try:
             # Check if browser is alive
@@ -409,6 +1259,7 @@ class VFSBot:
             # Wait for page to render - JavaScript needs time to build DOM
             logger.debug("⏳ Ожидание рендеринга страницы (5 сек)...")
             await asyncio.sleep(5)
+            trace.lap('navigate')
             
             logger.info("🍪 Проверка и закрытие cookie consent диалога...")
             cookie_closed = False
@@ -422,7 +1273,7 @@ class VFSBot:
                     '//div[@role="dialog"]//button[contains(., "Отклонить")]',
                 ]
                 
-                for xpath in cookie_xpaths:
+                for _, xpath in self._mirror_candidates([(By.XPATH, xpath) for xpath in cookie_xpaths]):
                     try:
                         element = self.browser.find_element(by=By.XPATH, value=xpath)
                         if element and element.is_displayed():
@@ -453,6 +1304,7 @@ class VFSBot:
                         
             except Exception as e:
                 logger.warning(f"⚠️ Ошибка при обработке cookie диалога: {e}")
+            trace.lap('cookies')
             
             # await asyncio.sleep(500) # For debugging purposes
             if "You are now in line." in self.browser.page_source:
@@ -501,6 +1353,12 @@ class VFSBot:
                 except Exception as e:
                     logger.debug(f"⚠️ Не удалось создать скриншот: {e}")
             
+            trace.lap('page_ready')
+            
+            # Capture and solve the captcha in the background while credentials are typed
+            captcha_prefetch = asyncio.create_task(self._prefetch_captcha()) if self.captcha_enabled else None
+            self._captcha_prefetch = captcha_prefetch
+            
             logger.info("⏳ Проверка наличия полей входа (макс 15 сек)...")
             max_wait = 15
             wait_interval = 1.0
@@ -528,7 +1386,8 @@ class VFSBot:
             
             while elapsed < max_wait:
                 try:
-                    for selector_type, selector_value in email_field_selectors:
+                    self.dom_mirror.invalidate()  # the form may have rendered since the last poll
+                    for selector_type, selector_value in self._mirror_candidates(email_field_selectors):
                         try:
                             email_field = self.browser.find_element(selector_type, selector_value)
                             if email_field and email_field.is_displayed():
@@ -658,7 +1517,7 @@ class VFSBot:
             ]
             
             password_entered = False
-            for selector_type, selector_value in password_selectors:
+            for selector_type, selector_value in self._mirror_candidates(password_selectors):
                 try:
                     password_field = self.browser.find_element(selector_type, selector_value)
                     if password_field and password_field.is_displayed() and password_field.is_enabled():
@@ -674,6 +1533,7 @@ class VFSBot:
             if not password_entered:
                 logger.error("❌ Не удалось найти поле пароля")
                 raise WebError("Password field not found")
+            trace.lap('credentials')
         
             # Enhanced captcha processing with configuration check
             logger.info(f"📸 Поиск и обработка капчи... (Включена: {self.captcha_enabled})")
@@ -682,83 +1542,17 @@ class VFSBot:
             if not self.captcha_enabled:
                 logger.info("⚠️ Обработка капчи отключена в конфигурации")
             else:
-                # Multiple selectors for captcha image
-                captcha_selectors = [
-                (By.ID, 'CaptchaImage'),
-                (By.CLASS_NAME, 'captcha-image'),
-                (By.CSS_SELECTOR, 'img[src*="captcha"]'),
-                (By.XPATH, '//img[contains(@src, "captcha") or contains(@id, "captcha")]')
-            ]
-            
-            for selector_type, selector_value in captcha_selectors:
-                try:
-                    captcha_img = self.browser.find_element(selector_type, selector_value)
-                    if captcha_img and captcha_img.is_displayed():
-                        logger.info(f"✅ Капча найдена: {selector_type}={selector_value}")
-                        
-                        self.captcha_filename = f'captcha_{int(datetime.now().timestamp())}.png'
-                        with open(self.captcha_filename, 'wb') as file:
-                            file.write(captcha_img.screenshot_as_png)
-                        logger.debug(f"✅ Капча сохранена: {self.captcha_filename}")
-
-                        if self.captcha_auto_solve:
-                            logger.info("🧠 Автоматическое распознавание капчи (OCR)...")
-                            try:
-                                captcha = break_captcha(self.captcha_filename)
-                                if captcha and len(captcha.strip()) > 0:
-                                    logger.info(f"✅ Капча автоматически распознана: '{captcha}'")
-                                
-                                # Try multiple selectors for captcha input
-                                captcha_input_selectors = [
-                                    (By.NAME, 'CaptchaInputText'),
-                                    (By.ID, 'CaptchaInputText'),
-                                    (By.CLASS_NAME, 'captcha-input'),
-                                    (By.CSS_SELECTOR, 'input[name*="captcha"], input[id*="captcha"]')
-                                ]
-                                
-                                for input_type, input_value in captcha_input_selectors:
-                                    try:
-                                        captcha_field = self.browser.find_element(input_type, input_value)
-                                        captcha_field.clear()
-                                        captcha_field.send_keys(captcha)
-                                        logger.info(f"✅ Капча введена в поле: {input_type}={input_value}")
-                                        captcha_processed = True
-                                        break
-                                    except:
-                                        continue
-                                        
-                                # Clean up captcha file immediately after processing attempt
-                                if captcha_processed:
-                                    try:
-                                        os.remove(self.captcha_filename)
-                                        logger.debug(f"🗑️ Капча файл очищен: {self.captcha_filename}")
-                                    except:
-                                        pass
-                                    break
-                                else:
-                                    logger.warning("⚠️ OCR вернул пустую строку")
-                                    await self._send_captcha_for_manual_input(captcha_img)
-                            except Exception as ocr_e:
-                                logger.warning(f"⚠️ Ошибка OCR: {ocr_e}")
-                                await self._send_captcha_for_manual_input(captcha_img)
-                        else:
-                            logger.info("📱 Ручной ввод капчи включен")
-                            await self._send_captcha_for_manual_input(captcha_img)
-                except:
-                    continue
+                # The answer has usually been ready since credential entry
+                captcha_img, captcha = await captcha_prefetch
+                if captcha_img and captcha:
+                    captcha_processed = self._enter_captcha(captcha)
                 
                 if not captcha_processed:
                     logger.warning("⚠️ Капча не найдена или не обработана")
-                    # Clean up unsuccessful captcha file
-                    if hasattr(self, 'captcha_filename') and os.path.exists(self.captcha_filename):
-                        try:
-                            os.remove(self.captcha_filename)
-                            logger.debug(f"🗑️ Неудачная капча очищена: {self.captcha_filename}")
-                        except:
-                            pass
                 else:
                     logger.info("✅ Капча успешно обработана и введена!")
             
+            trace.lap('captcha')
             await asyncio.sleep(1)
             logger.info("🔘 Поиск и нажатие кнопки отправки...")
             
@@ -809,43 +1603,32 @@ class VFSBot:
             submit_clicked = False
             attempted_methods = []
             
-            # First, try to find and click buttons
-            for i, (selector_type, selector_value) in enumerate(submit_selectors):
+            # First, try to find and click buttons (all selectors checked per poll, highest priority wins)
+            submit_btn, locator = await self._wait_for_any(submit_selectors, timeout=5, clickable=True)
+            if submit_btn:
+                selector_type, selector_value = locator
+                logger.info(f"🎯 Найдена кнопка отправки (селектор {submit_selectors.index(locator)+1}): {selector_type}={selector_value}")
+                trace.set(selector=f"{selector_type}={selector_value}")
+                
+                # Learned click method first; form-level submits as extra fallbacks
+                submit_methods = {
+                    'javascript_submit': lambda: self.browser.execute_script("arguments[0].submit();", submit_btn),
+                    'form_submit': lambda: self.browser.execute_script("if(arguments[0].form) arguments[0].form.submit();", submit_btn),
+                    'focus_and_enter': lambda: (submit_btn.click(), submit_btn.send_keys(Keys.ENTER)),
+                }
                 try:
-                    submit_btn = self.browser.find_element(selector_type, selector_value)
-                    if submit_btn and submit_btn.is_displayed() and submit_btn.is_enabled():
-                        logger.info(f"🎯 Найдена кнопка отправки (селектор {i+1}): {selector_type}={selector_value}")
-                        
-                        # Enhanced click methods with more comprehensive coverage
-                        click_methods = [
-                            ("regular_click", lambda: submit_btn.click()),
-                            ("javascript_click", lambda: self.browser.execute_script("arguments[0].click();", submit_btn)),
-                            ("action_chains_click", lambda: ActionChains(self.browser).move_to_element(submit_btn).click().perform()),
-                            ("javascript_submit", lambda: self.browser.execute_script("arguments[0].submit();", submit_btn)),
-                            ("form_submit", lambda: self.browser.execute_script("if(arguments[0].form) arguments[0].form.submit();", submit_btn)),
-                            ("focus_and_enter", lambda: (submit_btn.click(), submit_btn.send_keys(Keys.ENTER))),
-                        ]
-                        
-                        for method_name, click_method in click_methods:
-                            try:
-                                click_method()
-                                logger.info(f"✅ Кнопка отправки успешно нажата (метод {method_name})")
-                                submit_clicked = True
-                                attempted_methods.append(f"{method_name} (success)")
-                                break
-                            except Exception as e:
-                                attempted_methods.append(f"{method_name} (failed: {str(e)[:50]})")
-                                logger.debug(f"🔍 Метод {method_name} не удался: {e}")
-                                continue
-                        
-                        if submit_clicked:
-                            break
-                    else:
-                        logger.debug(f"🔍 Кнопка найдена но не доступна: displayed={submit_btn.is_displayed()}, enabled={submit_btn.is_enabled()}")
-                        
-                except Exception as e:
-                    logger.debug(f"🔍 Селектор {i+1} не удался: {selector_type}={selector_value}, ошибка: {e}")
-                    continue
+                    method_name = await self._click_with_strategies(submit_btn, 'submit', page='login', extra_methods=submit_methods)
+                except StaleElementReferenceException as e:
+                    method_name = None
+                    logger.debug(f"🔍 Кнопка отправки устарела: {e}")
+                if method_name:
+                    logger.info(f"✅ Кнопка отправки успешно нажата (метод {method_name})")
+                    submit_clicked = True
+                    attempted_methods.append(f"{method_name} (success)")
+                else:
+                    attempted_methods.append("все методы клика по кнопке (failed)")
+            else:
+                logger.debug("🔍 Ни один селектор кнопки отправки не дал доступного элемента")
             
             # If no button worked, try alternative methods
             if not submit_clicked:
@@ -897,12 +1680,15 @@ class VFSBot:
                 except:
                     pass
             
+            trace.lap('submit')
             # Wait for page response after login
             logger.info("⏳ Ожидание ответа после входа...")
             await asyncio.sleep(3)
             
             # Check for various response messages
-            page_content = self.browser.page_source.lower()
+            page_source = self.browser.page_source
+            page_content = page_source.lower()
+            trace.lap('response').set(page_state=self._detect_page_state(page_source))
             success_indicators = [
                 "reschedule appointment",
                 "book appointment", 
@@ -1062,45 +1848,82 @@ class VFSBot:
                         disabled_msg = f"ℹ️ АВТО-ЗАПОЛНЕНИЕ ОТКЛЮЧЕНО\n\n👤 Заявитель: {person_name}\n⚙️ Причина: Отключено в config.ini\n📝 Включите auto_fill = true для активации"
                         await context.bot.send_message(chat_id=self.channel_id, text=disabled_msg)
                     
+                trace.lap('post_login')
+                trace.finish(outcome='success')
                 logger.info(f"🔄 Начало непрерывной проверки встреч для {person_name}...")
+                turn_checks = 0
                 while True:
+                    check_trace = self._begin_trace('check', url=self.url)
+                    self.scheduler.note_request()
                     try:
                         await self.check_appointment(update, context)
+                        check_trace.finish()
+                        self._record_first_check()
+                        if check_trace.outcome != 'relogin':
+                            self._breaker().record_success()
                         # Update check count after successful check
                         self.check_count += 1
                         person_stats_key = f"{self.first_name} {self.last_name}"
                         self.person_stats[person_stats_key] = self.person_stats.get(person_stats_key, 0) + 1
-                    except WebError:
+                        turn_checks += 1
+                    except CircuitOpen as co:
+                        check_trace.finish(outcome='circuit_open', error=co)
+                        if update and update.message:
+                            await update.message.reply_text(f"⛔ {person_name} временно отключен, переход к следующему заявителю")
+                        return
+                    except WebError as we:
+                        check_trace.finish(outcome='error', error=we)
+                        self._schedule_next('error', check_trace.record.get('page_state'))
                         msg = f"❌ Ошибка веб-сайта для {person_name}.\nПопытка снова..."
                         logger.error(msg)
                         if update and update.message:
                             await update.message.reply_text(msg)
                         raise WebError
-                    except Offline:
+                    except Offline as oe:
+                        check_trace.finish(outcome='offline', error=oe)
                         msg = f"⚠️ Оффлайн режим для {person_name}.\nПопытка снова..."
                         logger.warning(msg)
                         if update and update.message:
                             await update.message.reply_text(msg)
+                        await asyncio.sleep(self._schedule_next('offline', check_trace.record.get('page_state'), default=0))
                         continue
                     except Exception as e:
+                        check_trace.finish(outcome='error', error=e)
+                        self._schedule_next('error', check_trace.record.get('page_state'))
                         msg = f"❌ Ошибка для {person_name}: {str(e)}\nПопытка снова..."
                         logger.error(msg, exc_info=True)
                         if update and update.message:
                             await update.message.reply_text(msg)
                         raise WebError
-                    await asyncio.sleep(self.interval)
+                    delay = self._schedule_next(check_trace.outcome, check_trace.record.get('page_state'))
+                    self.watch.record(self.watch_target['name'], check_trace.outcome,
+                                      check_trace.record.get('slot_date'), check_trace.record.get('page_state'),
+                                      dates=check_trace.record.get('slot_dates'))
+                    if self._share_check_result(check_trace, delay):
+                        logger.info(f"🔗 {person_name}: слот доступен всей группе, передаю очередь для бронирования остальными заявителями")
+                        return
+                    await asyncio.sleep(delay)
+                    if self.checks_per_turn and turn_checks >= self.checks_per_turn and len(self.persons) > 1:
+                        logger.info(f"🔁 {person_name}: выполнено {turn_checks} проверок за ход, передаю очередь следующему заявителю")
+                        return
+                    if not self._leased(self.persons[self.current_person_index]):
+                        logger.info(f"🕸️ {person_name}: аренда передана другому узлу, переключение")
+                        return
                     
             elif "account has been locked" in page_content or "locked" in page_content:
-                msg = f"🔒 Аккаунт {person_name} заблокирован. Ожидание 2 минуты..."
+                breaker = self._breaker()
+                breaker.trip('locked', cooldown=self.locked_cooldown)
+                msg = f"🔒 Аккаунт {person_name} заблокирован. Пропуск заявителя на {breaker.remaining():.0f} сек, остальные продолжают проверку..."
                 logger.warning(msg)
+                trace.finish(outcome='locked')
                 if update and update.message:
                     await update.message.reply_text(msg)
-                await asyncio.sleep(120)
                 return
                 
             elif "verification words are incorrect" in page_content or "captcha" in page_content or ("incorrect" in page_content and "verification" in page_content):
                 msg = f"⚠️ Неверная капча для {person_name}. Повторная попытка..."
                 logger.warning(msg)
+                trace.finish(outcome='captcha_incorrect')
                 # Clean up captcha file
                 if hasattr(self, 'captcha_filename') and os.path.exists(self.captcha_filename):
                     try:
@@ -1112,15 +1935,17 @@ class VFSBot:
                 return
                 
             elif "rate limited" in page_content or "too many" in page_content:
-                msg = f"⏱️ Ограничение частоты для {person_name}. Ожидание 5 минут..."
+                msg = f"⏱️ Ограничение частоты для {person_name}. Увеличиваю паузу перед следующей попыткой..."
                 logger.warning(msg)
+                trace.finish(outcome='rate_limited')
                 if update and update.message:
                     await update.message.reply_text(msg)
-                await asyncio.sleep(300)
+                await asyncio.sleep(self._schedule_next('rate_limited', 'throttled', default=300))
                 return
             elif "queue" in page_content or "waiting" in page_content:
                 msg = f"📋 {person_name} в очереди ожидания..."
                 logger.info(msg)
+                trace.finish(outcome='queue')
                 if update and update.message:
                     await update.message.reply_text(msg)
                 # Continue with appointment checking even if in queue
@@ -1142,6 +1967,9 @@ class VFSBot:
                 
                 msg = f"❌ Ошибка входа для {person_name}: {detected_error}"
                 logger.error(msg)
+                trace.finish(outcome='failed', error=detected_error)
+                if self._breaker().record_failure(detected_error):
+                    logger.error(f"⛔ {person_name}: слишком много неудачных входов, заявитель отключен на {self._breaker().remaining():.0f} сек")
                 
                 # Save debug info for analysis
                 try:
@@ -1167,18 +1995,19 @@ class VFSBot:
                     await update.message.reply_text(msg)
                 raise WebError
         except TimeoutException as te:
+            trace.finish(outcome='error', error=te)
+            self._cancel_captcha_prefetch()
             error_msg = f"Timeout при поиске элементов: {str(te)}"
             logger.error(f"⏱️ {error_msg}")
             
             # Enhanced timeout handling with recovery attempts
             try:
                 # First, try to get more info about the page state
-                current_url = self.browser.current_url
-                page_title = self.browser.title
-                logger.info(f"🔍 Состояние при timeout: {page_title} ({current_url})")
+                page = self._hot_read()
+                logger.info(f"🔍 Состояние при timeout: {page['title']} ({page['url']})")
                 
                 # Check if page is still loading
-                page_state = self.browser.execute_script("return document.readyState")
+                page_state = page['ready_state']
                 logger.info(f"🔍 Состояние загрузки страницы: {page_state}")
                 
                 # If page is still loading, wait a bit more
@@ -1212,6 +2041,8 @@ class VFSBot:
                 raise WebError(f"TimeoutException: {error_msg}")
             
         except (NoSuchElementException, WebDriverException) as se:
+            trace.finish(outcome='error', error=se)
+            self._cancel_captcha_prefetch()
             error_msg = f"Selenium ошибка: {str(se)}"
             logger.error(f"🔍 {error_msg}")
             
@@ -1240,6 +2071,8 @@ class VFSBot:
                 raise WebError(f"Selenium error: {error_msg}")
             
         except Exception as e:
+            trace.finish(outcome='error', error=e)
+            self._cancel_captcha_prefetch()
             logger.error(f"❌ ИСКЛЮЧЕНИЕ при входе для {person_name}: {str(e)}", exc_info=True)
             
             # Enhanced exception handling
@@ -1297,8 +2130,11 @@ class VFSBot:
                 status_msg = f"📝 Умное заполнение формы для {current_full_name}...\n🧠 Анализируем структуру страницы..."
                 await context.bot.send_message(chat_id=self.channel_id, text=status_msg)
             
-            # Use smart field detection
-            found_fields = await self._smart_find_form_fields()
+            # Apply the precompiled plan in a single script call
+            started = time.monotonic()
+            results = self._apply_fill_plan(self.fill_plan)
+            elapsed_ms = (time.monotonic() - started) * 1000
+            found_fields = [r for r in results if r['status'] != 'not_found']
             
             if not found_fields:
                 logger.warning("⚠️ Не найдено ни одного поля формы - используем legacy метод")
@@ -1310,99 +2146,25 @@ class VFSBot:
                     await context.bot.send_message(chat_id=self.channel_id, text=fallback_msg)
                 return
             
-            # Send field detection results to Telegram
-            if context and hasattr(context, 'bot'):
-                field_names = list(found_fields.keys())
-                detection_msg = f"🎯 Найдено {len(field_names)} полей: {', '.join(field_names[:5])}{'...' if len(field_names) > 5 else ''}"
-                await context.bot.send_message(chat_id=self.channel_id, text=detection_msg)
-            
-            # Mapping from field names to configuration values
-            field_data_mapping = {
-                'firstName': self.first_name,
-                'lastName': self.last_name,
-                'phoneNumber': self.contact_phone,
-                'email': self.contact_email,
-                'dateOfBirth': self.date_of_birth,
-                'passportNumber': self.passport_number,
-                'country': self.country,
-                'passportValidityDate': self.passport_validity_date,
-                'appointmentCategory': self.appointment_category,
-                'nationality': self.nationality,
-                'address': self.address,
-                'purpose': self.purpose_of_travel
-            }
-            
-            # Fill found fields with data
-            for field_name, field_info in found_fields.items():
-                field_value = field_data_mapping.get(field_name)
-                if not field_value:
-                    continue
-                    
-                try:
-                    element = field_info['element']
-                    field_type = field_info['type']
-                    
-                    if field_type in ['input', 'text', 'email', 'tel', 'date'] or element.tag_name == 'input':
-                        # Fill text input fields
-                        element.clear()
-                        element.send_keys(field_value)
-                        logger.info(f"✅ Заполнено поле '{field_name}': {field_value}")
-                        filled_count += 1
-                        
-                        # Send progress update to Telegram
-                        if context and hasattr(context, 'bot') and filled_count <= 5:  # Only first few updates
-                            progress_msg = f"✅ Заполнено: {field_name} = {field_value}"
-                            await context.bot.send_message(chat_id=self.channel_id, text=progress_msg)
-                    
-                    elif field_type == 'select' or element.tag_name == 'select':
-                        # Use the already found select element
-                        select_obj = Select(element)
-                        
-                        # Try to select by visible text (exact match first)
-                        selected = False
-                        try:
-                            select_obj.select_by_visible_text(field_value)
-                            logger.info(f"✅ Выбрано в dropdown '{field_name}': {field_value}")
-                            filled_count += 1
-                            selected = True
-                            
-                            # Send progress update to Telegram
-                            if context and hasattr(context, 'bot') and filled_count <= 5:
-                                progress_msg = f"✅ Выбрано: {field_name} = {field_value}"
-                                await context.bot.send_message(chat_id=self.channel_id, text=progress_msg)
-                                
-                        except Exception:
-                            # Try partial matching for complex options
-                            try:
-                                options = select_obj.options
-                                for option in options:
-                                    if field_value.lower() in option.text.lower() or option.text.lower() in field_value.lower():
-                                        select_obj.select_by_visible_text(option.text)
-                                        logger.info(f"✅ Выбрано (частичное совпадение) '{field_name}': {option.text}")
-                                        filled_count += 1
-                                        selected = True
-                                        
-                                        # Send progress update
-                                        if context and hasattr(context, 'bot') and filled_count <= 5:
-                                            progress_msg = f"✅ Выбрано: {field_name} = {option.text}"
-                                            await context.bot.send_message(chat_id=self.channel_id, text=progress_msg)
-                                        break
-                            except Exception as e:
-                                logger.warning(f"⚠️ Не удалось выбрать в dropdown '{field_name}': {e}")
-                        
-                        if not selected:
-                            logger.warning(f"⚠️ Значение '{field_value}' не найдено в dropdown '{field_name}'")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Ошибка заполнения поля '{field_name}': {e}")
-                    continue
+            for result in results:
+                if result['status'] == 'filled':
+                    filled_count += 1
+                    logger.info(f"✅ Заполнено поле '{result['field']}' ({result['selector']}): {result['value']}")
+                elif result['status'] == 'no_option':
+                    logger.warning(f"⚠️ Значение не найдено в dropdown '{result['field']}'")
+                elif result['status'] == 'mismatch':
+                    logger.warning(f"⚠️ Поле '{result['field']}' не приняло значение (сейчас: {result.get('value')})")
+            missing = [r['field'] for r in results if r['status'] == 'not_found']
+            if missing:
+                logger.warning(f"⚠️ Не найдены поля: {', '.join(missing)}")
             
             # Final summary
-            total_possible_fields = len(field_data_mapping)
-            logger.info(f"📊 Финальная статистика заполнения: {filled_count}/{total_possible_fields} полей")
+            logger.info(f"📊 Финальная статистика заполнения: {filled_count}/{len(self.fill_plan)} полей за {elapsed_ms:.0f} мс")
             
             if context and hasattr(context, 'bot'):
-                summary_msg = f"📊 Заполнение завершено: {filled_count} из {len(found_fields)} найденных полей"
+                filled_names = [r['field'] for r in results if r['status'] == 'filled']
+                summary_msg = (f"📊 Заполнение завершено: {filled_count} из {len(found_fields)} найденных полей"
+                               f"{': ' + ', '.join(filled_names) if filled_names else ''}")
                 await context.bot.send_message(chat_id=self.channel_id, text=summary_msg)
                 
         except Exception as fill_error:
@@ -1527,6 +2289,12 @@ class VFSBot:
             if update and update.message:
                 await update.message.reply_text(f"❌ Ошибка авто-заполнения: {e}")
 
+    def _apply_fill_plan(self, plan):
+        """Fill every field of `plan` with one execute_script; returns per-field status and read-back value"""
+        if not plan:
+            return []
+        return self.browser.execute_script(FILL_PLAN_SCRIPT, plan) or []
+
     async def _fill_form_legacy(self, update: Update, context):
         """Legacy form filling method as fallback"""
         try:
@@ -1592,37 +2360,34 @@ class VFSBot:
         options.add_argument('--window-size=1920,1080')
         options.add_argument('--start-maximized')
         
+        if self.network_capture:
+            # Network events go to the performance log, read by _read_network_availability
+            options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        
         logger.debug("🔧 Chrome options configured for maximum compatibility")
         return options
 
     def _check_and_log_remote_grid(self):
         """Check Selenium Grid connection and log configuration"""
+        if not self.grid:
+            logger.info("🌐 SELENIUM GRID: ОТКЛЮЧЕН")
+            return
+        logger.info("🌐 SELENIUM GRID КОНФИГУРАЦИЯ:")
+        logger.info(f"   ✅ Статус: ВКЛЮЧЕН")
+        logger.info(f"   📍 Hub URL: {self.grid.hub_url}")
+        logger.info(f"   🌐 Браузер: {self.grid.browser_name}")
         try:
-            remote_enabled = self.config.getboolean('REMOTE_GRID', 'enabled', fallback=False)
-            
-            if remote_enabled:
-                hub_url = self.config.get('REMOTE_GRID', 'hub_url')
-                logger.info("🌐 SELENIUM GRID КОНФИГУРАЦИЯ:")
-                logger.info(f"   ✅ Статус: ВКЛЮЧЕН")
-                logger.info(f"   📍 Hub URL: {hub_url}")
-                logger.info(f"   🌐 Браузер: {self.config.get('REMOTE_GRID', 'browser_name')}")
-                
-                import urllib.request
-                import json
-                try:
-                    response = urllib.request.urlopen(f"{hub_url}/status", timeout=3)
-                    data = json.loads(response.read().decode('utf-8'))
-                    if data.get('status') == 0:
-                        logger.info(f"   ✅ Selenium Grid доступен и готов к использованию")
-                    else:
-                        logger.warning(f"   ⚠️ Selenium Grid не полностью инициализирован")
-                except Exception as e:
-                    logger.warning(f"   ⚠️ Не удалось подключиться к Selenium Grid: {e}")
-                    logger.warning(f"   💡 Убедитесь, что Grid запущен на {hub_url}")
-            else:
-                logger.info("🌐 SELENIUM GRID: ОТКЛЮЧЕН")
+            status = self.grid.status()
+            nodes = self.grid.nodes(status)
+            state = "готов к использованию" if status.get('ready') else "не полностью инициализирован"
+            logger.info(f"   {'✅' if status.get('ready') else '⚠️'} Selenium Grid {state}: "
+                        f"узлов {len(nodes)}, свободных слотов {self.grid.capacity(nodes)}")
+            for node in nodes:
+                logger.info(f"   🖥️ {node['uri'] or node['id']}: {node['busy']}/{node['max_sessions']} занято"
+                            f"{'' if node['up'] else ' (DOWN)'}")
         except Exception as e:
-            logger.warning(f"⚠️ Ошибка при проверке конфигурации Grid: {e}")
+            logger.warning(f"   ⚠️ Не удалось подключиться к Selenium Grid: {e}")
+            logger.warning(f"   💡 Убедитесь, что Grid запущен на {self.grid.hub_url}")
 
     def _get_chrome_version(self):
         """Get installed Chrome version"""
@@ -1660,7 +2425,6 @@ class VFSBot:
         """Initialize or reinitialize Chrome browser with Chrome for Testing"""
         import os
         import shutil
-        from pathlib import Path
         
         # Enhanced browser cleanup before initialization
         try:
@@ -1675,20 +2439,26 @@ class VFSBot:
         except:
             pass
         
-        # Force cleanup of any remaining Chrome processes
-        try:
-            import subprocess
-            subprocess.run(['taskkill', '/f', '/im', 'chrome.exe'], 
-                         capture_output=True, check=False, timeout=5)
-            subprocess.run(['taskkill', '/f', '/im', 'chromedriver.exe'], 
-                         capture_output=True, check=False, timeout=5)
-            logger.debug("🧹 Принудительная очистка процессов Chrome")
-        except Exception as e:
-            logger.debug(f"⚠️ Ошибка очистки процессов: {e}")
+        if self._promote_standby():
+            return True
+        if self.grid:
+            return self._init_remote_browser()
+        
+        if self._local_process_cleanup_allowed():
+            # Force cleanup of any remaining Chrome processes
+            try:
+                import subprocess
+                subprocess.run(['taskkill', '/f', '/im', 'chrome.exe'], 
+                             capture_output=True, check=False, timeout=5)
+                subprocess.run(['taskkill', '/f', '/im', 'chromedriver.exe'], 
+                             capture_output=True, check=False, timeout=5)
+                logger.debug("🧹 Принудительная очистка процессов Chrome")
+            except Exception as e:
+                logger.debug(f"⚠️ Ошибка очистки процессов: {e}")
         
         logger.info("🔧 Инициализация Chrome браузера (undetected-chromedriver)...")
         
-        # Clean cache directories
+        # Clean cache directories (the running standby browser still uses them)
         cache_dirs = [
             os.path.expanduser('~/.wdm'),
             os.path.expanduser('~/appdata/roaming/undetected_chromedriver'),
@@ -1696,7 +2466,7 @@ class VFSBot:
         ]
         
         for cache_dir in cache_dirs:
-            if os.path.exists(cache_dir):
+            if os.path.exists(cache_dir) and self._local_process_cleanup_allowed():
                 try:
                     shutil.rmtree(cache_dir)
                     logger.debug(f"🧹 Очищена кэш папка: {cache_dir}")
@@ -1706,39 +2476,24 @@ class VFSBot:
         try:
             # Clean up any existing chromedriver processes
             import subprocess
-            try:
-                subprocess.run(['taskkill', '/f', '/im', 'chromedriver.exe'], 
-                             capture_output=True, check=False)
-                logger.debug("🧹 Очищены старые процессы chromedriver")
-            except:
-                pass
+            if self._local_process_cleanup_allowed():
+                try:
+                    subprocess.run(['taskkill', '/f', '/im', 'chromedriver.exe'], 
+                                 capture_output=True, check=False)
+                    logger.debug("🧹 Очищены старые процессы chromedriver")
+                except:
+                    pass
             
             # Clean up undetected_chromedriver cache to prevent file conflicts
             uc_cache_dir = os.path.expanduser('~/appdata/roaming/undetected_chromedriver')
-            if os.path.exists(uc_cache_dir):
+            if os.path.exists(uc_cache_dir) and self._local_process_cleanup_allowed():
                 try:
                     shutil.rmtree(uc_cache_dir)
                     logger.debug("🧹 Очищен кэш undetected_chromedriver")
                 except Exception as e:
                     logger.debug(f"⚠️ Не удалось очистить кэш: {e}")
             
-            chrome_binary = None
-            
-            chrome_paths = [
-                Path('C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe'),
-                Path('C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe'),
-                Path(os.path.expanduser('~\\AppData\\Local\\Google\\Chrome\\Application\\chrome.exe')),
-                Path('chrome-for-testing') / 'chrome-win64' / 'chrome.exe'
-            ]
-            
-            for path in chrome_paths:
-                if path.exists():
-                    chrome_binary = str(path)
-                    logger.info(f"✅ Chrome найден: {chrome_binary}")
-                    break
-            
-            if not chrome_binary:
-                logger.warning("⚠️  Chrome не найден в стандартных местах, попытаюсь использовать автоопределение...")
+            chrome_binary = self._find_chrome_binary()
             
             logger.info("🔧 Использование встроенного ChromeDriver undetected-chromedriver...")
             
@@ -1760,57 +2515,8 @@ class VFSBot:
                     # Create completely fresh ChromeOptions for each attempt
                     fresh_options = self._get_chrome_options()
                     
-                    # Enhanced initialization with offline mode support
-                    try:
-                        # First try with auto-download (online mode)
-                        logger.debug("🌐 Попытка онлайн инициализации с автозагрузкой ChromeDriver...")
-                        self.browser = uc.Chrome(
-                            options=fresh_options,
-                            suppress_welcome=True,
-                            use_subprocess=True,
-                            enable_bidi=False,
-                            version_main=None,  # Auto-detect version
-                            driver_executable_path=None,  # Auto-download if needed
-                            browser_executable_path=chrome_binary if chrome_binary else None
-                        )
-                    except Exception as online_error:
-                        logger.warning(f"⚠️ Онлайн инициализация не удалась: {online_error}")
-                        
-                        # Try with local ChromeDriver if auto-download fails
-                        local_driver_paths = [
-                            'chromedriver.exe',
-                            'chrome-for-testing/chromedriver-win64/chromedriver.exe',
-                            os.path.join(os.path.expanduser('~'), '.wdm', 'drivers', 'chromedriver'),
-                            'C:\\Program Files\\Google\\Chrome\\Application\\chromedriver.exe'
-                        ]
-                        
-                        local_driver = None
-                        for driver_path in local_driver_paths:
-                            if os.path.exists(driver_path):
-                                local_driver = driver_path
-                                logger.info(f"✅ Найден локальный ChromeDriver: {local_driver}")
-                                break
-                        
-                        if local_driver:
-                            logger.debug("💿 Попытка офлайн инициализации с локальным ChromeDriver...")
-                            self.browser = uc.Chrome(
-                                options=fresh_options,
-                                suppress_welcome=True,
-                                use_subprocess=True,
-                                enable_bidi=False,
-                                driver_executable_path=local_driver,
-                                browser_executable_path=chrome_binary if chrome_binary else None
-                            )
-                        else:
-                            logger.error("❌ Не найден локальный ChromeDriver, попытаемся без указания пути...")
-                            # Last resort - let undetected_chromedriver handle it completely
-                            self.browser = uc.Chrome(
-                                options=fresh_options,
-                                suppress_welcome=True,
-                                use_subprocess=True,
-                                enable_bidi=False,
-                                browser_executable_path=chrome_binary if chrome_binary else None
-                            )
+                    with self._driver_launch_lock:
+                        self.browser = self._create_local_driver(fresh_options, chrome_binary)
                     
                     # Verify browser initialization
                     try:
@@ -1866,6 +2572,8 @@ class VFSBot:
                     time.sleep(7)  # Increased wait time for cleanup
             
             logger.info("✅ Chrome браузер инициализирован успешно")
+            self._attach_browser_listeners()
+            self._start_standby_worker()
             return True
             
         except Exception as e:
@@ -1875,6 +2583,244 @@ class VFSBot:
             self.browser = None
             return False
 
+    def _find_chrome_binary(self):
+        """Locate an installed Chrome (or Chrome for Testing); None lets undetected_chromedriver decide"""
+        from pathlib import Path
+        
+        chrome_paths = [
+            Path('C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe'),
+            Path('C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe'),
+            Path(os.path.expanduser('~\\AppData\\Local\\Google\\Chrome\\Application\\chrome.exe')),
+            Path('chrome-for-testing') / 'chrome-win64' / 'chrome.exe'
+        ]
+        
+        for path in chrome_paths:
+            if path.exists():
+                logger.info(f"✅ Chrome найден: {path}")
+                return str(path)
+        
+        logger.warning("⚠️  Chrome не найден в стандартных местах, попытаюсь использовать автоопределение...")
+        return None
+    
+    def _create_local_driver(self, fresh_options, chrome_binary):
+        """Start a local undetected Chrome, falling back to a local ChromeDriver when offline"""
+        # Enhanced initialization with offline mode support
+        try:
+            # First try with auto-download (online mode)
+            logger.debug("🌐 Попытка онлайн инициализации с автозагрузкой ChromeDriver...")
+            return uc.Chrome(
+                options=fresh_options,
+                suppress_welcome=True,
+                use_subprocess=True,
+                enable_bidi=False,
+                version_main=None,  # Auto-detect version
+                driver_executable_path=None,  # Auto-download if needed
+                browser_executable_path=chrome_binary if chrome_binary else None
+            )
+        except Exception as online_error:
+            logger.warning(f"⚠️ Онлайн инициализация не удалась: {online_error}")
+            
+            # Try with local ChromeDriver if auto-download fails
+            local_driver_paths = [
+                'chromedriver.exe',
+                'chrome-for-testing/chromedriver-win64/chromedriver.exe',
+                os.path.join(os.path.expanduser('~'), '.wdm', 'drivers', 'chromedriver'),
+                'C:\\Program Files\\Google\\Chrome\\Application\\chromedriver.exe'
+            ]
+            
+            local_driver = None
+            for driver_path in local_driver_paths:
+                if os.path.exists(driver_path):
+                    local_driver = driver_path
+                    logger.info(f"✅ Найден локальный ChromeDriver: {local_driver}")
+                    break
+            
+            if local_driver:
+                logger.debug("💿 Попытка офлайн инициализации с локальным ChromeDriver...")
+                return uc.Chrome(
+                    options=fresh_options,
+                    suppress_welcome=True,
+                    use_subprocess=True,
+                    enable_bidi=False,
+                    driver_executable_path=local_driver,
+                    browser_executable_path=chrome_binary if chrome_binary else None
+                )
+            else:
+                logger.error("❌ Не найден локальный ChromeDriver, попытаемся без указания пути...")
+                # Last resort - let undetected_chromedriver handle it completely
+                return uc.Chrome(
+                    options=fresh_options,
+                    suppress_welcome=True,
+                    use_subprocess=True,
+                    enable_bidi=False,
+                    browser_executable_path=chrome_binary if chrome_binary else None
+                )
+    
+    def _attach_browser_listeners(self):
+        """Wrap the fresh driver so navigation resets category state and page changes invalidate the DOM mirror"""
+        # Navigation tracking is needed with or without lxml; only the mirror depends on it
+        mirror = self.dom_mirror if self.dom_mirror.available else None
+        self.browser = EventFiringWebDriver(self.browser, DomMirrorListener(
+            mirror, on_navigate=lambda: self._invalidate_category_state('navigation')))
+        self.dom_mirror.invalidate()
+    
+    def _create_remote_driver(self):
+        """Open a session on the Selenium Grid node with the most idle slots"""
+        from selenium import webdriver
+        
+        nodes = self.grid.nodes()
+        if self.grid_node and not any(node['id'] == self.grid_node and node['up'] for node in nodes):
+            logger.warning(f"🖥️ Узел Grid {self.grid_node} потерян - сессия будет создана на другом узле")
+            self.grid.mark_lost(self.grid_node)
+        node = self.grid.pick_node(nodes)
+        if node is None:
+            raise WebDriverException(f"No free {self.grid.browser_name} slots on {self.grid.hub_url}")
+        
+        options = self._get_chrome_options()
+        for key, value in self.grid.placement_capabilities(node).items():
+            options.set_capability(key, value)
+        logger.info(f"🌐 Создание сессии на узле Grid {node['uri'] or node['id']} (свободно {node['free']}/{node['max_sessions']})")
+        try:
+            driver = webdriver.Remote(command_executor=self.grid.hub_url, options=options)
+        except Exception:
+            # The next attempt picks another node
+            self.grid.mark_lost(node['id'])
+            raise
+        # The hub may still route elsewhere when the node has no distinguishing capabilities
+        return driver, self.grid.node_of_session(driver.session_id) or node['id']
+    
+    def _init_remote_browser(self):
+        """Initialize the browser as a Selenium Grid session (no local Chrome processes are touched)"""
+        max_attempts = 3
+        for attempt in range(max_attempts):
+            try:
+                self.browser, self.grid_node = self._create_remote_driver()
+                self.browser.get("about:blank")
+                logger.info(f"✅ Удаленный браузер инициализирован на узле {self.grid_node} (попытка {attempt + 1})")
+                self._attach_browser_listeners()
+                self._start_standby_worker()
+                return True
+            except Exception as e:
+                logger.warning(f"⚠️ Попытка {attempt + 1} создать сессию Grid не удалась: {str(e)[:200]}")
+                if self.browser:
+                    try:
+                        self.browser.quit()
+                    except Exception:
+                        pass
+                    self.browser = None
+                    if self.grid_node:
+                        self.grid.mark_lost(self.grid_node)
+                        self.grid_node = None
+                time.sleep(2 * (attempt + 1))
+        logger.error(f"❌ Не удалось создать сессию на Selenium Grid {self.grid.hub_url}")
+        return False
+    
+    def _local_process_cleanup_allowed(self):
+        """Process-wide Chrome kills are only safe without a Grid session, standby browser or sibling shards"""
+        return not self.grid and not self.standby_enabled and not self.shard
+    
+    @staticmethod
+    def _driver_alive(driver):
+        """Cheap health check of a driver that is not the active one"""
+        try:
+            return bool(driver.window_handles) and driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+    
+    @staticmethod
+    def _quit_driver(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    
+    def _new_driver(self):
+        """Launch a driver on the configured backend; returns (driver, grid node id)"""
+        if self.grid:
+            driver, node = self._create_remote_driver()
+        else:
+            with self._driver_launch_lock:
+                driver, node = self._create_local_driver(self._get_chrome_options(), self._find_chrome_binary()), None
+        try:
+            driver.get("about:blank")
+        except Exception:
+            self._quit_driver(driver)
+            raise
+        return driver, node
+    
+    def _start_standby_worker(self):
+        """Start the background thread that keeps a spare browser ready"""
+        if not self.standby_enabled or self._standby_thread is not None:
+            self._standby_wake.set()
+            return
+        self._standby_thread = threading.Thread(target=self._standby_worker, name='browser-standby', daemon=True)
+        self._standby_thread.start()
+    
+    def _standby_worker(self):
+        """Keep exactly one health-checked spare driver while the bot runs"""
+        while True:
+            with self._standby_lock:
+                spare = self._standby
+            if spare and not self._driver_alive(spare[0]):
+                with self._standby_lock:
+                    # The check ran outside the lock: a promoted spare is the active browser now
+                    owned = self._standby is spare
+                    if owned:
+                        self._standby = None
+                if owned:
+                    logger.warning("🩺 Резервный браузер не отвечает - замена")
+                    self._quit_driver(spare[0])
+                spare = None
+            # The spare is only launched next to a running active browser, never in parallel with its start
+            if spare is None and self.started and self.browser is not None:
+                try:
+                    started = time.monotonic()
+                    spare = self._new_driver()
+                    with self._standby_lock:
+                        if self._standby is None and self.started:
+                            self._standby, spare = spare, None
+                    if spare:
+                        self._quit_driver(spare[0])
+                    else:
+                        logger.info(f"🔋 Резервный браузер готов ({time.monotonic() - started:.1f} сек)")
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось запустить резервный браузер: {str(e)[:200]}")
+            self._standby_wake.wait(self.standby_health_interval)
+            self._standby_wake.clear()
+    
+    def _promote_standby(self):
+        """Swap the spare in for the active browser; False when no healthy spare is ready"""
+        if not self.standby_enabled:
+            return False
+        with self._standby_lock:
+            spare, self._standby = self._standby, None
+        if spare is None:
+            return False
+        driver, node = spare
+        if not self._driver_alive(driver):
+            logger.warning("⚠️ Резервный браузер неисправен - обычный запуск")
+            self._quit_driver(driver)
+            self._standby_wake.set()
+            return False
+        previous = self.browser
+        self.browser = driver
+        self.grid_node = node
+        self._attach_browser_listeners()
+        self._invalidate_category_state('standby promoted')
+        if previous is not None:
+            self._quit_driver(previous)
+        logger.info(f"♻️ Резервный браузер активирован{f' (узел {node})' if node else ''}, новый резерв запускается в фоне")
+        self.event_log.write({'ts': round(time.time(), 3), 'kind': 'standby', 'event': 'promoted', 'node': node})
+        self._standby_wake.set()
+        return True
+    
+    def _discard_standby(self):
+        """Close the spare browser (on shutdown)"""
+        with self._standby_lock:
+            spare, self._standby = self._standby, None
+        if spare:
+            self._quit_driver(spare[0])
+    
     def _check_browser_health(self):
         """Check if browser is alive and responsive with enhanced error handling"""
         try:
@@ -2003,81 +2949,63 @@ class VFSBot:
         except Exception as e:
             logger.warning(f"⚠️ Ошибка при очистке временных файлов: {e}")
 
-    async def _analyze_page_structure(self):
-        """Analyze current page structure for debugging"""
+    def _collect_page_diagnostics(self, reason):
+        """Gather the page structure report in one script call and store it in the event log"""
+        if not self.browser:
+            return None
         try:
-            logger.info("🔍 Анализ структуры страницы...")
-            
-            # Wait for page stability
-            await asyncio.sleep(2)
-            
-            # Get current URL for context
-            current_url = self.browser.current_url
-            logger.info(f"📍 Текущий URL: {current_url}")
-            
-            # Check page loading state
-            ready_state = self.browser.execute_script("return document.readyState")
-            logger.info(f"📄 Состояние загрузки страницы: {ready_state}")
-            
-            if ready_state != "complete":
-                logger.warning("⏳ Страница еще загружается, ждем...")
-                await asyncio.sleep(5)
-            
-            # Find all selects on the page
-            all_selects = self.browser.find_elements(by=By.TAG_NAME, value='select')
-            logger.info(f"📊 Найдено {len(all_selects)} dropdown элементов на странице")
-            
-            if len(all_selects) == 0:
-                logger.warning("⚠️ Dropdown элементы не найдены - проверяем другие типы")
-                
-                # Check for other form elements
-                all_inputs = self.browser.find_elements(by=By.TAG_NAME, value='input')
-                all_buttons = self.browser.find_elements(by=By.TAG_NAME, value='button')
-                all_forms = self.browser.find_elements(by=By.TAG_NAME, value='form')
-                
-                logger.info(f"📊 Альтернативные элементы: {len(all_inputs)} inputs, {len(all_buttons)} buttons, {len(all_forms)} forms")
-                
-                # Check if page contains login indicators
-                page_source_lower = self.browser.page_source.lower()
-                login_indicators = ['email', 'password', 'login', 'signin', 'username']
-                found_login_indicators = [indicator for indicator in login_indicators if indicator in page_source_lower]
-                
-                if found_login_indicators:
-                    logger.warning(f"⚠️ Обнаружены индикаторы страницы входа: {found_login_indicators}")
-                    return False
-            
-            for i, select_elem in enumerate(all_selects):
-                try:
-                    # Get select attributes
-                    name_attr = select_elem.get_attribute('name') or 'No name'
-                    id_attr = select_elem.get_attribute('id') or 'No id'
-                    class_attr = select_elem.get_attribute('class') or 'No class'
-                    
-                    # Get options
-                    select_obj = Select(select_elem)
-                    options = [opt.text.strip() for opt in select_obj.options if opt.text.strip()]
-                    
-                    logger.info(f"📋 Dropdown {i+1}: name='{name_attr}', id='{id_attr}', class='{class_attr}'")
-                    logger.info(f"   └── Опции: {options}")
-                    
-                    # Check if this might be Latvia category
-                    has_latvia = any('Latvia' in opt for opt in options)
-                    if has_latvia:
-                        logger.info(f"🎯 ⭐ НАЙДЕН ПОТЕНЦИАЛЬНЫЙ Latvia dropdown #{i+1}!")
-                        
-                except Exception as e:
-                    logger.debug(f"Ошибка анализа dropdown {i+1}: {e}")
-                    
-            # Also check for any elements containing "Latvia" text
-            latvia_elements = self.browser.find_elements(by=By.XPATH, value="//*[contains(text(), 'Latvia')]")
-            logger.info(f"🔍 Найдено {len(latvia_elements)} элементов с текстом 'Latvia'")
-            
-            return len(all_selects) > 0  # Return True if we found dropdowns
-            
+            report = self.browser.execute_script(PAGE_DIAGNOSTICS_SCRIPT)
         except Exception as e:
-            logger.error(f"❌ Ошибка анализа страницы: {e}")
-            return False
+            logger.debug(f"⚠️ Не удалось собрать диагностику страницы: {e}")
+            return None
+        self.event_log.write({
+            'ts': round(time.time(), 3),
+            'kind': 'diagnostics',
+            'applicant': getattr(self, 'person_id', None),
+            'reason': reason,
+            **report,
+        })
+        counts = report.get('counts', {})
+        latvia_selects = sum(1 for select in report.get('selects', []) if select.get('latvia'))
+        logger.info(f"🔍 Диагностика страницы ({reason}): {report.get('ready_state')}, "
+                    f"select={counts.get('select', 0)} (Latvia: {latvia_selects}), input={counts.get('input', 0)}, "
+                    f"button={counts.get('button', 0)}, form={counts.get('form', 0)}")
+        return report
+    
+    def _maybe_collect_diagnostics(self, reason, failed=False):
+        """Collect page diagnostics on failure or for a sampled fraction of normal passes"""
+        if failed and self.diagnostics_on_failure:
+            return self._collect_page_diagnostics(reason)
+        if self.diagnostics_sample_rate > 0 and random.random() < self.diagnostics_sample_rate:
+            return self._collect_page_diagnostics(reason)
+        return None
 
+    def _invalidate_category_state(self, reason=''):
+        """Forget the remembered category selection (navigation, login/logout, page change)"""
+        if getattr(self, '_category_state', None) is not None:
+            logger.debug(f"🔄 Состояние категории Latvia сброшено ({reason})")
+        self._category_state = None
+    
+    def _read_category_selection(self):
+        """One script call: is Latvia selected? Remembers the select and page while it stays selected"""
+        state = self._category_state
+        session = getattr(self.browser, 'session_id', None)
+        if state and (state['session'] != session or state['person'] != getattr(self, 'person_id', None)):
+            self._invalidate_category_state('session changed')
+            state = None
+        try:
+            result = self.browser.execute_script(CATEGORY_STATE_SCRIPT, [state['id'], state['name']] if state else None)
+        except Exception as e:
+            logger.debug(f"⚠️ Не удалось прочитать выбранную категорию: {e}")
+            return False
+        if result and result.get('text'):
+            self._category_state = {'session': session, 'person': getattr(self, 'person_id', None),
+                                    'href': result['href'], 'id': result['id'], 'name': result['name']}
+            return True
+        if state:
+            self._invalidate_category_state('page changed')
+        return False
+    
     async def _ensure_latvia_category_selected(self):
         """Ensure Latvia Temporary Residence Permit category is selected after each successful login"""
         try:
@@ -2089,20 +3017,24 @@ class VFSBot:
                 logger.warning("⚠️ Все еще на странице входа - пропускаем выбор Latvia")
                 return False
             
+            # Already selected on this page - nothing to do
+            if self._read_category_selection():
+                logger.info("✅ Latvia категория уже выбрана")
+                return True
+            
             # Wait for page to be fully loaded and ready
             await asyncio.sleep(5)
             
             # Check if page is loaded by looking for basic elements
             try:
                 WebDriverWait(self.browser, 15).until(
-                    lambda driver: driver.execute_script("return document.readyState") == "complete"
+                    lambda driver: self._hot_read()['ready_state'] == "complete"
                 )
                 logger.debug("✅ Страница полностью загружена")
             except TimeoutException:
                 logger.warning("⚠️ Страница не полностью загружена за 15 секунд")
             
-            # Analyze page structure first
-            await self._analyze_page_structure()
+            self._maybe_collect_diagnostics('latvia_select')
             
             # Enhanced and comprehensive Latvia category selectors
             latvia_selectors = [
@@ -2156,110 +3088,53 @@ class VFSBot:
             
             category_selected = False
             
-            for i, selector in enumerate(latvia_selectors):
+            # One composite wait over all selectors: the first select offering a Latvia option wins
+            select_elem, locator = await self._wait_for_any(
+                [(By.CSS_SELECTOR, selector) for selector in latvia_selectors],
+                timeout=5,
+                option_texts=["Latvia", "Temporary Residence Permit"],
+            )
+            
+            if select_elem:
+                logger.debug(f"🔍 Dropdown с Latvia найден через селектор: {locator[1]}")
                 try:
-                    logger.debug(f"🔍 Попытка {i+1}: Поиск через селектор: {selector}")
+                    select_obj = Select(select_elem)
+                    available_options = [opt.text for opt in select_obj.options]
+                    logger.debug(f"Доступные опции: {available_options}")
+                    
+                    # Try different selection methods for Latvia, exact match first
+                    latvia_options = [
+                        "Latvia Temporary Residence Permit",
+                        "Latvia",
+                        "Temporary Residence Permit",
+                    ]
+                    for option_text in latvia_options:
+                        if option_text in available_options:
+                            select_obj.select_by_visible_text(option_text)
+                            logger.info(f"✅ Latvia категория выбрана: {option_text}")
+                            category_selected = True
+                            break
                     
-                    if 'option' in selector:
-                        # Looking for specific option first
-                        options = self.browser.find_elements(by=By.CSS_SELECTOR, value=selector)
-                        for option in options:
-                            if 'Latvia' in option.text and 'Temporary' in option.text:
-                                # Found Latvia option, get parent select and select it
-                                select_elem = option.find_element(by=By.XPATH, value='..')
-                                select_obj = Select(select_elem)
-                                select_obj.select_by_visible_text(option.text)
-                                logger.info(f"✅ Latvia категория выбрана через опцию: {option.text}")
+                    # Try partial match
+                    if not category_selected:
+                        for avail_opt in available_options:
+                            if 'Latvia' in avail_opt and 'Temporary' in avail_opt:
+                                select_obj.select_by_visible_text(avail_opt)
+                                logger.info(f"✅ Latvia категория выбрана (частичное совпадение): {avail_opt}")
                                 category_selected = True
                                 break
-                    else:
-                        # Looking for select element
-                        select_elements = self.browser.find_elements(by=By.CSS_SELECTOR, value=selector)
-                        
-                        for select_elem in select_elements:
-                            if select_elem.tag_name.lower() == 'select':
-                                select_obj = Select(select_elem)
-                                
-                                # Try different selection methods for Latvia
-                                latvia_options = [
-                                    "Latvia Temporary Residence Permit",
-                                    "Latvia",
-                                    "Temporary Residence Permit",
-                                ]
-                                
-                                for option_text in latvia_options:
-                                    try:
-                                        # Check if option exists
-                                        available_options = [opt.text for opt in select_obj.options]
-                                        logger.debug(f"Доступные опции: {available_options}")
-                                        
-                                        # Try exact match first
-                                        if option_text in available_options:
-                                            select_obj.select_by_visible_text(option_text)
-                                            logger.info(f"✅ Latvia категория выбрана: {option_text}")
-                                            category_selected = True
-                                            break
-                                        
-                                        # Try partial match
-                                        for avail_opt in available_options:
-                                            if 'Latvia' in avail_opt and 'Temporary' in avail_opt:
-                                                select_obj.select_by_visible_text(avail_opt)
-                                                logger.info(f"✅ Latvia категория выбрана (частичное совпадение): {avail_opt}")
-                                                category_selected = True
-                                                break
-                                                
-                                        if category_selected:
-                                            break
-                                            
-                                    except Exception as select_e:
-                                        logger.debug(f"Не удалось выбрать {option_text}: {select_e}")
-                                        continue
-                                
-                                if category_selected:
-                                    break
-                    
-                    if category_selected:
-                        break
-                        
-                except Exception as e:
-                    logger.debug(f"Селектор {selector} не сработал: {e}")
-                    continue
+                except Exception as select_e:
+                    logger.debug(f"Не удалось выбрать Latvia категорию через {locator[1]}: {select_e}")
             
             if category_selected:
                 logger.info("🎯 ✅ УСПЕХ: Latvia Temporary Residence Permit успешно выбрана!")
                 # Give page time to process the selection
                 await asyncio.sleep(1)
+                self._read_category_selection()
             else:
                 logger.warning("⚠️ Не удалось автоматически выбрать Latvia категорию")
-                
-                # Enhanced debugging - send detailed info to Telegram
-                try:
-                    all_selects = self.browser.find_elements(by=By.TAG_NAME, value='select')
-                    debug_info = f"🔍 ДИАГНОСТИКА: Найдено {len(all_selects)} dropdown(ов) на странице:\n\n"
-                    
-                    for i, select_elem in enumerate(all_selects):
-                        name_attr = select_elem.get_attribute('name') or 'No name'
-                        id_attr = select_elem.get_attribute('id') or 'No id'
-                        select_obj = Select(select_elem)
-                        options_text = [opt.text.strip() for opt in select_obj.options if opt.text.strip()]
-                        
-                        debug_info += f"Dropdown {i+1}:\n"
-                        debug_info += f"  name: {name_attr}\n"
-                        debug_info += f"  id: {id_attr}\n" 
-                        debug_info += f"  опции: {', '.join(options_text[:3])}{'...' if len(options_text) > 3 else ''}\n\n"
-                    
-                    # Send to Telegram in chunks if too long
-                    if len(debug_info) > 4000:
-                        chunks = [debug_info[i:i+4000] for i in range(0, len(debug_info), 4000)]
-                        for chunk in chunks:
-                            logger.info(f"📋 Latvia категория: {chunk}")
-                    else:
-                        logger.info(f"📋 Debug info: {debug_info}")
-                except Exception as debug_e:
-                    logger.debug(f"Ошибка отладочного сообщения: {debug_e}")
-                except:
-                    pass
-                    
+                self._maybe_collect_diagnostics('latvia_select_failed', failed=True)
+            
             return category_selected
                     
         except Exception as e:
@@ -2267,94 +3142,6 @@ class VFSBot:
             logger.warning(f"❌ Ошибка выбора Latvia категории: {str(e)[:200]}")
             return False
 
-    async def _smart_find_form_fields(self):
-        """Smart form field detection with multiple strategies"""
-        try:
-            logger.info("🧠 Интеллектуальный поиск полей формы...")
-            
-            # Common field patterns for VFS forms
-            field_patterns = {
-                'country': ['[name*="country"]', '[id*="country"]', 'select[name*="Country"]', '[name="country"]', '#country'],
-                'passportValidityDate': ['[name*="passport"]', '[name*="validity"]', '[name*="expiry"]', '[id*="passport"]', 'input[type="date"]', '[name*="PassportExpiryDate"]'],
-                'appointmentCategory': ['[name*="category"]', '[name*="appointment"]', '[id*="category"]', 'select[name*="Category"]', '[name="appointmentCategory"]'],
-                'firstName': ['[name*="first"]', '[name*="First"]', '[id*="first"]', 'input[name*="name"]', '[name="firstName"]', '[name="FirstName"]'],
-                'lastName': ['[name*="last"]', '[name*="Last"]', '[id*="last"]', '[name*="surname"]', '[name="lastName"]', '[name="LastName"]'],
-                'dateOfBirth': ['[name*="birth"]', '[name*="Birth"]', '[id*="birth"]', 'input[type="date"]', '[name="dateOfBirth"]', '[name="DateOfBirth"]'],
-                'passportNumber': ['[name*="passport"]', '[id*="passport"]', '[name*="number"]', 'input[type="text"]', '[name="passportNumber"]', '[name="PassportNumber"]'],
-                'nationality': ['[name*="nationality"]', '[id*="nationality"]', '[name*="Nationality"]', '[name="nationality"]', '#nationality'],
-                'phoneNumber': ['[name*="phone"]', '[id*="phone"]', '[name*="mobile"]', 'input[type="tel"]', '[name="phoneNumber"]', '[name="PhoneNumber"]'],
-                'email': ['[name*="email"]', '[id*="email"]', 'input[type="email"]', '[name="email"]', '#email'],
-                'address': ['[name*="address"]', '[id*="address"]', 'textarea', '[name="address"]', '#address'],
-                'purpose': ['[name*="purpose"]', '[id*="purpose"]', '[name*="Purpose"]', '[name="purpose"]', '#purpose']
-            }
-            
-            found_fields = {}
-            
-            for field_name, selectors in field_patterns.items():
-                for selector in selectors:
-                    try:
-                        elements = self.browser.find_elements(by=By.CSS_SELECTOR, value=selector)
-                        for element in elements:
-                            # Check if element is visible and interactable
-                            if element.is_displayed() and element.is_enabled():
-                                # Additional validation based on field type
-                                if self._validate_field_element(field_name, element):
-                                    found_fields[field_name] = {
-                                        'element': element,
-                                        'selector': selector,
-                                        'name': element.get_attribute('name'),
-                                        'id': element.get_attribute('id'),
-                                        'type': element.get_attribute('type') or element.tag_name
-                                    }
-                                    logger.info(f"✅ Найдено поле '{field_name}': {selector}")
-                                    break
-                        if field_name in found_fields:
-                            break
-                    except Exception as e:
-                        continue
-            
-            # Report findings
-            found_count = len(found_fields)
-            total_fields = len(field_patterns)
-            logger.info(f"🎯 Найдено {found_count}/{total_fields} полей формы")
-            
-            missing_fields = set(field_patterns.keys()) - set(found_fields.keys())
-            if missing_fields:
-                logger.warning(f"⚠️ Не найдены поля: {', '.join(missing_fields)}")
-                # Send diagnostic info to logs
-                logger.warning(f"🔍 Поиск полей: найдено {found_count}/{total_fields}\n❌ Не найдены: {', '.join(missing_fields)}")
-                
-            return found_fields
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка интеллектуального поиска полей: {e}")
-            return {}
-
-    def _validate_field_element(self, field_name, element):
-        """Validate if element matches the expected field type"""
-        try:
-            tag = element.tag_name.lower()
-            element_type = element.get_attribute('type')
-            name = (element.get_attribute('name') or '').lower()
-            id_attr = (element.get_attribute('id') or '').lower()
-            
-            # Field-specific validations
-            if field_name in ['country', 'nationality', 'appointmentCategory']:
-                return tag == 'select'
-            elif field_name in ['dateOfBirth', 'passportValidityDate']:
-                return (tag == 'input' and element_type in ['date', 'text']) or 'date' in name or 'date' in id_attr
-            elif field_name == 'email':
-                return (tag == 'input' and element_type == 'email') or 'email' in name or 'email' in id_attr
-            elif field_name == 'phoneNumber':
-                return (tag == 'input' and element_type in ['tel', 'text']) or 'phone' in name or 'mobile' in name
-            elif field_name == 'address':
-                return tag in ['textarea', 'input']
-            else:
-                return tag == 'input' and element_type in ['text', 'email', 'tel', None]
-                
-        except Exception:
-            return True  # If validation fails, assume it's valid
-
     async def _ensure_autofill_activated(self, person_name, context):
         """Ensure auto-fill is activated after successful login with comprehensive checks"""
         try:
@@ -2421,7 +3208,7 @@ class VFSBot:
                 
                 # Check if page is loaded and interactive
                 try:
-                    page_state = self.browser.execute_script("return document.readyState")
+                    page_state = self._hot_read()['ready_state']
                     logger.info(f"📄 Состояние страницы: {page_state} (ожидание {elapsed}/{max_wait_time}с)")
                     
                     if page_state == "complete":
@@ -2602,44 +3389,128 @@ class VFSBot:
             logger.info(f"✅ Отчет о завершении цикла отправлен успешно")
             
         except Exception as e:
-            logger.error(f"❌ Ошибка при отправке отчета о завершении цикла: {e}")
-
-    async def _send_captcha_for_manual_input(self, captcha_img):
-        """Send captcha image to Telegram for manual input"""
+            logger.error(f"❌ Ошибка при отправке отчета о завершении цикла: {e}")
+
+    def _ocr_captcha(self, captcha_png):
+        """Run OCR on the captcha screenshot; returns the text or None"""
+        logger.info("🧠 Автоматическое распознавание капчи (OCR)...")
+        try:
+            captcha = break_captcha(captcha_png)
+        except Exception as ocr_e:
+            logger.warning(f"⚠️ Ошибка OCR: {ocr_e}")
+            return None
+        if captcha and captcha.strip():
+            logger.info(f"✅ Капча автоматически распознана: '{captcha}'")
+            return captcha
+        logger.warning("⚠️ OCR вернул пустую строку")
+        return None
+    
+    async def _solve_captcha(self, captcha_png):
+        """Captcha answer from OCR and/or the Telegram admin, whichever the configuration prefers"""
+        loop = asyncio.get_running_loop()
+        if self.captcha_auto_solve:
+            # OCR runs in a worker thread so the event loop keeps driving the login
+            captcha = await loop.run_in_executor(None, self._ocr_captcha, captcha_png)
+            if captcha:
+                return captcha
+            # OCR failed - ask the admin
+            return await self._send_captcha_for_manual_input(captcha_png)
+        
+        logger.info("📱 Ручной ввод капчи включен")
+        captcha = await self._send_captcha_for_manual_input(captcha_png)
+        if captcha:
+            return captcha
+        logger.warning("⏱️ Ответ администратора не получен - пробуем автоматическое распознавание")
+        return await loop.run_in_executor(None, self._ocr_captcha, captcha_png)
+    
+    def _cancel_captcha_prefetch(self):
+        """Stop a captcha prefetch left behind by a login that failed before submit"""
+        task = getattr(self, '_captcha_prefetch', None)
+        if task is not None and not task.done():
+            task.cancel()
+        self._captcha_prefetch = None
+    
+    async def _prefetch_captcha(self):
+        """Capture the captcha as soon as it appears and solve it; returns (element, answer)"""
+        captcha_selectors = [
+            (By.ID, 'CaptchaImage'),
+            (By.CLASS_NAME, 'captcha-image'),
+            (By.CSS_SELECTOR, 'img[src*="captcha"]'),
+            (By.XPATH, '//img[contains(@src, "captcha") or contains(@id, "captcha")]')
+        ]
+        try:
+            captcha_img, locator = await self._wait_for_any(captcha_selectors, timeout=10, clickable=True)
+            if not captcha_img:
+                return None, None
+            logger.info(f"✅ Капча найдена: {locator[0]}={locator[1]}")
+            # Screenshot straight to memory; OCR decodes the PNG bytes without a temp file
+            captcha_png = captcha_img.screenshot_as_png
+            return captcha_img, await self._solve_captcha(captcha_png)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка предварительной обработки капчи: {e}")
+            return None, None
+    
+    def _enter_captcha(self, captcha):
+        """Type the captcha answer into the captcha input field"""
+        # Try multiple selectors for captcha input
+        captcha_input_selectors = [
+            (By.NAME, 'CaptchaInputText'),
+            (By.ID, 'CaptchaInputText'),
+            (By.CLASS_NAME, 'captcha-input'),
+            (By.CSS_SELECTOR, 'input[name*="captcha"], input[id*="captcha"]')
+        ]
+        
+        for input_type, input_value in captcha_input_selectors:
+            try:
+                captcha_field = self.browser.find_element(input_type, input_value)
+                captcha_field.clear()
+                captcha_field.send_keys(captcha)
+                logger.info(f"✅ Капча введена в поле: {input_type}={input_value}")
+                return True
+            except:
+                continue
+        return False
+    
+    async def _send_captcha_for_manual_input(self, captcha_png):
+        """Send captcha image to Telegram and wait for an admin to reply with the answer"""
         try:
             logger.info("📱 Отправка капчи в Telegram для ручного ввода...")
             
-            # Save captcha with timestamp
-            captcha_timestamp = int(datetime.now().timestamp())
-            manual_captcha_filename = f'manual_captcha_{captcha_timestamp}.png'
+            if not (hasattr(self, 'app') and hasattr(self.app, 'bot')):
+                return None
             
-            with open(manual_captcha_filename, 'wb') as file:
-                file.write(captcha_img.screenshot_as_png)
-            
-            # Send to Telegram
-            if hasattr(self, 'app') and hasattr(self.app, 'bot'):
-                with open(manual_captcha_filename, 'rb') as captcha_file:
-                    caption_text = f"🤖 КАПЧА ОБНАРУЖЕНА!\n\n📷 Время: {datetime.now().strftime('%H:%M:%S')}\n👆 Пожалуйста, введите символы с изображения\n\n⏰ Ожидание ответа..."
-                    
-                    await self.app.bot.send_photo(
-                        chat_id=self.channel_id,
-                        photo=captcha_file,
-                        caption=caption_text
-                    )
-                    
-                logger.info(f"✅ Капча отправлена в Telegram: {manual_captcha_filename}")
-                
-                # Set up waiting for manual input (simplified version)
-                logger.info("⏳ Ожидание ручного ввода капчи...")
-                await asyncio.sleep(30)  # Wait 30 seconds for manual input
-                
-            # Clean up
-            if os.path.exists(manual_captcha_filename):
-                os.remove(manual_captcha_filename)
-                logger.debug(f"🗑️ Временный файл капчи удален: {manual_captcha_filename}")
+            caption_text = (f"🤖 КАПЧА ОБНАРУЖЕНА!\n\n📷 Время: {datetime.now().strftime('%H:%M:%S')}\n"
+                            f"👆 Ответьте (reply) на это сообщение символами с изображения\n\n"
+                            f"⏰ Ожидание ответа до {self.captcha_manual_timeout} сек...")
+            message = await self.app.bot.send_photo(
+                chat_id=self.channel_id,
+                photo=captcha_png,
+                caption=caption_text
+            )
+            # Register before waiting so a fast reply is never lost
+            self.captcha_broker.open(message.message_id)
+            logger.info(f"✅ Капча отправлена в Telegram (message_id={message.message_id})")
+            
+            logger.info("⏳ Ожидание ручного ввода капчи...")
+            answer = await self.captcha_broker.wait(message.message_id, self.captcha_manual_timeout)
+            if answer:
+                logger.info(f"✅ Получен ответ администратора на капчу: '{answer}'")
+                return answer.strip()
+            logger.warning(f"⏱️ Ответ на капчу не получен за {self.captcha_manual_timeout} сек")
+            return None
                 
         except Exception as e:
             logger.error(f"❌ Ошибка отправки капчи в Telegram: {e}")
+            return None
+    
+    async def captcha_reply(self, update: Update, context: CallbackContext):
+        """Admin reply to a captcha photo: hand the answer to the waiting login"""
+        message = update.message
+        answer = (message.text or '').strip()
+        if message.reply_to_message and answer and self.captcha_broker.resolve(message.reply_to_message.message_id, answer):
+            await message.reply_text(f"✅ Капча принята: {answer}")
+        else:
+            await message.reply_text("ℹ️ Нет ожидающей капчи для этого сообщения")
 
     async def _attempt_login_recovery(self, person_name):
         """Attempt to recover from login timeout errors"""
@@ -2684,7 +3555,7 @@ class VFSBot:
             await asyncio.sleep(3)
             
             # Check if page is fully loaded
-            ready_state = self.browser.execute_script("return document.readyState")
+            ready_state = self._hot_read()['ready_state']
             if ready_state != "complete":
                 logger.info("⏳ Ожидание завершения загрузки страницы...")
                 await asyncio.sleep(5)
@@ -2718,20 +3589,10 @@ class VFSBot:
                     (By.CSS_SELECTOR, "select[name*='location'], select[id*='location']")
                 ]
                 
-                for strategy_num, (by_method, selector) in enumerate(wait_strategies):
-                    try:
-                        logger.debug(f"🔍 Стратегия {strategy_num + 1}: {by_method}={selector}")
-                        location_element = WebDriverWait(self.browser, 15).until(
-                            EC.element_to_be_clickable((by_method, selector))
-                        )
-                        logger.debug(f"✅ LocationId найден стратегией {strategy_num + 1}")
-                        break
-                    except TimeoutException:
-                        logger.debug(f"⏱️ Стратегия {strategy_num + 1} timeout")
-                        continue
-                    except Exception as strategy_e:
-                        logger.debug(f"⚠️ Стратегия {strategy_num + 1} ошибка: {strategy_e}")
-                        continue
+                # All strategies race in one wait instead of 15 s each in sequence
+                location_element, locator = await self._wait_for_any(wait_strategies, timeout=15, clickable=True)
+                if location_element:
+                    logger.debug(f"✅ LocationId найден стратегией {wait_strategies.index(locator) + 1}: {locator[0]}={locator[1]}")
                 
                 if not location_element:
                     logger.warning("⚠️ LocationId не найден ни одной стратегией")
@@ -2820,36 +3681,77 @@ class VFSBot:
         
         return False
     
+    def _fetch_dom_html(self):
+        """Page HTML for the DOM mirror (bypasses the event listener so fetching does not invalidate)"""
+        driver = getattr(self.browser, 'wrapped_driver', self.browser)
+        return driver.execute_script("return document.documentElement.outerHTML")
+    
+    def _mirror_candidates(self, locators):
+        """Prune a selector list to the locators present in the DOM mirror (all of them if it is unavailable)"""
+        candidates = self.dom_mirror.candidates(locators)
+        if len(candidates) != len(locators):
+            logger.debug(f"🪞 DOM-зеркало: {len(candidates)}/{len(locators)} селекторов совпали")
+        return candidates
+    
+    async def _wait_for_any(self, locators, timeout=15, clickable=False, option_texts=None, poll=0.5):
+        """
+        Wait until any of `locators` matches, checking all of them in one script per poll.
+        
+        Locators are tried in priority order on every poll. With `clickable` the element must be
+        visible and enabled; with `option_texts` it must be a select offering one of those texts.
+        Returns (element, locator), or (None, None) after `timeout` seconds.
+        """
+        specs = [[by, value] for by, value in locators]
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                result = self.browser.execute_script(FIND_ANY_SCRIPT, specs, clickable, list(option_texts or []))
+            except Exception as e:
+                logger.debug(f"⚠️ Ошибка составного ожидания: {e}")
+                result = None
+            if result:
+                index, element = result
+                return element, locators[index]
+            if time.monotonic() >= deadline:
+                return None, None
+            await asyncio.sleep(poll)
+    
+    async def _click_with_strategies(self, element, kind, page='app', extra_methods=None):
+        """
+        Click `element` trying the click method that last worked for this page/element kind first.
+        
+        Returns the name of the method that succeeded, or None. A stale element is re-raised
+        so the caller can look the element up again.
+        """
+        methods = {
+            'regular_click': lambda: element.click(),
+            'javascript_click': lambda: self.browser.execute_script("arguments[0].click();", element),
+            'action_chains': lambda: ActionChains(self.browser).move_to_element(element).click().perform(),
+            'scroll_and_click': lambda: (self.browser.execute_script("arguments[0].scrollIntoView(true);", element), element.click()),
+        }
+        methods.update(extra_methods or {})
+        context = f"{page}:{kind}"
+        
+        for method_name in self.click_strategies.order(context, list(methods)):
+            try:
+                methods[method_name]()
+                self.click_strategies.record(context, method_name, True)
+                return method_name
+            except StaleElementReferenceException:
+                raise
+            except Exception as e:
+                self.click_strategies.record(context, method_name, False)
+                logger.debug(f"🔍 Метод {method_name} не удался для {kind}: {str(e)[:100]}")
+        return None
+    
     async def _safe_element_click(self, element, element_name, max_attempts=3):
         """Safely click an element with multiple strategies"""
         for attempt in range(max_attempts):
             try:
-                # Strategy 1: Regular click
-                element.click()
-                logger.debug(f"✅ {element_name} успешно нажат (regular click)")
-                return True
-                
-            except ElementClickInterceptedException:
-                logger.debug(f"🔄 {element_name} перехвачен, пробую JavaScript click...")
-                try:
-                    # Strategy 2: JavaScript click
-                    self.browser.execute_script("arguments[0].click();", element)
-                    logger.debug(f"✅ {element_name} успешно нажат (JavaScript click)")
-                    return True
-                except Exception as js_e:
-                    logger.debug(f"⚠️ JavaScript click failed: {js_e}")
-                    
-            except ElementNotInteractableException:
-                logger.debug(f"🔄 {element_name} не интерактивен, пробую прокрутку...")
-                try:
-                    # Strategy 3: Scroll into view and click
-                    self.browser.execute_script("arguments[0].scrollIntoView(true);", element)
-                    await asyncio.sleep(1)
-                    element.click()
-                    logger.debug(f"✅ {element_name} успешно нажат после прокрутки")
+                method_name = await self._click_with_strategies(element, element_name, page='booking')
+                if method_name:
+                    logger.debug(f"✅ {element_name} успешно нажат ({method_name})")
                     return True
-                except Exception as scroll_e:
-                    logger.debug(f"⚠️ Scroll click failed: {scroll_e}")
                     
             except StaleElementReferenceException:
                 logger.warning(f"🔄 {element_name} устарел, обновляю элементы...")
@@ -2858,9 +3760,9 @@ class VFSBot:
                 
             except Exception as e:
                 logger.debug(f"⚠️ Click attempt {attempt + 1} failed: {e}")
-                if attempt < max_attempts - 1:
-                    await asyncio.sleep(1)
-                    continue
+            
+            if attempt < max_attempts - 1:
+                await asyncio.sleep(1)
                     
         logger.error(f"❌ Все попытки клика на {element_name} неудачны")
         return False
@@ -2868,6 +3770,29 @@ class VFSBot:
     async def _select_location_option_with_recovery(self, location_element):
         """Select location option with error recovery"""
         try:
+            # The watch target's center, matched by option text in one round trip;
+            # the full option text names the center in the "no seats" message
+            self.selected_center = None
+            center = self.watch_target['center']
+            if center:
+                match = self.browser.execute_script(
+                    "var want = arguments[1].toLowerCase();"
+                    "var options = Array.prototype.slice.call(arguments[0].options);"
+                    "var clean = function (t) { return t.replace(/\\s+/g, ' ').trim(); };"
+                    "var index = options.findIndex(function (o) { return clean(o.text).toLowerCase().indexOf(want) !== -1; });"
+                    "return index < 0 ? null : {index: index, text: clean(options[index].text)};",
+                    location_element, normalize_text(center))
+                if match:
+                    Select(location_element).select_by_index(match['index'])
+                    self.selected_center = match['text']
+                    await asyncio.sleep(2)
+                    if not self.check_errors():
+                        logger.debug(f"✅ Центр выбран: {match['text']}")
+                        return True
+                    logger.warning("⚠️ Ошибка после выбора центра")
+                else:
+                    logger.warning(f"⚠️ Центр '{center}' не найден в LocationId - выбирается первый в списке")
+            
             # Try to find and select the second option
             option_selectors = [
                 '//*[@id="LocationId"]/option[2]',
@@ -2914,7 +3839,7 @@ class VFSBot:
             
             # Check page loading state
             try:
-                loading_state = self.browser.execute_script("return document.readyState")
+                loading_state = self._hot_read()['ready_state']
                 if loading_state != "complete":
                     logger.info("⏳ Страница все еще загружается, ожидание...")
                     await asyncio.sleep(5)
@@ -3032,12 +3957,8 @@ class VFSBot:
     def _check_browser_health(self):
         """Check if browser is healthy and responsive"""
         try:
-            # Quick health checks
-            current_url = self.browser.current_url
-            window_handles = len(self.browser.window_handles)
-            
-            # Browser is healthy if we can get basic information
-            return current_url is not None and window_handles > 0
+            # Quick health check: one read through the WebDriver session itself
+            return bool(self._hot_read(via_webdriver=True).get('url'))
             
         except Exception as e:
             logger.warning(f"⚠️ Browser health check failed: {e}")
@@ -3072,6 +3993,11 @@ class VFSBot:
     async def _verify_latvia_category_selected(self):
         """Verify that Latvia category is currently selected, re-select if not"""
         try:
+            # Common case: the remembered selection is still in place - a single script call
+            if self._read_category_selection():
+                logger.debug("✅ Latvia категория подтверждена (состояние сессии)")
+                return True
+            
             # Wait for page to be fully loaded before checking
             await asyncio.sleep(3)
             
@@ -3088,17 +4014,15 @@ class VFSBot:
                 await asyncio.sleep(5)
             
             # Look for dropdown elements with extended waiting
-            try:
-                # Wait for dropdowns to appear
-                WebDriverWait(self.browser, 10).until(
-                    lambda driver: len(driver.find_elements(By.TAG_NAME, "select")) > 0 or
-                                 len(driver.find_elements(By.CLASS_NAME, "dropdown")) > 0 or
-                                 len(driver.find_elements(By.CSS_SELECTOR, "[role='combobox']")) > 0
-                )
-                logger.info("✅ Dropdown элементы обнаружены на странице")
-            except TimeoutException:
+            dropdown, _ = await self._wait_for_any([
+                (By.TAG_NAME, "select"),
+                (By.CLASS_NAME, "dropdown"),
+                (By.CSS_SELECTOR, "[role='combobox']"),
+            ], timeout=10)
+            if dropdown is None:
                 logger.warning("⚠️ Dropdown элементы не найдены за 10 секунд - возможно, страница не готова")
                 return False
+            logger.info("✅ Dropdown элементы обнаружены на странице")
             
             # Quick check if Latvia category is properly selected
             selects = self.browser.find_elements(by=By.TAG_NAME, value='select')
@@ -3148,6 +4072,8 @@ class VFSBot:
         try:
             logger.info("🧹 Расширенная принудительная очистка браузера...")
             
+            self._invalidate_category_state('browser closed')
+            self._close_cdp()
             # Close current browser gracefully
             if self.browser:
                 try:
@@ -3157,83 +4083,85 @@ class VFSBot:
                     logger.debug(f"⚠️ Browser.quit() ошибка: {e}")
                 self.browser = None
             
-            # Enhanced Chrome process cleanup with undetected_chromedriver
-            import subprocess
-            try:
-                # Check current Chrome process count
-                chrome_check = subprocess.run(['tasklist', '/fi', 'imagename eq chrome.exe', '/fo', 'csv'], 
+            # Process-wide kills would also take down a Grid session's peers or the standby browser
+            if self._local_process_cleanup_allowed():
+                # Enhanced Chrome process cleanup with undetected_chromedriver
+                import subprocess
+                try:
+                    # Check current Chrome process count
+                    chrome_check = subprocess.run(['tasklist', '/fi', 'imagename eq chrome.exe', '/fo', 'csv'], 
+                                                capture_output=True, text=True, timeout=5)
+                    chrome_lines = [line for line in chrome_check.stdout.split('\n') if 'chrome.exe' in line]
+                    chrome_count = len(chrome_lines)
+                
+                    # CRITICAL: Check undetected_chromedriver processes (major memory leak source)
+                    uc_check = subprocess.run(['tasklist', '/fi', 'imagename eq undetected_chromedriver.exe', '/fo', 'csv'], 
                                             capture_output=True, text=True, timeout=5)
-                chrome_lines = [line for line in chrome_check.stdout.split('\n') if 'chrome.exe' in line]
-                chrome_count = len(chrome_lines)
-                
-                # CRITICAL: Check undetected_chromedriver processes (major memory leak source)
-                uc_check = subprocess.run(['tasklist', '/fi', 'imagename eq undetected_chromedriver.exe', '/fo', 'csv'], 
-                                        capture_output=True, text=True, timeout=5)
-                uc_lines = [line for line in uc_check.stdout.split('\n') if 'undetected_chromedriver.exe' in line]
-                uc_count = len(uc_lines)
-                
-                total_processes = chrome_count + uc_count
-                if total_processes > 0:
-                    logger.info(f"🔍 Обнаружено {chrome_count} Chrome + {uc_count} undetected_chromedriver процессов, выполняется очистка...")
+                    uc_lines = [line for line in uc_check.stdout.split('\n') if 'undetected_chromedriver.exe' in line]
+                    uc_count = len(uc_lines)
+                
+                    total_processes = chrome_count + uc_count
+                    if total_processes > 0:
+                        logger.info(f"🔍 Обнаружено {chrome_count} Chrome + {uc_count} undetected_chromedriver процессов, выполняется очистка...")
                     
-                    # Force kill all Chrome processes with tree termination
-                    if chrome_count > 0:
-                        result = subprocess.run([
-                            'taskkill', '/f', '/im', 'chrome.exe', '/t'
-                        ], capture_output=True, text=True, timeout=15)
-                        logger.info(f"🧹 {chrome_count} Chrome процессов принудительно завершены")
+                        # Force kill all Chrome processes with tree termination
+                        if chrome_count > 0:
+                            result = subprocess.run([
+                                'taskkill', '/f', '/im', 'chrome.exe', '/t'
+                            ], capture_output=True, text=True, timeout=15)
+                            logger.info(f"🧹 {chrome_count} Chrome процессов принудительно завершены")
                     
-                    # CRITICAL: Force kill all undetected_chromedriver processes (prevents memory leak)
-                    if uc_count > 0:
-                        uc_result = subprocess.run([
-                            'taskkill', '/f', '/im', 'undetected_chromedriver.exe'
-                        ], capture_output=True, text=True, timeout=15)
-                        logger.info(f"🧹 {uc_count} undetected_chromedriver процессов завершены (предотвращена утечка памяти)")
-                else:
-                    logger.debug("✅ Chrome и undetected_chromedriver процессы не обнаружены")
+                        # CRITICAL: Force kill all undetected_chromedriver processes (prevents memory leak)
+                        if uc_count > 0:
+                            uc_result = subprocess.run([
+                                'taskkill', '/f', '/im', 'undetected_chromedriver.exe'
+                            ], capture_output=True, text=True, timeout=15)
+                            logger.info(f"🧹 {uc_count} undetected_chromedriver процессов завершены (предотвращена утечка памяти)")
+                    else:
+                        logger.debug("✅ Chrome и undetected_chromedriver процессы не обнаружены")
                 
-                # Kill chromedriver processes
-                subprocess.run([
-                    'taskkill', '/f', '/im', 'chromedriver.exe'
-                ], capture_output=True, text=True, timeout=5)
-                logger.debug("🧹 ChromeDriver процессы завершены")
+                    # Kill chromedriver processes
+                    subprocess.run([
+                        'taskkill', '/f', '/im', 'chromedriver.exe'
+                    ], capture_output=True, text=True, timeout=5)
+                    logger.debug("🧹 ChromeDriver процессы завершены")
                 
-            except subprocess.TimeoutExpired:
-                logger.warning("⚠️ Timeout при завершении процессов Chrome")
-            except Exception as e:
-                logger.debug(f"⚠️ Ошибка при завершении процессов: {e}")
+                except subprocess.TimeoutExpired:
+                    logger.warning("⚠️ Timeout при завершении процессов Chrome")
+                except Exception as e:
+                    logger.debug(f"⚠️ Ошибка при завершении процессов: {e}")
             
-            # Enhanced temporary cleanup
-            import shutil, tempfile, glob
-            try:
-                # Clean Chrome temp directories
-                temp_dirs = [
-                    os.path.expanduser('~/.wdm'),
-                    os.path.expanduser('~/appdata/roaming/undetected_chromedriver'),
-                    os.path.join(tempfile.gettempdir(), 'chrome_*'),
-                    os.path.join(tempfile.gettempdir(), 'scoped_dir*'),
-                ]
+                # Enhanced temporary cleanup
+                import shutil, tempfile, glob
+                try:
+                    # Clean Chrome temp directories
+                    temp_dirs = [
+                        os.path.expanduser('~/.wdm'),
+                        os.path.expanduser('~/appdata/roaming/undetected_chromedriver'),
+                        os.path.join(tempfile.gettempdir(), 'chrome_*'),
+                        os.path.join(tempfile.gettempdir(), 'scoped_dir*'),
+                    ]
                 
-                for temp_pattern in temp_dirs:
-                    if '*' in temp_pattern:
-                        # Handle glob patterns
-                        for temp_path in glob.glob(temp_pattern):
+                    for temp_pattern in temp_dirs:
+                        if '*' in temp_pattern:
+                            # Handle glob patterns
+                            for temp_path in glob.glob(temp_pattern):
+                                try:
+                                    if os.path.isdir(temp_path):
+                                        shutil.rmtree(temp_path, ignore_errors=True)
+                                    elif os.path.isfile(temp_path):
+                                        os.remove(temp_path)
+                                    logger.debug(f"🧹 Очищен: {temp_path}")
+                                except:
+                                    pass
+                        elif os.path.exists(temp_pattern):
                             try:
-                                if os.path.isdir(temp_path):
-                                    shutil.rmtree(temp_path, ignore_errors=True)
-                                elif os.path.isfile(temp_path):
-                                    os.remove(temp_path)
-                                logger.debug(f"🧹 Очищен: {temp_path}")
+                                shutil.rmtree(temp_pattern, ignore_errors=True)
+                                logger.debug(f"🧹 Очищен каталог: {temp_pattern}")
                             except:
                                 pass
-                    elif os.path.exists(temp_pattern):
-                        try:
-                            shutil.rmtree(temp_pattern, ignore_errors=True)
-                            logger.debug(f"🧹 Очищен каталог: {temp_pattern}")
-                        except:
-                            pass
-            except Exception as e:
-                logger.debug(f"Temp cleanup error: {e}")
+                except Exception as e:
+                    logger.debug(f"Temp cleanup error: {e}")
             
             # Enhanced memory cleanup
             import gc
@@ -3251,6 +4179,9 @@ class VFSBot:
 
     def _monitor_chrome_processes(self):
         """Enhanced monitoring and cleanup of Chrome processes including undetected_chromedriver"""
+        if not self._local_process_cleanup_allowed():
+            # The standby Chrome would be counted (and killed) as a leak
+            return 0
         try:
             import subprocess
             
@@ -3320,12 +4251,9 @@ class VFSBot:
                 
             # Test basic browser functionality
             try:
-                current_url = self.browser.current_url
-                window_handles = len(self.browser.window_handles)
-                logger.debug(f"🔍 Browser stability: URL={current_url[:50]}..., Windows={window_handles}")
-                
-                # Check if browser is responsive
-                self.browser.execute_script("return document.readyState;")
+                # URL and readyState in one WebDriver round trip also prove the session responds
+                page = self._hot_read(via_webdriver=True)
+                logger.debug(f"🔍 Browser stability: URL={page['url'][:50]}..., state={page['ready_state']}")
                 return True
                 
             except Exception as browser_e:
@@ -3427,6 +4355,10 @@ class VFSBot:
     async def login_helper(self, update, context):
         logger.info("🚀 ЗАПУСК login_helper с комплексным мониторингом браузера")
         
+        # Never race the browser/document steps still running from startup
+        await self._await_startup_step('browser')
+        await self._await_startup_step('documents')
+        
         # Comprehensive pre-execution health check
         if not self._comprehensive_browser_health_check():
             logger.warning("⚠️ Обнаружены проблемы с браузером, выполняется профилактическая очистка...")
@@ -3481,6 +4413,7 @@ class VFSBot:
                 logger.info(f"🔍 Periodic check: {chrome_count} Chrome processes detected")
             
             # Get next person and rotate through all persons
+            await self._wait_for_available_applicant()
             person = self._get_next_person()
             if not person:
                 logger.error("❌ Не найдены настроенные заявители!")
@@ -3541,6 +4474,11 @@ class VFSBot:
                     wait_time = 8
                     recovery_action = "page_refresh"
                 
+                # A dead browser is replaced by the hot standby without waiting
+                if error_type in ("browser_init", "connection") and self._promote_standby():
+                    web_error_count = 0
+                    continue
+                
                 # Execute recovery action
                 if recovery_action:
                     logger.info(f"🔧 Выполнение восстановления: {recovery_action}")
@@ -3614,14 +4552,20 @@ class VFSBot:
                         pass
                     self.browser = None
                     
-                    # Kill any remaining processes
-                    try:
-                        import subprocess
-                        subprocess.run(['taskkill', '/f', '/im', 'chrome.exe'], capture_output=True, check=False)
-                        subprocess.run(['taskkill', '/f', '/im', 'chromedriver.exe'], capture_output=True, check=False)
-                        logger.debug("🧹 Принудительно завершены процессы браузера")
-                    except:
-                        pass
+                    # Fail over to the hot standby right away instead of a cold relaunch
+                    if self._promote_standby():
+                        retry_count = 0
+                        continue
+                    
+                    # Kill any remaining processes (a Grid session lives on a remote node instead)
+                    if self._local_process_cleanup_allowed():
+                        try:
+                            import subprocess
+                            subprocess.run(['taskkill', '/f', '/im', 'chrome.exe'], capture_output=True, check=False)
+                            subprocess.run(['taskkill', '/f', '/im', 'chromedriver.exe'], capture_output=True, check=False)
+                            logger.debug("🧹 Принудительно завершены процессы браузера")
+                        except:
+                            pass
                     
                     # Force garbage collection to free memory
                     import gc
@@ -3736,6 +4680,9 @@ class VFSBot:
 /report - Получить детальный отчет по заявителю (использование: /report ИМЯ ФАМИЛИЯ)
          Для ВСЕХ отчетов DILSHODJON: /report DILSHODJON TILLAEV ALL
 /dilshodjon - Отправить ВСЕ отчеты для DILSHODJON TILLAEV немедленно ⭐
+/events - Сводка журнала событий (использование: /events [часы])
+/diag - Снять диагностику текущей страницы браузера
+/watch - Состояние целей наблюдения (центр/категория)
 /help - Показать эту справку
 
 🔄 РЕЖИМ МНОГОЗАЯВИТЕЛЕЙ: Активирован ✅
@@ -3775,6 +4722,9 @@ class VFSBot:
         status = "🔴 ОСТАНОВЛЕН" if not self.started else "🟢 АКТИВЕН"
         browser_status = "🌐 Открыт" if self.browser else "❌ Закрыт"
         
+        rss = process_rss_mb()
+        scheduler_status = self.scheduler.status()
+        open_breakers = [f"{name} ({breaker.remaining():.0f}с)" for name, breaker in self.breakers.items() if not breaker.allow()]
         stat_text = f"""📊 СТАТИСТИКА БОТА VFS
 
 🤖 Статус: {status}
@@ -3782,10 +4732,15 @@ class VFSBot:
 ⏱️ Время работы: {hours}ч {minutes}м {seconds}с
 🔄 Проверок выполнено: {self.check_count}
 ⚙️ Интервал проверки: {self.interval} сек
+🏁 До первой проверки: {f'{self.time_to_first_check:.1f} сек' if self.time_to_first_check is not None else 'Н/Д'}
+⛔ Отключены: {', '.join(open_breakers) or 'нет'}
+🗓️ Проверок за час: {scheduler_status['checks_last_hour']}/{scheduler_status['hourly_budget'] or '∞'}, в бэкоффе: {len(scheduler_status['backing_off'])}, горячих окон: {scheduler_status['hot_windows']}
 
 👥 Заявители: {len(self.persons)}
 📋 Конфигурация загружена: {'✅' if self.persons else '❌'}
 """
+        if rss is not None:
+            stat_text += f"💾 Память процесса: {rss:.0f} MB\n"
 
         if self.person_stats:
             stat_text += "\n📈 Статистика по заявителям:\n"
@@ -3794,6 +4749,82 @@ class VFSBot:
 
         await update.message.reply_text(stat_text)
 
+    async def events_command(self, update: Update, context: CallbackContext):
+        """Сводка по структурному журналу событий (использование: /events [часы])"""
+        try:
+            hours = float(context.args[0]) if context.args else 24
+            since = datetime.now().timestamp() - hours * 3600
+            loop = asyncio.get_event_loop()
+            summary = await loop.run_in_executor(
+                None, lambda: summarize_events(path=self.event_log.path, since=since))
+            
+            lines = [f"🧾 ЖУРНАЛ СОБЫТИЙ за {hours:g} ч", f"📊 Записей: {summary['total']}"]
+            if summary['by_kind']:
+                lines.append("🔖 Типы: " + ", ".join(f"{k}={v}" for k, v in summary['by_kind'].items()))
+            if summary['by_outcome']:
+                lines.append("🎯 Результаты: " + ", ".join(
+                    f"{k}={v}" for k, v in sorted(summary['by_outcome'].items(), key=lambda kv: -kv[1])))
+            if summary['phases']:
+                lines.append("\n⏱️ Фазы (среднее / макс, мс):")
+                for name, phase in sorted(summary['phases'].items(), key=lambda kv: -kv[1]['avg_ms'])[:10]:
+                    lines.append(f"  • {name}: {phase['avg_ms']:.0f} / {phase['max_ms']:.0f}")
+            if summary['errors']:
+                lines.append("\n❌ Ошибки: " + ", ".join(
+                    f"{k}={v}" for k, v in sorted(summary['errors'].items(), key=lambda kv: -kv[1])[:5]))
+            if summary['slots']:
+                ts, applicant, slot_date = summary['slots'][-1]
+                lines.append(f"\n📅 Последний слот: {slot_date} ({applicant})")
+            
+            await update.message.reply_text("\n".join(lines))
+        except Exception as e:
+            logger.error(f"❌ Ошибка команды events: {e}")
+            await update.message.reply_text(f"❌ Ошибка: {e}")
+
+    async def diag_command(self, update: Update, context: CallbackContext):
+        """Диагностика структуры текущей страницы (одним запросом к браузеру)"""
+        if not self.browser:
+            await update.message.reply_text("❌ Браузер не запущен")
+            return
+        report = self._collect_page_diagnostics('telegram')
+        if report is None:
+            await update.message.reply_text("❌ Не удалось собрать диагностику страницы")
+            return
+        counts = report.get('counts', {})
+        lines = [
+            "🔍 ДИАГНОСТИКА СТРАНИЦЫ",
+            f"📍 {report.get('url')}",
+            f"📄 {report.get('title') or '-'} ({report.get('ready_state')})",
+            "📊 " + ", ".join(f"{k}={v}" for k, v in counts.items()),
+            f"🇱🇻 Текст 'Latvia': {report.get('latvia_text', 0)}",
+        ]
+        if report.get('login_markers'):
+            lines.append(f"🔐 Признаки входа: {', '.join(report['login_markers'])}")
+        for i, select in enumerate(report.get('selects', [])[:8], 1):
+            options = ', '.join(select.get('options', [])[:3])
+            more = '...' if select.get('n_options', 0) > 3 else ''
+            lines.append(f"\n📋 Dropdown {i}: id={select.get('id') or '-'}, name={select.get('name') or '-'}"
+                         f"{' ⭐' if select.get('latvia') else ''}\n  выбрано: {select.get('selected') or '-'}\n  опции: {options}{more}")
+        await update.message.reply_text("\n".join(lines)[:4000])
+
+    async def watch_command(self, update: Update, context: CallbackContext):
+        """Состояние целей наблюдения: последняя проверка и найденный слот по каждой"""
+        lines = ["🎯 ЦЕЛИ НАБЛЮДЕНИЯ"]
+        now = time.time()
+        for name, target in self.watch.targets.items():
+            state = self.watch.state[name]
+            applicants = [p['name'] for p in self.persons if self.watch.get(p.get('watch'))['name'] == name]
+            checked = f"{(now - state['checked_at']) / 60:.0f} мин назад" if state['checked_at'] else 'еще не проверялась'
+            lines.append(f"\n📍 {name}: {target['center'] or 'первый центр'} | категория {target['category']}")
+            lines.append(f"🌐 {self._target_url(target)[:60]}")
+            lines.append(f"👥 Заявители: {', '.join(applicants) or 'нет'}")
+            lines.append(f"🔍 Проверок: {state['checks']}, последняя: {checked} ({state['outcome'] or '-'})")
+            if state['slot_at']:
+                lines.append(f"📅 Слотов: {state['slots']}, последний: {state['slot_date']} "
+                             f"({datetime.fromtimestamp(state['slot_at']).strftime('%d.%m %H:%M')})")
+            if state['dates']:
+                lines.append(f"📆 Все даты: {', '.join(state['dates'][:8])}{'...' if len(state['dates']) > 8 else ''}")
+        await update.message.reply_text("\n".join(lines)[:4000])
+
     async def captcha_command(self, update: Update, context: CallbackContext):
         """Управление настройками капчи"""
         try:
@@ -3863,8 +4894,7 @@ class VFSBot:
             
             # Тест 1: Проверка импорта модулей
             try:
-                import cv2
-                import pytesseract
+                load_ocr_stack()
                 test_results.append("✅ OpenCV и Tesseract доступны")
             except ImportError as e:
                 test_results.append(f"❌ Ошибка импорта: {e}")
@@ -4494,6 +5524,8 @@ class VFSBot:
                     logger.info("✅ Браузер закрыт")
                 except Exception as e:
                     logger.warning(f"⚠️ Ошибка при закрытии браузера: {e}")
+            self._discard_standby()
+            self._leave_cluster()
             
             logger.info("🛑 БОТ ОСТАНОВЛЕН")
             await update.message.reply_text("✅ Бот успешно остановлен.\n🔴 Все процессы завершены.")
@@ -4568,6 +5600,45 @@ class VFSBot:
         if "offline" in self.browser.page_source:
             return True
     
+    def _document_digest(self, path):
+        """Content hash of a document, recomputed only when its size or mtime changes"""
+        stat = os.stat(path)
+        cached = self._document_digests.get(path)
+        if cached and cached[0] == (stat.st_size, stat.st_mtime):
+            return cached[1]
+        digest = file_digest(path)
+        self._document_digests[path] = ((stat.st_size, stat.st_mtime), digest)
+        return digest
+    
+    async def _stage_documents_for_booking(self):
+        """Upload the applicant's photo for the booking, skipping content already staged in this session"""
+        try:
+            photo_path = os.path.abspath(self.photo_path) if self.photo_path else ''
+            if not photo_path or not os.path.exists(photo_path):
+                logger.warning(f"⚠️ Файл фото не найден: {photo_path or 'не задан'}")
+                return False
+            
+            upload_fields = self.browser.find_elements(by=By.NAME, value='file_upload')
+            if not upload_fields:
+                logger.debug("📸 Поле загрузки фото на странице бронирования не найдено")
+                return False
+            
+            digest = self._document_digest(photo_path)
+            staged_key = (getattr(self.browser, 'session_id', None), self.person_id, 'file_upload')
+            # Same content already attached in this browser session - skip the transfer
+            if self._staged_uploads.get(staged_key) == digest and upload_fields[0].get_attribute('value'):
+                logger.debug(f"📸 Фото уже загружено в этой сессии ({digest[:12]}), пропуск")
+                return True
+            
+            upload_fields[0].send_keys(photo_path)
+            self._staged_uploads[staged_key] = digest
+            logger.info(f"✅ Фото загружено для бронирования: {photo_path}")
+            await asyncio.sleep(2)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось загрузить фото: {e}")
+            return False
+    
     async def confirm_appointment_for_person(self, context, person_name):
         """Enhanced automatic appointment confirmation for specific person"""
         try:
@@ -4588,13 +5659,7 @@ class VFSBot:
                 '//button[contains(text(), "Book")]'
             ]
             
-            earliest_link = None
-            for selector in date_selectors:
-                try:
-                    earliest_link = self.browser.find_element(by=By.XPATH, value=selector)
-                    break
-                except:
-                    continue
+            earliest_link, _ = await self._wait_for_any([(By.XPATH, selector) for selector in date_selectors], timeout=10)
             
             if earliest_link:
                 earliest_link.click()
@@ -4608,12 +5673,17 @@ class VFSBot:
             
             # Wait for time selection to appear
             await asyncio.sleep(3)
-            WebDriverWait(self.browser, 30).until(EC.presence_of_element_located((
-                By.XPATH, '//*[@id="TimeSlotId"]')))
+            time_slot_element, _ = await self._wait_for_any([
+                (By.ID, 'TimeSlotId'),
+                (By.NAME, 'TimeSlotId'),
+                (By.CSS_SELECTOR, "select[id*='TimeSlot'], select[name*='TimeSlot']"),
+            ], timeout=30)
+            if time_slot_element is None:
+                raise Exception("Не найдено поле выбора времени TimeSlotId")
             
             # Select first available time slot
             try:
-                time_select = Select(self.browser.find_element(by=By.XPATH, value='//*[@id="TimeSlotId"]'))
+                time_select = Select(time_slot_element)
                 options = time_select.options
                 if len(options) > 1:  # First option is usually "Select..."
                     time_select.select_by_index(1)
@@ -4634,6 +5704,9 @@ class VFSBot:
             
             await asyncio.sleep(2)
             
+            # Upload documents only now that a slot is actually being booked
+            await self._stage_documents_for_booking()
+            
             # Find and click confirmation button
             try:
                 # Try different button selectors
@@ -4647,16 +5720,15 @@ class VFSBot:
                 ]
                 
                 confirmed = False
-                for xpath in button_xpaths:
+                button, _ = await self._wait_for_any([(By.XPATH, xpath) for xpath in button_xpaths], timeout=10, clickable=True)
+                if button:
                     try:
-                        button = self.browser.find_element(by=By.XPATH, value=xpath)
                         button.click()
-                        confirmed = True
-                        logger.info("✅ Встреча подтверждена!")
-                        await asyncio.sleep(2)
-                        break
-                    except:
-                        continue
+                    except Exception:
+                        self.browser.execute_script("arguments[0].click();", button)
+                    confirmed = True
+                    logger.info("✅ Встреча подтверждена!")
+                    await asyncio.sleep(2)
                 
                 if confirmed:
                     # Send confirmation message
@@ -4687,38 +5759,174 @@ class VFSBot:
             logger.error(f"❌ Ошибка в legacy confirm_appointment: {e}")
             return False
             
+    def _availability_watch_call(self, since, timeout):
+        """One watcher round trip: install it (since=None) or long-poll it for a newer event"""
+        if since is None:
+            return self.browser.execute_script(AVAILABILITY_WATCHER_SCRIPT, self._no_seats_text())
+        return self.browser.execute_async_script(AVAILABILITY_WAIT_SCRIPT, since, int(timeout * 1000))
+    
+    def _set_script_timeout(self, seconds):
+        """Set the session's async script timeout and return the previous one"""
+        previous = self.browser.timeouts.script
+        self.browser.set_script_timeout(seconds)
+        return previous
+    
+    async def _wait_for_availability(self, states, timeout):
+        """
+        Wait until the in-page watcher pushes a state in `states` ('no_seats', 'date', 'pending').
+        Returns the last event seen, or None if the watcher could not be used.
+        """
+        loop = asyncio.get_event_loop()
+        previous_timeout = None
+        try:
+            # Long polls run in a thread so Telegram handlers keep running meanwhile
+            event = await loop.run_in_executor(None, self._availability_watch_call, None, 0)
+            if event is None:
+                return None
+            previous_timeout = self._set_script_timeout(AVAILABILITY_POLL_SLICE + 10)
+            deadline = time.monotonic() + timeout
+            while event.get('state') not in states:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                pushed = await loop.run_in_executor(None, self._availability_watch_call, event['seq'],
+                                                    min(remaining, AVAILABILITY_POLL_SLICE))
+                if pushed is None:
+                    break
+                event = pushed
+            return event
+        except Exception as e:
+            logger.debug(f"⚠️ Наблюдатель доступности недоступен: {e}")
+            return None
+        finally:
+            if previous_timeout is not None:
+                try:
+                    self.browser.set_script_timeout(previous_timeout)
+                except Exception:
+                    pass
+    
+    def _cdp_session(self):
+        """Direct DevTools session of the current page (None when unavailable)"""
+        if not self.cdp_enabled or self.grid or not self.browser:
+            return None
+        key = self.browser.session_id
+        if self.cdp is not None and self._cdp_key == key:
+            return self.cdp
+        self._close_cdp()
+        if self._cdp_failed_for == key:
+            return None
+        try:
+            address = self.browser.capabilities.get('goog:chromeOptions', {}).get('debuggerAddress')
+            if not address:
+                raise LookupError("no debuggerAddress capability")
+            self.cdp = CdpSession.for_page(address, self.browser.current_window_handle, timeout=self.cdp_timeout)
+            self._cdp_key = key
+            logger.debug(f"🔌 CDP подключен напрямую: {self.cdp.ws_url}")
+        except Exception as e:
+            self._cdp_failed_for = key
+            logger.info(f"ℹ️ Прямое подключение CDP недоступно ({e}) - чтение через WebDriver")
+        return self.cdp
+    
+    def _close_cdp(self):
+        if self.cdp is not None:
+            self.cdp.close()
+        self.cdp = None
+        self._cdp_key = None
+    
+    def _hot_read(self, via_webdriver=False):
+        """
+        URL, readyState and title in one read: over CDP if possible,
+        else one execute_script. Liveness checks pass via_webdriver=True, since CDP
+        answers even when chromedriver or the WebDriver session is gone.
+        """
+        session = None if via_webdriver else self._cdp_session()
+        if session is not None:
+            try:
+                return session.evaluate(HOT_READ_SCRIPT)
+            except Exception as e:
+                # Reconnected on the next read
+                logger.debug(f"⚠️ Чтение через CDP не удалось: {e}")
+                self._close_cdp()
+        return self.browser.execute_script(HOT_READ_SCRIPT)
+    
+    def _read_network_availability(self):
+        """Availability from the page's own API responses since the last read (None if there were none)"""
+        try:
+            responses = availability_responses(self.browser.get_log('performance'), self.network_url_patterns)
+        except Exception as e:
+            logger.debug(f"⚠️ Журнал производительности недоступен: {e}")
+            return None
+        availability = None
+        for request_id, url, status in responses:
+            try:
+                body = self.browser.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+            except Exception as e:
+                logger.debug(f"⚠️ Тело ответа {url} недоступно: {e}")
+                continue
+            text = body.get('body', '')
+            if body.get('base64Encoded'):
+                text = base64.b64decode(text).decode('utf-8', 'replace')
+            parsed = parse_availability_payload(text, source=url)
+            if parsed is not None:
+                logger.debug(f"🛰️ Ответ доступности {url}: {len(parsed['dates'])} дат, нет мест: {parsed['no_seats']}")
+                availability = parsed
+        return availability
+    
+    async def _wait_for_network_availability(self, timeout):
+        """Poll the performance log until an availability response arrives (None after `timeout`)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            availability = self._read_network_availability()
+            if availability is not None or time.monotonic() >= deadline:
+                return availability
+            await asyncio.sleep(0.5)
+    
+    def _open_record(self):
+        """Last notified date file of the current watch target (created with '0' on first use)"""
+        path = self.watch_target['record_path']
+        if not os.path.exists(path):
+            with open(path, 'w') as records:
+                records.write('0')
+        return open(path, "r+")
+    
     async def check_appointment(self, update, context):
         person_name = f"{self.first_name} {self.last_name}"
         logger.debug(f"🔍 ПРОВЕРКА ВСТРЕЧ для {person_name}...")
         
         # CRITICAL: Ensure Latvia category is always selected before appointment check
-        await self._verify_latvia_category_selected()
+        with self._trace_phase('verify_category'):
+            await self._verify_latvia_category_selected()
         
         await asyncio.sleep(5)
+        # Consumes the responses captured before this check; an availability response
+        # among them shows the session is live, so page_source need not be read
+        recent = self._read_network_availability() if self.network_capture else None
     
         try:
             # First, check if we're on the correct page
-            current_url = self.browser.current_url.lower()
-            page_source = self.browser.page_source.lower()
+            with self._trace_phase('page_read'):
+                current_url = self._hot_read()['url'].lower()
+                raw_page_source = self.browser.page_source if recent is None else None
+            if raw_page_source is None:
+                page_source = ''
+                self._trace_set(page_state='ok')
+            else:
+                page_source = raw_page_source.lower()
+                self._trace_set(page_state=self._detect_page_state(raw_page_source))
             
             # Check if we're on login page (indicates need to re-login)
             if any(indicator in current_url for indicator in ["login", "signin", "auth"]) or \
                any(indicator in page_source for indicator in ["email", "password", "login"]):
                 logger.warning("⚠️ Обнаружена страница входа - требуется повторная авторизация")
+                self._trace_set(outcome='relogin')
                 
-                # Check for login loop protection
-                if not hasattr(self, '_login_attempts'):
-                    self._login_attempts = 0
-                    
-                self._login_attempts += 1
-                
-                if self._login_attempts > 5:
-                    logger.error("🚨 Превышено количество попыток входа (5) - остановка проверки на 10 минут")
-                    await asyncio.sleep(600)  # Wait 10 minutes before trying again
-                    self._login_attempts = 0
-                    return
+                # Login loop protection: this applicant's breaker opens, the others keep running
+                breaker = self._breaker()
+                if breaker.record_failure('relogin'):
+                    logger.error(f"🚨 Превышено количество попыток входа ({breaker.failure_threshold}) - {person_name} отключен на {breaker.remaining():.0f} сек")
+                    raise CircuitOpen(f"{person_name}: login loop")
                 
-                logger.info(f"🔄 Возвращаемся к процессу входа... (попытка {self._login_attempts}/5)")
+                logger.info(f"🔄 Возвращаемся к процессу входа... (попытка {breaker.failures}/{breaker.failure_threshold})")
                 
                 # Add delay before re-login attempt
                 await asyncio.sleep(10)
@@ -4767,30 +5975,21 @@ class VFSBot:
             ]
             
             appointment_element_found = False
+            appointment_candidates = {selector for _, selector in self._mirror_candidates(
+                [(By.XPATH, selector) for selector in appointment_selectors])}
             for i, selector in enumerate(appointment_selectors):
+                if selector not in appointment_candidates:
+                    continue
                 try:
                     elements = self.browser.find_elements(by=By.XPATH, value=selector)
                     for element in elements:
                         if element and element.is_displayed() and element.is_enabled():
-                            # Try multiple click methods
-                            click_methods = [
-                                ("regular_click", lambda: element.click()),
-                                ("javascript_click", lambda: self.browser.execute_script("arguments[0].click();", element)),
-                                ("action_chains", lambda: ActionChains(self.browser).move_to_element(element).click().perform()),
-                                ("scroll_and_click", lambda: (self.browser.execute_script("arguments[0].scrollIntoView();", element), element.click())),
-                            ]
-                            
-                            for method_name, click_method in click_methods:
-                                try:
-                                    click_method()
-                                    logger.info(f"✅ Элемент записи успешно нажат (селектор {i+1}, метод {method_name})")
-                                    appointment_element_found = True
-                                    break
-                                except Exception as e:
-                                    logger.debug(f"🔍 Метод {method_name} не удался: {e}")
-                                    continue
-                            
-                            if appointment_element_found:
+                            # Learned click method first, the others as fallbacks
+                            method_name = await self._click_with_strategies(element, 'appointment_link', page='dashboard')
+                            if method_name:
+                                logger.info(f"✅ Элемент записи успешно нажат (селектор {i+1}, метод {method_name})")
+                                self._trace_set(selector=selector)
+                                appointment_element_found = True
                                 break
                     
                     if appointment_element_found:
@@ -4800,8 +5999,10 @@ class VFSBot:
                     logger.debug(f"🔍 Селектор {i+1} не удался: {e}")
                     continue
             
+            self._trace_lap('appointment_link')
             if not appointment_element_found:
                 logger.warning("⚠️ Не удалось найти элементы для записи на встречу")
+                self._trace_set(outcome='no_appointment_link')
                 
                 # Enhanced page analysis for better diagnostics
                 try:
@@ -4846,30 +6047,35 @@ class VFSBot:
         
             # Enhanced LocationId handling with better error recovery
             location_id_success = await self._handle_location_id_with_recovery()
+            self._trace_lap('location')
             if not location_id_success:
                 logger.warning("⚠️ Не удалось обработать LocationId, пропускаем...")
+                self._trace_set(outcome='location_failed')
                 return
         
-            await asyncio.sleep(3)
-            
-            # Upload photo file
-            try:
-                logger.debug("📸 Попытка загрузки фото...")
-                file_upload_element = self.browser.find_element(by=By.NAME, value='file_upload')
-                photo_path = os.path.abspath(self.photo_path)
-                if os.path.exists(photo_path):
-                    file_upload_element.send_keys(photo_path)
-                    logger.debug(f"✅ Фото загружено: {photo_path}")
-                    await asyncio.sleep(2)
-                else:
-                    logger.warning(f"⚠️ Файл фото не найден: {photo_path}")
-            except Exception as e:
-                logger.warning(f"⚠️ Не удалось загрузить фото: {e}")
-
-            logger.debug("📋 Проверка доступности встреч...")        
-            if "There are no open seats available for selected center - Belgium Long Term Visa Application Center-Tehran" in self.browser.page_source:
+            # Documents are uploaded only when a slot is booked (_stage_documents_for_booking)
+
+            logger.debug("📋 Проверка доступности встреч...")
+            # The in-page watcher reports "no seats" as soon as the page shows it
+            watcher_event = None
+            if self.availability_watcher:
+                watcher_event = await self._wait_for_availability(('no_seats', 'date'), self.availability_settle_timeout)
+            if watcher_event is None:
+                await asyncio.sleep(3)
+            # An availability response the page already fetched beats reading the DOM
+            network = self._read_network_availability() if self.network_capture else None
+            if network is not None and network['no_seats']:
+                no_seats = True
+                self._trace_set(selector='network')
+            elif watcher_event is not None:
+                no_seats = watcher_event.get('state') == 'no_seats'
+            else:
+                no_seats = self._no_seats_text() in self.browser.page_source
+            if no_seats:
                 logger.info(f"📭 Нет доступных мест для {person_name}")
-                records = open("record.txt", "r+")
+                self._trace_lap('availability')
+                self._trace_set(outcome='no_slots', page_state='no_seats')
+                records = self._open_record()
                 last_date = records.readlines()[-1]
                 
                 if last_date != '0':
@@ -4881,21 +6087,43 @@ class VFSBot:
             else:
                 logger.info(f"✅ Найдены доступные встречи для {person_name}!")
                 select = Select(self.browser.find_element(by=By.XPATH, value='//*[@id="VisaCategoryId"]'))
-                select.select_by_value('1314')
+                select.select_by_value(self.watch_target['category'])
                 logger.debug("✅ Категория виз выбрана")
                 
-                WebDriverWait(self.browser, 100).until(EC.presence_of_element_located((
-                    By.XPATH, '//*[@id="dvEarliestDateLnk"]')))
-        
-                await asyncio.sleep(2)
-                new_date = self.browser.find_element(by=By.XPATH, 
-                               value='//*[@id="lblDate"]').get_attribute('innerHTML')
+                # All dates come from the page's availability response when it is captured;
+                # otherwise the earliest date arrives as a pushed watcher event, and
+                # WebDriver polling is the last fallback
+                network = None
+                if self.network_capture:
+                    network = await self._wait_for_network_availability(self.network_timeout)
+                if network is not None and network['dates']:
+                    new_date = network['earliest']
+                    self._trace_set(selector='network', slot_dates=network['dates'])
+                    logger.info(f"📆 Доступные даты ({len(network['dates'])}): {', '.join(network['dates'][:10])}")
+                else:
+                    watcher_event = None
+                    if self.availability_watcher:
+                        watcher_event = await self._wait_for_availability(('date',), self.availability_date_timeout)
+                    if watcher_event is not None:
+                        if watcher_event.get('state') != 'date':
+                            raise TimeoutException(f"earliest date not shown within {self.availability_date_timeout:.0f}s")
+                        new_date = watcher_event['date']
+                        self._trace_set(selector='watcher')
+                    else:
+                        WebDriverWait(self.browser, self.availability_date_timeout).until(EC.presence_of_element_located((
+                            By.XPATH, '//*[@id="dvEarliestDateLnk"]')))
+                
+                        await asyncio.sleep(2)
+                        new_date = self.browser.find_element(by=By.XPATH, 
+                                       value='//*[@id="lblDate"]').get_attribute('innerHTML')
                 logger.debug(f"📅 Новая дата: {new_date}")
+                self._trace_lap('availability')
+                self._trace_set(outcome='slot_found', slot_date=new_date)
                 
-                records = open("record.txt", "r+")
+                records = self._open_record()
                 last_date = records.readlines()[-1]
 
-                if new_date != last_date and len(new_date) > 0:
+                if new_date != last_date and len(new_date) > 0 and self._claim_slot_alert(new_date):
                     msg = f"🎉 ВСТРЕЧА ДОСТУПНА НА: {new_date}"
                     logger.info(msg)
                     person_name = f"{self.first_name} {self.last_name}"
@@ -4958,6 +6186,8 @@ class VFSBot:
                                                  text=f"ℹ️ Подтвердите встречу вручную для {person_name}")
                 else:
                     logger.debug(f"📅 Дата не изменилась или пуста (старая: {last_date})")
+        except CircuitOpen:
+            raise
         except Exception as e:
             logger.error(f"❌ Ошибка при проверке встреч для {person_name}: {e}", exc_info=True)
             raise
@@ -4966,5 +6196,257 @@ class VFSBot:
         #update.message.reply_text("Checked!", disable_notification=True)
         return True
 
+def run_shard_worker(index, count, outbox, inbox):
+    """Entry point of a shard worker process"""
+    formatter = logging.Formatter(f'%(asctime)s - %(name)s[shard{index}] - %(levelname)s - %(message)s',
+                                  datefmt='%Y-%m-%d %H:%M:%S')
+    for handler in logger.handlers:
+        handler.setFormatter(formatter)
+    VFSBot(shard=(index, count, outbox, inbox))
+
+
+class ShardSupervisor:
+    """Owns the Telegram bot and runs applicant shards in restartable worker processes ([SHARDING])"""
+    
+    def __init__(self, config):
+        self.config = config
+        self.channel_id = config.get('TELEGRAM', 'channel_id')
+        admin_ids_str = config.get('TELEGRAM', 'admin_ids', fallback='').strip()
+        admin_ids = [int(x.strip()) for x in admin_ids_str.split() if x.strip()] if admin_ids_str else []
+        self.admin_handler = AdminHandler(admin_ids)
+        
+        applicants = self._count_applicants(config)
+        workers = config.getint('SHARDING', 'workers', fallback=0) or os.cpu_count() or 1
+        self.shard_count = max(1, min(workers, applicants))
+        self.restart_delay = config.getint('SHARDING', 'restart_delay', fallback=10)
+        self.heartbeat_timeout = config.getint('SHARDING', 'heartbeat_timeout', fallback=120)
+        self.events_path = config.get('EVENTS', 'path', fallback='events/events.jsonl')
+        
+        # spawn: workers start clean (no forked Selenium/Telegram state), same behaviour on Windows and Linux
+        self.mp = multiprocessing.get_context('spawn')
+        self.outbox = self.mp.Queue()
+        self.workers = {}  # index -> {'process', 'inbox', 'started', 'heartbeat', 'restarts', 'stats'}
+        self.captcha_owners = {}  # captcha photo message_id -> shard index
+        self.running = False
+        
+        logger.info(f"🧩 Режим шардов: {applicants} заявителей на {self.shard_count} процессов")
+        self.app = ApplicationBuilder().token(config.get('TELEGRAM', 'auth_token')).build()
+        self.app.add_handler(CommandHandler("start", self.start))
+        self.app.add_handler(CommandHandler("help", self.help))
+        self.app.add_handler(CommandHandler("quit", self.quit))
+        self.app.add_handler(CommandHandler("status", self.status))
+        self.app.add_handler(CommandHandler("stat", self.status))
+        self.app.add_handler(CommandHandler("restart", self.restart))
+        self.app.add_handler(CommandHandler("events", self.events_command))
+        self.app.add_handler(MessageHandler(
+                self.admin_handler.filter_admin() & filters.REPLY & filters.TEXT & ~filters.COMMAND,
+                self.captcha_reply))
+        self.app.add_handler(MessageHandler(
+                self.admin_handler.filter_admin(),
+                self.admin_handler.unauthorized_access))
+        self.app.post_init = self.post_init
+        self.app.post_shutdown = self.post_shutdown
+    
+    @staticmethod
+    def _count_applicants(config):
+        """Applicants VFSBot._load_persons would load (VFS + consecutive PERSONn with a first name)"""
+        count = 1 if config.get('VFS', 'first_name', fallback='') else 0
+        index = 1
+        while config.has_section(f'PERSON{index}'):
+            if config.get(f'PERSON{index}', 'first_name', fallback=''):
+                count += 1
+            index += 1
+        return count
+    
+    def run(self):
+        self.app.run_polling()
+    
+    def _spawn(self, index):
+        inbox = self.mp.Queue()
+        process = self.mp.Process(target=run_shard_worker, args=(index, self.shard_count, self.outbox, inbox),
+                                  name=f'vfs-shard{index}')
+        process.start()
+        worker = self.workers.setdefault(index, {'restarts': -1, 'stats': {}})
+        worker.update(process=process, inbox=inbox, started=time.monotonic(), heartbeat=time.monotonic())
+        worker['restarts'] += 1
+        logger.info(f"🧩 Шард {index + 1}/{self.shard_count} запущен (pid {process.pid})")
+    
+    def _stop_worker(self, index, timeout=15):
+        worker = self.workers[index]
+        try:
+            worker['inbox'].put({'type': 'stop'})
+        except Exception:
+            pass
+        worker['process'].join(timeout)
+        if worker['process'].is_alive():
+            worker['process'].terminate()
+            worker['process'].join(5)
+    
+    def _start_all(self):
+        self.running = True
+        for index in range(self.shard_count):
+            self._spawn(index)
+    
+    async def post_init(self, application):
+        self._start_all()
+        self._pump_task = asyncio.create_task(self._pump())
+        self._watchdog_task = asyncio.create_task(self._watchdog())
+    
+    async def post_shutdown(self, application):
+        self.running = False
+        loop = asyncio.get_running_loop()
+        for index in list(self.workers):
+            await loop.run_in_executor(None, self._stop_worker, index)
+    
+    def _next_message(self):
+        try:
+            return self.outbox.get(timeout=1)
+        except queue.Empty:
+            return None
+    
+    async def _pump(self):
+        """Serve worker -> supervisor messages: heartbeats and proxied bot calls"""
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._next_message)
+            if message is None:
+                continue
+            worker = self.workers.get(message.get('shard'))
+            if worker is None:
+                continue
+            if message['type'] == 'heartbeat':
+                worker['heartbeat'] = time.monotonic()
+                worker['stats'] = message['stats']
+            elif message['type'] == 'call':
+                asyncio.create_task(self._perform_call(message, worker))
+    
+    async def _perform_call(self, message, worker):
+        try:
+            result = await getattr(self.app.bot, message['method'])(**message['kwargs'])
+            value = {'message_id': getattr(result, 'message_id', None)}
+            if message['method'] == 'send_photo' and value['message_id']:
+                # Captcha photos: the admin's reply is routed back to this shard
+                self.captcha_owners[value['message_id']] = message['shard']
+        except Exception as e:
+            logger.error(f"❌ Ошибка Telegram-вызова {message['method']} от шарда {message['shard']}: {e}")
+            value = {'error': str(e)}
+        worker['inbox'].put({'type': 'result', 'id': message['id'], 'value': value})
+    
+    async def _watchdog(self):
+        """Restart workers that exited or stopped sending heartbeats"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(5)
+            if not self.running:
+                continue
+            for index, worker in list(self.workers.items()):
+                process = worker['process']
+                alive = process.is_alive()
+                if alive and time.monotonic() - worker['heartbeat'] < self.heartbeat_timeout:
+                    continue
+                if time.monotonic() - worker['started'] < self.restart_delay:
+                    continue
+                reason = f"нет heartbeat {self.heartbeat_timeout} сек" if alive else f"процесс завершился (код {process.exitcode})"
+                logger.warning(f"♻️ Перезапуск шарда {index + 1}: {reason}")
+                if alive:
+                    process.terminate()
+                    await loop.run_in_executor(None, process.join, 5)
+                self._spawn(index)
+                try:
+                    await self.app.bot.send_message(chat_id=self.channel_id,
+                                                    text=f"♻️ Шард {index + 1} перезапущен: {reason}")
+                except Exception as e:
+                    logger.debug(f"⚠️ Не удалось уведомить о перезапуске шарда: {e}")
+    
+    async def start(self, update: Update, context: CallbackContext):
+        if self.running:
+            await update.message.reply_text(f"✅ Шарды уже работают ({self.shard_count} процессов)")
+            return
+        self._start_all()
+        await update.message.reply_text(f"🚀 Запущено шардов: {self.shard_count}")
+    
+    async def quit(self, update: Update, context: CallbackContext):
+        self.running = False
+        loop = asyncio.get_running_loop()
+        for index in list(self.workers):
+            await loop.run_in_executor(None, self._stop_worker, index)
+        await update.message.reply_text("✅ Все шарды остановлены. /start - запустить снова")
+    
+    async def restart(self, update: Update, context: CallbackContext):
+        """Перезапуск одного шарда (использование: /restart N)"""
+        try:
+            index = int(context.args[0]) - 1
+            if index not in self.workers:
+                raise ValueError
+        except (IndexError, ValueError):
+            await update.message.reply_text(f"Использование: /restart N (1-{self.shard_count})")
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self._stop_worker, index)
+        self._spawn(index)
+        await update.message.reply_text(f"♻️ Шард {index + 1} перезапущен")
+    
+    async def status(self, update: Update, context: CallbackContext):
+        lines = [f"🧩 ШАРДЫ: {self.shard_count} процессов, {'🟢 АКТИВНЫ' if self.running else '🔴 ОСТАНОВЛЕНЫ'}"]
+        total_checks = 0
+        for index, worker in sorted(self.workers.items()):
+            stats = worker['stats']
+            total_checks += stats.get('check_count', 0)
+            heartbeat_age = time.monotonic() - worker['heartbeat']
+            lines.append(
+                f"\n{'🟢' if worker['process'].is_alive() else '🔴'} Шард {index + 1} (pid {worker['process'].pid}, "
+                f"перезапусков {worker['restarts']}, heartbeat {heartbeat_age:.0f}с назад)\n"
+                f"   👥 {', '.join(stats.get('applicants', [])) or '-'}\n"
+                f"   🔄 Проверок: {stats.get('check_count', 0)}, 🌐 браузер: {'да' if stats.get('browser') else 'нет'}"
+                f"{', ⛔ ' + ', '.join(stats['open_breakers']) if stats.get('open_breakers') else ''}")
+        lines.insert(1, f"🔄 Всего проверок: {total_checks}")
+        await update.message.reply_text("\n".join(lines))
+    
+    async def events_command(self, update: Update, context: CallbackContext):
+        """Сводка журнала событий всех шардов (использование: /events [часы])"""
+        hours = float(context.args[0]) if context.args else 24
+        since = datetime.now().timestamp() - hours * 3600
+        paths = [path for index in range(self.shard_count)
+                 for path in event_log_files(shard_path(self.events_path, index))]
+        summary = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: summarize_events(paths=paths, since=since))
+        lines = [f"🧾 ЖУРНАЛ СОБЫТИЙ (все шарды) за {hours:g} ч", f"📊 Записей: {summary['total']}"]
+        if summary['by_outcome']:
+            lines.append("🎯 Результаты: " + ", ".join(
+                f"{k}={v}" for k, v in sorted(summary['by_outcome'].items(), key=lambda kv: -kv[1])))
+        if summary['slots']:
+            ts, applicant, slot_date = summary['slots'][-1]
+            lines.append(f"📅 Последний слот: {slot_date} ({applicant})")
+        await update.message.reply_text("\n".join(lines))
+    
+    async def captcha_reply(self, update: Update, context: CallbackContext):
+        """Route an admin's captcha answer to the shard that sent the photo"""
+        message = update.message
+        answer = (message.text or '').strip()
+        message_id = message.reply_to_message.message_id if message.reply_to_message else None
+        index = self.captcha_owners.pop(message_id, None)
+        if index is None or not answer or index not in self.workers:
+            await message.reply_text("ℹ️ Нет ожидающей капчи для этого сообщения")
+            return
+        self.workers[index]['inbox'].put({'type': 'captcha_reply', 'message_id': message_id, 'answer': answer})
+        await message.reply_text(f"✅ Капча передана шарду {index + 1}: {answer}")
+    
+    async def help(self, update: Update, context: CallbackContext):
+        await update.message.reply_text(f"""🤖 Бот VFS в режиме шардов ({self.shard_count} процессов)
+
+/status, /stat - Состояние шардов и проверок
+/restart N - Перезапустить шард N
+/events - Сводка журнала событий всех шардов (использование: /events [часы])
+/quit - Остановить все шарды
+/start - Запустить шарды после /quit
+/help - Показать эту справку
+
+Капча: ответьте (reply) на фото капчи - ответ уйдет нужному шарду.
+Остальные команды доступны только без [SHARDING].""")
+
+
 if __name__ == '__main__':
-    VFSbot = VFSBot()
\ No newline at end of file
+    config = load_config(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini'))
+    if config is not None and config.getboolean('SHARDING', 'enabled', fallback=False):
+        ShardSupervisor(config).run()
+    else:
+        VFSbot = VFSBot()
\ No newline at end of file
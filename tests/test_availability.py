@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+# utils imports the Telegram stack at module level
+pytest.importorskip('telegram')
+
+from utils import availability_responses, parse_availability_payload, parse_slot_date
+
+
+def test_server_timestamp_is_not_a_slot():
+    payload = {"serverTime": "2026-10-19T10:00:00Z", "error": {"description": "No slots available"}}
+    availability = parse_availability_payload(json.dumps(payload))
+    assert availability['dates'] == []
+    assert availability['no_seats'] is True
+
+
+def test_vfs_month_first_dates():
+    availability = parse_availability_payload('[{"date":"11/20/2026"},{"date":"12/01/2026"}]', source='u')
+    assert availability == {'source': 'u', 'dates': ['2026-11-20', '2026-12-01'],
+                            'earliest': '11/20/2026', 'no_seats': False}
+
+
+def test_dates_only_from_date_keys():
+    payload = {"EarliestDate": "11/20/2026", "applicant": {"note": "2026-11-01"},
+               "updatedAt": "2026-10-19T10:00:00Z", "availableSlots": ["2026-11-25"]}
+    assert parse_availability_payload(payload)['dates'] == ['2026-11-20', '2026-11-25']
+
+
+def test_datetimes_and_numbers_are_rejected():
+    assert parse_slot_date('2026-10-19T10:00:00Z') is None
+    assert parse_slot_date('1792434555') is None
+    assert parse_availability_payload({"slotDate": "2026-10-19 10:00", "ts": 1792434555}) is None
+
+
+def test_unrelated_payloads():
+    assert parse_availability_payload({"status": "not available"}) is None
+    assert parse_availability_payload('<html></html>') is None
+
+
+def test_only_availability_endpoints_are_picked():
+    def entry(url, request_id, kind='XHR', status=200):
+        return {'message': json.dumps({'message': {'method': 'Network.responseReceived', 'params': {
+            'requestId': request_id, 'type': kind, 'response': {'url': url, 'status': status}}}})}
+
+    entries = [
+        entry('https://visa.vfsglobal.com/Global-Appointment/Account/GetEarliestVisaSlotDate', '1'),
+        entry('https://visa.vfsglobal.com/Global-Appointment/Account/GetEarliestVisaSlotDate', '2', status=500),
+        entry('https://cdn.example.com/calendar-widget.js', '3', kind='Script'),
+        entry('https://visa.vfsglobal.com/api/slot-banner', '4'),
+        {'message': 'Network.requestWillBeSent'},
+    ]
+    assert [request_id for request_id, _, _ in availability_responses(entries)] == ['1']
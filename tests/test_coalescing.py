@@ -0,0 +1,79 @@
+import asyncio
+import time
+from configparser import ConfigParser
+from types import SimpleNamespace
+
+import pytest
+
+# VFSBot imports the browser and Telegram stacks at module level
+pytest.importorskip('telegram')
+pytest.importorskip('selenium')
+pytest.importorskip('undetected_chromedriver')
+
+from utils import CheckCoalescer, EventLog, WatchMatrix, WeightedRoundRobin
+from VFSBot import VFSBot
+
+
+def person(name, category):
+    return {'name': name, 'first_name': name, 'last_name': 'TEST', 'appointment_category': category,
+            'appointment_type': 'D', 'weight': 1.0, 'deadline': '', 'passport_validity_date': '', 'watch': ''}
+
+
+def make_bot(persons, interval=0.2):
+    bot = VFSBot.__new__(VFSBot)
+    bot.config = ConfigParser()
+    bot.config.read_dict({'VFS': {'url': 'https://visa.vfsglobal.com/uzb/en/lva'}})
+    bot.url = bot.config.get('VFS', 'url')
+    bot.interval = interval
+    bot.persons = persons
+    bot.current_person_index = 0
+    bot.person_queue = WeightedRoundRobin()
+    bot._cycle_served = set()
+    bot.breakers = {}
+    bot.breaker_failure_threshold, bot.breaker_cooldown, bot.breaker_max_cooldown = 5, 600, 3600
+    bot.urgency_horizon_days, bot.urgency_boost = 90, 2.0
+    bot.cluster = None
+    bot.coalescer = CheckCoalescer()
+    bot.watch = WatchMatrix([])
+    bot.event_log = EventLog(enabled=False)
+    bot.reports = []
+
+    async def cycle_report():
+        bot.reports.append(time.time())
+    bot._send_cycle_completion_report = cycle_report
+    return bot
+
+
+def pick_names(bot, count):
+    async def pick():
+        names = [(bot._get_next_person() or {}).get('name') for _ in range(count)]
+        await asyncio.sleep(0)
+        return names
+    return asyncio.run(pick())
+
+
+def test_group_member_is_skipped_after_the_checker_sleeps():
+    bot = make_bot([person('A', 'WORK'), person('B', 'WORK'), person('C', 'STUDY')])
+    bot.person_id = 'A'
+    delay = 0.05
+    bot._share_check_result(SimpleNamespace(outcome='no_slots', record={}), delay)
+    time.sleep(delay)  # the checker's own wait before the next applicant is picked
+
+    # B shares A's key and stays covered; only the other group gets turns
+    assert pick_names(bot, 4) == ['C', 'C', 'C', 'C']
+
+
+def test_group_member_is_picked_once_coverage_expires():
+    bot = make_bot([person('A', 'WORK'), person('B', 'WORK')], interval=0.01)
+    bot.person_id = 'A'
+    bot._share_check_result(SimpleNamespace(outcome='no_slots', record={}), 0.01)
+    assert pick_names(bot, 1) == [None]
+    time.sleep(0.03)
+    assert pick_names(bot, 1)[0] in ('A', 'B')
+
+
+def test_slot_found_covers_nobody():
+    bot = make_bot([person('A', 'WORK'), person('B', 'WORK')])
+    bot.person_id = 'A'
+    assert bot._share_check_result(SimpleNamespace(outcome='slot_found', record={'slot_date': '11/20/2026'}), 1)
+    assert pick_names(bot, 2) == ['A', 'B']
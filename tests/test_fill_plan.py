@@ -0,0 +1,23 @@
+import pytest
+
+# utils imports the Telegram stack at module level
+pytest.importorskip('telegram')
+
+from utils import compile_fill_plan
+
+
+def steps(values):
+    return {step['field']: step for step in compile_fill_plan(values)}
+
+
+def test_date_fields_carry_an_iso_value():
+    plan = steps({'dateOfBirth': '07.08.1985', 'passportValidityDate': '2029-10-02'})
+    assert plan['dateOfBirth']['iso'] == '1985-08-07'
+    assert plan['dateOfBirth']['value'] == '07.08.1985'
+    assert plan['passportValidityDate']['iso'] == '2029-10-02'
+
+
+def test_unparseable_and_non_date_fields_have_no_iso_value():
+    plan = steps({'dateOfBirth': 'unknown', 'firstName': '02.10.2029'})
+    assert plan['dateOfBirth']['iso'] is None
+    assert plan['firstName']['iso'] is None
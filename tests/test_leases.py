@@ -0,0 +1,52 @@
+import pytest
+
+# utils imports the Telegram stack at module level
+pytest.importorskip('telegram')
+
+from utils import LeaseStore
+
+KEYS = ['anna', 'boris', 'clara', 'dmitri']
+START = 1000
+
+
+def cluster(*node_ids, ttl=90):
+    # The memory backend is per store; share one so the stores act as separate nodes
+    stores = [LeaseStore(node_id, backend='memory', ttl=ttl) for node_id in node_ids]
+    for store in stores[1:]:
+        store.backend = stores[0].backend
+    return stores
+
+
+def test_joining_node_gets_its_share():
+    a, b = cluster('a', 'b')
+    assert a.rebalance(KEYS, now=START) == set(KEYS)
+
+    # B sees A's leases as taken until A sheds them
+    assert b.rebalance(KEYS, now=START + 1) == set()
+    held_a = a.rebalance(KEYS, now=START + 2)
+    held_b = b.rebalance(KEYS, now=START + 3)
+
+    assert len(held_a) == len(held_b) == 2
+    assert held_a | held_b == set(KEYS)
+
+
+def test_expired_leases_are_taken_over():
+    a, b = cluster('a', 'b', ttl=90)
+    a.rebalance(KEYS, now=START)
+    b.rebalance(KEYS, now=START + 1)
+    a.rebalance(KEYS, now=START + 2)
+    b.rebalance(KEYS, now=START + 3)
+
+    # A stops heartbeating; once its node key and leases expire B holds everything
+    assert b.rebalance(KEYS, now=START + 200) == set(KEYS)
+    assert b.status(now=START + 200)['nodes'] == ['b']
+
+
+def test_alert_is_sent_by_one_node():
+    a, b = cluster('a', 'b')
+
+    assert a.claim_once('slot:2029-10-02', ttl=300, now=START)
+    assert not b.claim_once('slot:2029-10-02', ttl=300, now=START + 5)
+    assert a.claim_once('slot:2029-10-02', ttl=300, now=START + 10)
+    # After the ttl the event may be announced again
+    assert b.claim_once('slot:2029-10-02', ttl=300, now=START + 400)
@@ -0,0 +1,50 @@
+import pytest
+
+# VFSBot imports the browser and Telegram stacks at module level
+pytest.importorskip('telegram')
+pytest.importorskip('selenium')
+pytest.importorskip('undetected_chromedriver')
+
+from VFSBot import AVAILABILITY_WAIT_SCRIPT, HOT_READ_SCRIPT, DomMirrorListener
+
+
+class Mirror:
+    def __init__(self):
+        self.invalidations = 0
+
+    def invalidate(self):
+        self.invalidations += 1
+
+
+def test_navigation_is_reported_without_a_mirror():
+    navigations = []
+    listener = DomMirrorListener(None, on_navigate=lambda: navigations.append(1))
+
+    listener.after_navigate_to('https://visa.vfsglobal.com/uzb/en/lva', None)
+    listener.after_navigate_back(None)
+    listener.after_click(None, None)
+
+    assert navigations == [1, 1]
+
+
+def test_page_changes_invalidate_the_mirror():
+    mirror = Mirror()
+    listener = DomMirrorListener(mirror)
+
+    listener.after_navigate_to('https://visa.vfsglobal.com/uzb/en/lva', None)
+    listener.after_click(None, None)
+    listener.after_change_value_of(None, None)
+
+    assert mirror.invalidations == 3
+
+
+def test_read_only_scripts_keep_the_mirror():
+    mirror = Mirror()
+    listener = DomMirrorListener(mirror)
+
+    listener.after_execute_script(HOT_READ_SCRIPT, None)
+    listener.after_execute_script(AVAILABILITY_WAIT_SCRIPT, None)
+    assert mirror.invalidations == 0
+
+    listener.after_execute_script("arguments[0].click();", None)
+    assert mirror.invalidations == 1
@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+# utils imports the Telegram stack at module level
+pytest.importorskip('telegram')
+
+from utils import PollScheduler
+
+URL = 'https://visa.vfsglobal.com/uzb/en/lva'
+
+
+def scheduler(**options):
+    # Shipped defaults: interval = 30, min_interval = 30, hot_factor = 0.5
+    settings = dict(base_interval=30, min_interval=30, hot_factor=0.5, hot_min_releases=1, jitter=0)
+    settings.update(options)
+    return PollScheduler(**settings)
+
+
+def test_hot_window_gets_a_shorter_delay():
+    poll = scheduler()
+    now = 1_800_000_000
+    poll.learn_release(URL, now - 7 * 24 * 3600)  # same hour last week
+    assert poll.record('A|hot', URL, 'no_slots', now=now) == 15
+    assert poll.record('A|cold', URL + '/other', 'no_slots', now=now) == 30
+
+
+def test_hot_window_respects_its_own_floor():
+    poll = scheduler(hot_factor=0.1, hot_min_interval=10)
+    now = 1_800_000_000
+    poll.learn_release(URL, now)
+    assert poll.record('A', URL, 'no_slots', now=now) == 10
+
+
+def test_jitter_spreads_both_ways_at_the_floor():
+    random.seed(1)
+    poll = scheduler(jitter=0.2)
+    delays = [poll.record('A', URL, 'no_slots', now=1_800_000_000) for _ in range(50)]
+    assert min(delays) < 30 < max(delays)
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import pytest
+
+# VFSBot imports the browser and Telegram stacks at module level
+pytest.importorskip('telegram')
+pytest.importorskip('selenium')
+pytest.importorskip('undetected_chromedriver')
+
+from VFSBot import VFSBot
+
+
+def make_worker(**fields):
+    worker = SimpleNamespace(
+        persons=[{'name': 'PERSON1', 'first_name': 'ALI', 'last_name': 'VALIEV'}],
+        check_count=0, person_stats={}, browser=None, person_id='PERSON1',
+        time_to_first_check=None, breakers={},
+    )
+    worker.__dict__.update(fields)
+    return worker
+
+
+def test_shard_stats_after_a_check():
+    worker = make_worker(check_count=1, person_stats={'ALI VALIEV': 1})
+    stats = VFSBot._shard_stats(worker)
+    assert stats['person_stats'] == {'ALI VALIEV': 1}
+    assert stats['check_count'] == 1
+
+
+def test_slot_alert_goes_through_the_proxy():
+    import asyncio
+    import queue
+
+    from utils import ShardBotProxy
+
+    outbox = queue.Queue()
+    worker = make_worker(shard=(0, 2, outbox, None), app=SimpleNamespace(bot=ShardBotProxy(0, outbox)))
+    context = VFSBot._auto_context(worker)
+
+    async def alert():
+        sending = asyncio.ensure_future(context.bot.send_message(chat_id='42', text='🎉 ВСТРЕЧА ДОСТУПНА!'))
+        await asyncio.sleep(0)
+        call = outbox.get_nowait()
+        context.bot.deliver(call['id'], {'message_id': 7})
+        return call, await sending
+
+    call, sent = asyncio.run(alert())
+    assert call['method'] == 'send_message'
+    assert call['kwargs'] == {'chat_id': '42', 'text': '🎉 ВСТРЕЧА ДОСТУПНА!'}
+    assert sent.message_id == 7
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+# VFSBot imports the browser and Telegram stacks at module level
+pytest.importorskip('telegram')
+pytest.importorskip('selenium')
+pytest.importorskip('undetected_chromedriver')
+
+from VFSBot import VFSBot
+
+
+class StopWorker(Exception):
+    pass
+
+
+class OnePass:
+    """Stands in for the wake event so the worker loop runs exactly once."""
+
+    def wait(self, timeout):
+        raise StopWorker
+
+    def clear(self):
+        pass
+
+
+def make_bot(spare):
+    bot = VFSBot.__new__(VFSBot)
+    bot._standby = spare
+    bot._standby_lock = threading.Lock()
+    bot._standby_wake = OnePass()
+    bot.standby_health_interval = 0
+    bot.started = False
+    bot.browser = None
+    bot.quit = []
+    bot._quit_driver = bot.quit.append
+    return bot
+
+
+def test_dead_spare_is_replaced():
+    spare = ('driver', None)
+    bot = make_bot(spare)
+    bot._driver_alive = lambda driver: False
+
+    with pytest.raises(StopWorker):
+        bot._standby_worker()
+
+    assert bot._standby is None
+    assert bot.quit == ['driver']
+
+
+def test_spare_promoted_during_the_check_is_kept():
+    spare = ('driver', None)
+    bot = make_bot(spare)
+
+    def promoted_meanwhile(driver):
+        # _promote_standby takes the spare while the health check is running
+        bot._standby, bot.browser = None, driver
+        return False
+
+    bot._driver_alive = promoted_meanwhile
+
+    with pytest.raises(StopWorker):
+        bot._standby_worker()
+
+    assert bot.quit == []
+    assert bot.browser == 'driver'
@@ -1,15 +1,38 @@
-import cv2
 import re
-import pytesseract
-import telegram
-import numpy as np
 import os
+import asyncio
+import json
+import gzip
+import hashlib
+import time
+import random
 import logging
+import threading
+import sqlite3
+import itertools
+import urllib.request
+from collections import deque
+from types import SimpleNamespace
+from contextlib import contextmanager
 from datetime import datetime
 from configparser import ConfigParser
-from telegram import Update
-from telegram.ext import filters, CallbackContext
-from PIL import Image
+
+# Import timings collected during startup and on lazy first use: {module: seconds}
+IMPORT_PROFILE = {}
+
+@contextmanager
+def import_timer(name):
+    """Record how long the first import of `name` inside the block takes."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        IMPORT_PROFILE.setdefault(name, time.perf_counter() - started)
+
+with import_timer('telegram'):
+    import telegram
+    from telegram import Update
+    from telegram.ext import filters, CallbackContext
 
 # Configure logging
 def setup_logger():
@@ -56,20 +79,94 @@ def setup_logger():
 
 logger = setup_logger()
 
-# Load configuration
-config = ConfigParser()
-config.read('config.ini')
-
-# Set Tesseract path from config if available
-if config.has_section('OCR') and config.has_option('OCR', 'tesseract_path'):
-    tesseract_path = config.get('OCR', 'tesseract_path')
-    if os.path.exists(tesseract_path):
-        pytesseract.pytesseract.tesseract_cmd = tesseract_path
-    else:
-        print(f"Предупреждение: путь Tesseract в конфигурации ({tesseract_path}) не существует.")
-else:
-    # Default path as fallback
-    pytesseract.pytesseract.tesseract_cmd = 'C:/Program Files/Tesseract-OCR/tesseract.exe'
+_config_cache = {}
+
+def load_config(path=None):
+    """
+    Read config.ini once per process and share the parsed object.
+    
+    Args:
+        path: Path to the config file (defaults to config.ini next to this module)
+    
+    Returns:
+        ConfigParser: Parsed configuration, or None if no supported encoding yielded a [VFS] section
+    """
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
+    path = os.path.abspath(path)
+    if path in _config_cache:
+        return _config_cache[path]
+    
+    # Try different encodings for config file
+    for encoding in ['utf-8', 'utf-8-sig', 'cp1251', 'latin-1']:
+        candidate = ConfigParser()
+        try:
+            candidate.read(path, encoding=encoding)
+        except Exception as e:
+            logger.debug(f"Не удалось загрузить с кодировкой {encoding}: {e}")
+            continue
+        if 'VFS' in candidate.sections():
+            logger.info(f"✅ Конфигурация загружена из {path} (кодировка: {encoding})")
+            _config_cache[path] = candidate
+            return candidate
+    return None
+
+_ocr_stack = None
+_ocr_stack_lock = threading.Lock()
+
+def load_ocr_stack():
+    """
+    Import OpenCV, NumPy and pytesseract on first use and point pytesseract at the
+    configured Tesseract binary. Bots that never auto-solve a captcha never pay for it.
+    
+    Returns:
+        tuple: (cv2, numpy, pytesseract) modules
+    """
+    global _ocr_stack
+    if _ocr_stack is not None:
+        return _ocr_stack
+    with _ocr_stack_lock:
+        if _ocr_stack is None:
+            with import_timer('cv2'):
+                import cv2
+            with import_timer('numpy'):
+                import numpy as np
+            with import_timer('pytesseract'):
+                import pytesseract
+            
+            # Set Tesseract path from config if available
+            config = load_config() or ConfigParser()
+            if config.has_section('OCR') and config.has_option('OCR', 'tesseract_path'):
+                tesseract_path = config.get('OCR', 'tesseract_path')
+                if os.path.exists(tesseract_path):
+                    pytesseract.pytesseract.tesseract_cmd = tesseract_path
+                else:
+                    print(f"Предупреждение: путь Tesseract в конфигурации ({tesseract_path}) не существует.")
+            else:
+                # Default path as fallback
+                pytesseract.pytesseract.tesseract_cmd = 'C:/Program Files/Tesseract-OCR/tesseract.exe'
+            
+            _ocr_stack = (cv2, np, pytesseract)
+            logger.debug("✅ OCR стек (cv2, numpy, pytesseract) загружен")
+    return _ocr_stack
+
+def process_rss_mb():
+    """Resident set size of this process in MB, or None when psutil is unavailable."""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 ** 2)
+    except Exception:
+        return None
+
+def log_startup_profile(title="⏱️ ПРОФИЛЬ ИМПОРТОВ"):
+    """Log per-module import times recorded so far, slowest first, plus current RSS."""
+    total = sum(IMPORT_PROFILE.values())
+    logger.info(f"{title}: {total * 1000:.0f} мс всего")
+    for name, seconds in sorted(IMPORT_PROFILE.items(), key=lambda item: -item[1]):
+        logger.info(f"   • {name}: {seconds * 1000:.0f} мс")
+    rss = process_rss_mb()
+    if rss is not None:
+        logger.info(f"   💾 RSS процесса: {rss:.0f} MB")
 
 class WebError(Exception):
     pass
@@ -80,8 +177,12 @@ class Offline(Exception):
 class TesseractNotFoundError(Exception):
     pass
 
+class CircuitOpen(Exception):
+    pass
+
 def check_tesseract_installed():
     """Check if Tesseract is installed and accessible."""
+    _, _, pytesseract = load_ocr_stack()
     try:
         pytesseract.get_tesseract_version()
         return True
@@ -106,27 +207,38 @@ def break_captcha(filename="captcha.png"):
     Process the captcha image and extract text using OCR.
     
     Args:
-        filename: Path to the captcha image file
+        filename: Path to the captcha image file, or the encoded image bytes (e.g. a PNG screenshot)
     
     Returns:
         str: The extracted and cleaned captcha text
     """
     try:
-        logger.info(f"🔍 КАПЧА: Начало обработки файла - {filename}")
+        in_memory = isinstance(filename, (bytes, bytearray))
+        if in_memory:
+            filename_label = f"<в памяти, {len(filename)} байт>"
+        else:
+            filename_label = filename
+        logger.info(f"🔍 КАПЧА: Начало обработки файла - {filename_label}")
+        cv2, np, pytesseract = load_ocr_stack()
         
         # Check if Tesseract is installed
         check_tesseract_installed()
         logger.debug("✅ Tesseract найден и доступен")
         
-        # Check if file exists
-        if not os.path.exists(filename):
-            logger.error(f"❌ Файл капчи не найден: {filename}")
-            raise FileNotFoundError(f"Файл капчи не найден: {filename}")
-        
-        logger.debug(f"✅ Файл капчи найден: {filename} (размер: {os.path.getsize(filename)} байт)")
-        
-        # Read and preprocess the image
-        image = cv2.imread(filename)
+        if in_memory:
+            # Decode straight from memory - no temporary file
+            image = cv2.imdecode(np.frombuffer(filename, np.uint8), cv2.IMREAD_COLOR)
+            filename = filename_label
+        else:
+            # Check if file exists
+            if not os.path.exists(filename):
+                logger.error(f"❌ Файл капчи не найден: {filename}")
+                raise FileNotFoundError(f"Файл капчи не найден: {filename}")
+            
+            logger.debug(f"✅ Файл капчи найден: {filename} (размер: {os.path.getsize(filename)} байт)")
+            
+            # Read and preprocess the image
+            image = cv2.imread(filename)
         if image is None:
             logger.error(f"❌ Не удалось прочитать изображение: {filename}")
             raise FileNotFoundError(f"Не удалось прочитать изображение капчи: {filename}")
@@ -155,6 +267,7 @@ def break_captcha(filename="captcha.png"):
         psm_mode = 13  # Default PSM mode
         char_whitelist = "ABCDEFGHIJKLMNPQRSTUVWYZ"  # Default whitelist
         
+        config = load_config() or ConfigParser()
         if config.has_section('OCR'):
             if config.has_option('OCR', 'psm_mode'):
                 psm_mode = config.get('OCR', 'psm_mode')
@@ -210,6 +323,37 @@ def break_captcha(filename="captcha.png"):
         return ""
 
 
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    SHA-256 of a file's content.
+
+    Args:
+        path: File to hash
+        chunk_size: Read size in bytes
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_pdf_file(path):
+    """Cheap PDF validity check: `%PDF-` header and an `%%EOF` marker near the end."""
+    try:
+        with open(path, 'rb') as stream:
+            if stream.read(5) != b'%PDF-':
+                return False
+            stream.seek(0, os.SEEK_END)
+            stream.seek(max(stream.tell() - 1024, 0))
+            return b'%%EOF' in stream.read()
+    except OSError:
+        return False
+
+
 def convert_jpg_to_pdf(jpg_path, pdf_path=None):
     """
     Convert JPG image to PDF file.
@@ -222,6 +366,9 @@ def convert_jpg_to_pdf(jpg_path, pdf_path=None):
         str: Path to the generated PDF file or None if failed
     """
     try:
+        with import_timer('PIL'):
+            from PIL import Image
+        
         # Check if JPG file exists
         if not os.path.exists(jpg_path):
             print(f"❌ Файл JPG не найден: {jpg_path}")
@@ -232,16 +379,10 @@ def convert_jpg_to_pdf(jpg_path, pdf_path=None):
             base_path = os.path.splitext(jpg_path)[0]
             pdf_path = base_path + '.pdf'
         
-        # Check if PDF already exists and is valid
-        if os.path.exists(pdf_path):
-            try:
-                # Try to open to verify it's a valid PDF
-                from PIL import PdfImagePlugin
-                img = Image.open(pdf_path)
-                print(f"✅ PDF файл уже существует и валиден: {pdf_path}")
-                return pdf_path
-            except:
-                pass  # PDF invalid or not accessible, recreate it
+        # Check if PDF already exists and is valid (header/trailer check, no PIL decode)
+        if is_pdf_file(pdf_path):
+            print(f"✅ PDF файл уже существует и валиден: {pdf_path}")
+            return pdf_path
         
         # Open the JPG image and convert to RGB (in case it's RGBA or other format)
         image = Image.open(jpg_path)
@@ -263,3 +404,1541 @@ def convert_jpg_to_pdf(jpg_path, pdf_path=None):
     except Exception as e:
         print(f"❌ Ошибка при конвертации JPG в PDF: {str(e)}")
         return None
+
+
+class EventTrace:
+    """
+    One structured record under construction (a single check or login attempt).
+
+    Phases are timed with `phase()`, extra fields are attached with `set()`,
+    and `finish()` writes the record exactly once.
+    """
+
+    def __init__(self, event_log, kind, applicant, **fields):
+        self.event_log = event_log
+        self.record = {
+            'ts': round(time.time(), 3),
+            'kind': kind,
+            'applicant': applicant,
+            'phases': {},
+        }
+        self.record.update(fields)
+        self._started = time.perf_counter()
+        self._last_lap = self._started
+        self.finished = False
+
+    @property
+    def outcome(self):
+        return self.record.get('outcome')
+
+    @contextmanager
+    def phase(self, name):
+        phase_start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self._last_lap = time.perf_counter()
+            elapsed_ms = (self._last_lap - phase_start) * 1000
+            phases = self.record['phases']
+            phases[name] = round(phases.get(name, 0) + elapsed_ms, 1)
+
+    def lap(self, name):
+        """Record the time since the previous lap (or start) as phase `name`."""
+        now = time.perf_counter()
+        phases = self.record['phases']
+        phases[name] = round(phases.get(name, 0) + (now - self._last_lap) * 1000, 1)
+        self._last_lap = now
+        return self
+
+    def set(self, **fields):
+        for key, value in fields.items():
+            if value is not None:
+                self.record[key] = value
+        return self
+
+    def finish(self, outcome=None, error=None, **fields):
+        """Write the record; later calls are ignored so callers can finish defensively."""
+        if self.finished:
+            return False
+        self.finished = True
+        if outcome is not None:
+            self.record['outcome'] = outcome
+        self.record.setdefault('outcome', 'error' if error is not None else 'ok')
+        if error is not None:
+            self.record['error'] = error if isinstance(error, str) else type(error).__name__
+        self.set(**fields)
+        self.record['duration_ms'] = round((time.perf_counter() - self._started) * 1000, 1)
+        self.event_log.write(self.record)
+        return True
+
+
+class EventLog:
+    """
+    Append-only JSONL event stream with size-based rotation.
+
+    Every line is one compact JSON object. When the active file would exceed
+    `max_bytes` it is renamed to `<name>_<timestamp>.jsonl` (gzip-compressed if
+    `compress` is set) and only the newest `backup_count` rotated files are kept.
+    """
+
+    def __init__(self, path='events/events.jsonl', max_bytes=5 * 1024 * 1024,
+                 backup_count=10, compress=True, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stream = None
+        self._size = 0
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._stream = open(self.path, 'a', encoding='utf-8')
+        self._size = self._stream.tell()
+
+    def _rotate(self):
+        self._stream.close()
+        self._stream = None
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{ext}"
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                dst.writelines(src)
+            os.remove(rotated)
+        rotated_files = [f for f in event_log_files(self.path) if f != self.path]
+        for old_file in rotated_files[:max(0, len(rotated_files) - self.backup_count)]:
+            try:
+                os.remove(old_file)
+            except OSError:
+                pass
+
+    def write(self, record):
+        if not self.enabled:
+            return
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+        # Sizes are in UTF-8 bytes: Russian text and emoji take several bytes per character
+        size = len(line.encode('utf-8'))
+        try:
+            with self._lock:
+                if self._stream is None:
+                    self._open()
+                if self._size and self._size + size > self.max_bytes:
+                    self._rotate()
+                    self._open()
+                self._stream.write(line)
+                self._stream.flush()
+                self._size += size
+        except Exception as e:
+            logger.debug(f"⚠️ Не удалось записать событие в {self.path}: {e}")
+
+    def trace(self, kind, applicant, **fields):
+        return EventTrace(self, kind, applicant, **fields)
+
+    def close(self):
+        with self._lock:
+            if self._stream is not None:
+                self._stream.close()
+                self._stream = None
+
+
+def event_log_files(path='events/events.jsonl'):
+    """Return rotated files (oldest first) followed by the active file, if present."""
+    directory = os.path.dirname(path) or '.'
+    base, ext = os.path.splitext(os.path.basename(path))
+    if not os.path.isdir(directory):
+        return []
+    rotated = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith(base + '_') and (name.endswith(ext) or name.endswith(ext + '.gz'))
+    )
+    if os.path.exists(path):
+        rotated.append(path)
+    return rotated
+
+
+def iter_events(paths, kinds=None):
+    """
+    Stream records from one or more JSONL files (plain or .gz).
+
+    Args:
+        paths: Iterable of file paths
+        kinds: Optional collection of `kind` values to keep
+
+    Yields:
+        dict: One decoded event record per line
+    """
+    kind_markers = [f'"kind":"{kind}"' for kind in kinds] if kinds else None
+    for file_path in paths:
+        opener = gzip.open if file_path.endswith('.gz') else open
+        try:
+            with opener(file_path, 'rt', encoding='utf-8') as stream:
+                for line in stream:
+                    # Cheap substring filter before paying for json.loads
+                    if kind_markers and not any(marker in line for marker in kind_markers):
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except OSError as e:
+            logger.debug(f"⚠️ Не удалось прочитать {file_path}: {e}")
+
+
+def summarize_events(paths=None, path='events/events.jsonl', kinds=None, since=None):
+    """
+    Aggregate event streams into per-applicant and per-phase statistics.
+
+    Args:
+        paths: Explicit file list (defaults to all files of the stream at `path`)
+        path: Active event log path used to discover rotated files
+        kinds: Optional collection of record kinds to include
+        since: Optional epoch timestamp; older records are skipped
+
+    Returns:
+        dict: totals, outcome counts, per-applicant counters, phase timings and slot dates
+    """
+    if paths is None:
+        paths = event_log_files(path)
+    summary = {'total': 0, 'by_kind': {}, 'by_outcome': {}, 'by_applicant': {},
+               'errors': {}, 'page_states': {}, 'phases': {}, 'slots': []}
+    for record in iter_events(paths, kinds=kinds):
+        if since and record.get('ts', 0) < since:
+            continue
+        summary['total'] += 1
+        kind = record.get('kind', 'unknown')
+        outcome = record.get('outcome', 'unknown')
+        summary['by_kind'][kind] = summary['by_kind'].get(kind, 0) + 1
+        summary['by_outcome'][outcome] = summary['by_outcome'].get(outcome, 0) + 1
+
+        applicant = summary['by_applicant'].setdefault(
+            record.get('applicant') or 'unknown', {'total': 0, 'outcomes': {}, 'duration_ms': 0.0})
+        applicant['total'] += 1
+        applicant['outcomes'][outcome] = applicant['outcomes'].get(outcome, 0) + 1
+        applicant['duration_ms'] += record.get('duration_ms', 0) or 0
+
+        if record.get('error'):
+            summary['errors'][record['error']] = summary['errors'].get(record['error'], 0) + 1
+        if record.get('page_state'):
+            state = record['page_state']
+            summary['page_states'][state] = summary['page_states'].get(state, 0) + 1
+        for phase_name, elapsed in (record.get('phases') or {}).items():
+            phase = summary['phases'].setdefault(phase_name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            phase['count'] += 1
+            phase['total_ms'] += elapsed
+            phase['max_ms'] = max(phase['max_ms'], elapsed)
+        if record.get('slot_date'):
+            summary['slots'].append((record.get('ts'), record.get('applicant'), record['slot_date']))
+
+    for phase in summary['phases'].values():
+        phase['avg_ms'] = round(phase['total_ms'] / phase['count'], 1) if phase['count'] else 0.0
+    return summary
+
+
+class PollScheduler:
+    """
+    Dynamic next-check times per (applicant, url) key.
+
+    - Throttled/error pages back off exponentially (with jitter) up to `max_interval`.
+    - Hour-of-week windows in which slots were released before are polled
+      `hot_factor` times the base interval (never below `hot_min_interval`, which
+      is separate from `min_interval` so hot windows can poll faster than normal).
+    - A global `hourly_budget` of checks (0 = unlimited) is never exceeded.
+    """
+
+    FAILURE_OUTCOMES = ('error', 'offline', 'rate_limited')
+    FAILURE_PAGE_STATES = ('throttled', 'server_error', 'cloudflare', 'queue', 'unreachable')
+
+    def __init__(self, base_interval, min_interval=30, max_interval=1800, backoff_factor=2.0,
+                 jitter=0.2, hot_factor=0.5, hot_min_releases=2, hourly_budget=0, enabled=True,
+                 hot_min_interval=10):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.hot_min_interval = hot_min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.hot_factor = hot_factor
+        self.hot_min_releases = hot_min_releases
+        self.hourly_budget = hourly_budget
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._failures = {}  # key -> consecutive failures
+        self._next_at = {}  # key -> epoch seconds of the next allowed check
+        self._releases = {}  # url -> {hour_of_week: slot releases seen}
+        self._requests = deque()  # epoch seconds of checks in the last hour
+
+    @staticmethod
+    def key(applicant, url):
+        return f"{applicant}|{url}"
+
+    @staticmethod
+    def hour_of_week(ts=None):
+        moment = datetime.fromtimestamp(ts if ts is not None else time.time())
+        return moment.weekday() * 24 + moment.hour
+
+    def learn_release(self, url, ts=None):
+        """Count one observed slot release for `url` in its hour-of-week bucket."""
+        with self._lock:
+            buckets = self._releases.setdefault(url, {})
+            hour = self.hour_of_week(ts)
+            buckets[hour] = buckets.get(hour, 0) + 1
+
+    def learn_from_events(self, paths):
+        """Seed release windows from `slot_found` check records of the event log."""
+        learned = 0
+        for record in iter_events(paths, kinds=('check',)):
+            if record.get('outcome') == 'slot_found' and record.get('url'):
+                self.learn_release(record['url'], record.get('ts'))
+                learned += 1
+        return learned
+
+    def is_hot(self, url, ts=None):
+        buckets = self._releases.get(url) or {}
+        return buckets.get(self.hour_of_week(ts), 0) >= self.hot_min_releases
+
+    def note_request(self, now=None):
+        """Account one check against the hourly budget."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._requests.append(now)
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._requests and self._requests[0] <= now - 3600:
+            self._requests.popleft()
+
+    def _budget_delay(self, at):
+        """Extra seconds past `at` needed to stay within the hourly budget."""
+        if not self.hourly_budget:
+            return 0.0
+        in_window = [ts for ts in self._requests if ts > at - 3600]
+        if len(in_window) < self.hourly_budget:
+            return 0.0
+        # Wait until enough of the window expires to make room for one more check
+        return in_window[len(in_window) - self.hourly_budget] + 3600 - at
+
+    def record(self, key, url, outcome=None, page_state=None, now=None):
+        """
+        Register the result of a check and compute the delay until the next one.
+
+        Args:
+            key: Scheduler key from `PollScheduler.key()`
+            url: Center URL used for hot-window lookups
+            outcome: Trace outcome of the check (ok, no_slots, slot_found, error...)
+            page_state: Page classification from the check, if any
+
+        Returns:
+            float: Seconds to wait before checking `key` again
+        """
+        now = now if now is not None else time.time()
+        if not self.enabled:
+            return self.base_interval
+        if outcome == 'slot_found':
+            self.learn_release(url, now)
+        with self._lock:
+            failed = outcome in self.FAILURE_OUTCOMES or page_state in self.FAILURE_PAGE_STATES
+            if failed:
+                failures = self._failures.get(key, 0) + 1
+                self._failures[key] = failures
+                delay = self.base_interval * self.backoff_factor ** failures
+            else:
+                self._failures.pop(key, None)
+                delay = self.base_interval
+            floor = self.min_interval
+            if not failed and self.is_hot(url, now):
+                delay *= self.hot_factor
+                floor = self.hot_min_interval
+            # Bounds first, so jitter spreads checks both ways around the bounded delay
+            delay = min(max(delay, floor), self.max_interval)
+            if self.jitter:
+                delay = min(delay * random.uniform(1 - self.jitter, 1 + self.jitter), self.max_interval)
+            delay += self._budget_delay(now + delay)
+            self._next_at[key] = now + delay
+        return delay
+
+    def delay(self, key, now=None):
+        """Seconds until `key` may be checked again (0 if it is due)."""
+        now = now if now is not None else time.time()
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            due = max(self._next_at.get(key, 0) - now, 0.0)
+            return due + self._budget_delay(now + due)
+
+    def status(self):
+        """Snapshot for status commands."""
+        with self._lock:
+            self._trim(time.time())
+            return {
+                'checks_last_hour': len(self._requests),
+                'hourly_budget': self.hourly_budget,
+                'backing_off': {key: n for key, n in self._failures.items() if n},
+                'hot_windows': sum(1 for buckets in self._releases.values()
+                                   for count in buckets.values() if count >= self.hot_min_releases),
+            }
+
+
+def parse_date(value):
+    """Parse a config date (YYYY-MM-DD, DD.MM.YYYY or DD/MM/YYYY); returns None if empty or invalid."""
+    value = (value or '').strip()
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def urgency_multiplier(deadline, horizon_days=90, boost=2.0, today=None):
+    """
+    Scale factor for an applicant whose deadline is approaching.
+
+    Returns 1.0 outside `horizon_days`, rising linearly to `1 + boost` on (or past) the deadline.
+    """
+    if deadline is None or horizon_days <= 0:
+        return 1.0
+    days_left = (deadline - (today or datetime.now().date())).days
+    closeness = min(max(1 - days_left / horizon_days, 0.0), 1.0)
+    return 1.0 + boost * closeness
+
+
+class WeightedRoundRobin:
+    """
+    Smooth weighted round-robin over string keys.
+
+    Each `pick()` adds every key's weight to its running credit and serves the key
+    with the most credit, which then pays back the total. Over any window every key
+    is served in proportion to its weight, and picks are interleaved rather than
+    bunched, so no positive-weight key starves.
+    """
+
+    def __init__(self):
+        self._credit = {}
+
+    def pick(self, weights):
+        """
+        Args:
+            weights: Ordered dict {key: weight}; keys with weight <= 0 are skipped
+
+        Returns:
+            The selected key, or None if no key has a positive weight
+        """
+        active = {key: weight for key, weight in weights.items() if weight > 0}
+        if not active:
+            return None
+        # Forget keys that were removed from the rotation
+        self._credit = {key: credit for key, credit in self._credit.items() if key in active}
+        total = sum(active.values())
+        for key, weight in active.items():
+            self._credit[key] = self._credit.get(key, 0.0) + weight
+        chosen = max(active, key=lambda key: self._credit[key])
+        self._credit[chosen] -= total
+        return chosen
+
+    def reset(self):
+        self._credit.clear()
+
+
+class CircuitBreaker:
+    """
+    Per-applicant circuit breaker.
+
+    closed    -> normal operation; consecutive failures are counted
+    open      -> `failure_threshold` failures (or `trip()`) open the circuit for `cooldown` seconds
+    half_open -> after the cooldown one trial is allowed; success closes the circuit,
+                 failure re-opens it with the cooldown doubled (up to `max_cooldown`)
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, cooldown=600, max_cooldown=3600):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.last_reason = None
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._open_for = 0.0
+
+    @property
+    def state(self):
+        if self._state == self.OPEN and time.monotonic() >= self._opened_at + self._open_for:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def allow(self):
+        """True unless the circuit is open (a half-open circuit admits a trial)."""
+        return self.state != self.OPEN
+
+    def remaining(self):
+        """Seconds until an open circuit becomes half-open (0 otherwise)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self._opened_at + self._open_for - time.monotonic(), 0.0)
+
+    def _open(self, duration):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._open_for = duration
+
+    def record_success(self):
+        self.failures = 0
+        self.last_reason = None
+        self.cooldown = self.base_cooldown
+        self._state = self.CLOSED
+
+    def record_failure(self, reason=None):
+        """Count a failure; returns True if this opened the circuit."""
+        self.failures += 1
+        self.last_reason = reason
+        if self.state == self.HALF_OPEN:
+            # The trial failed: back off harder
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open(self.cooldown)
+            return True
+        if self.failures >= self.failure_threshold:
+            self._open(self.cooldown)
+            return True
+        return False
+
+    def trip(self, reason=None, cooldown=None):
+        """Open the circuit immediately (e.g. the account is locked)."""
+        self.failures += 1
+        self.last_reason = reason
+        duration = cooldown if cooldown is not None else self.cooldown
+        if self.state == self.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            duration = max(duration, self.cooldown)
+        self._open(duration)
+
+    def status(self):
+        return {'state': self.state, 'failures': self.failures,
+                'reason': self.last_reason, 'retry_in': round(self.remaining())}
+
+
+class CheckCoalescer:
+    """
+    One availability check per group of applicants that see the same availability.
+
+    Applicants with the same (url, category, type) key share the result of the last
+    check of any member. A 'no_slots' result stays fresh until the group's next check
+    is due and covers every member; a 'slot_found' result covers nobody, so each
+    member still switches into its own session to book.
+    """
+
+    COVERING_OUTCOMES = ('no_slots',)
+    SHARED_OUTCOMES = ('no_slots', 'slot_found')
+
+    def __init__(self, max_age=0, enabled=True):
+        self.max_age = max_age
+        self.enabled = enabled
+        self._results = {}  # key -> {'outcome', 'slot_date', 'checked_by', 'checked_at', 'expires'}
+
+    @staticmethod
+    def key(url, category, appointment_type):
+        return (str(url or '').strip().rstrip('/').lower(), normalize_text(category), normalize_text(appointment_type))
+
+    def record(self, key, outcome, slot_date=None, checked_by=None, ttl=None):
+        """
+        Store the result of a check for the whole group.
+
+        Args:
+            key: Availability key from `key()`
+            outcome: Check outcome; only 'no_slots' and 'slot_found' describe availability
+            slot_date: Slot date of a 'slot_found' result
+            checked_by: Applicant whose session performed the check
+            ttl: Seconds the result covers the group; `max_age` (if set) caps it
+
+        Returns:
+            The stored result, or None if the outcome says nothing about availability
+        """
+        if not self.enabled or outcome not in self.SHARED_OUTCOMES:
+            return None
+        ttl = ttl if ttl is not None else self.max_age
+        if self.max_age:
+            ttl = min(ttl, self.max_age)
+        now = time.time()
+        result = {'outcome': outcome, 'slot_date': slot_date, 'checked_by': checked_by,
+                  'checked_at': now, 'expires': now + max(ttl, 0)}
+        self._results[key] = result
+        return result
+
+    def fresh(self, key):
+        """Latest result for the key, or None once it has expired"""
+        result = self._results.get(key)
+        if result is not None and result['expires'] <= time.time():
+            del self._results[key]
+            return None
+        return result
+
+    def covered(self, key):
+        """True while a fresh result makes a separate check of this key pointless"""
+        result = self.fresh(key) if self.enabled else None
+        return result is not None and result['outcome'] in self.COVERING_OUTCOMES
+
+    def remaining(self, key):
+        """Seconds until the key's result expires (0 if there is none)"""
+        result = self.fresh(key)
+        return max(0.0, result['expires'] - time.time()) if result else 0.0
+
+    @staticmethod
+    def groups(items, key_fn):
+        """{key: [items]} in the original order"""
+        grouped = {}
+        for item in items:
+            grouped.setdefault(key_fn(item), []).append(item)
+        return grouped
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._results.clear()
+        else:
+            self._results.pop(key, None)
+
+
+class WatchMatrix:
+    """
+    Watched (url, center, category) targets and the availability state of each.
+
+    Every applicant checks one target (its `watch` option, the first target by
+    default). A target's state is the latest check of any of its applicants.
+    """
+
+    DEFAULT_CENTER = 'Belgium Long Term Visa Application Center-Tehran'
+    DEFAULT_CATEGORY = '1314'
+    NO_SEATS_TEXT = 'There are no open seats available for selected center - {center}'
+
+    def __init__(self, targets):
+        """
+        Args:
+            targets: [{'name', 'url', 'center', 'category', 'no_seats_text'}]; empty
+                url/category fall back to the single-center defaults
+        """
+        self.targets = {}
+        for target in targets or [{'name': 'VFS'}]:
+            center = target.get('center') or ''
+            self.targets[target['name']] = {
+                'name': target['name'],
+                'url': target.get('url') or '',
+                'center': center,
+                'category': target.get('category') or self.DEFAULT_CATEGORY,
+                # Empty: built by no_seats_text() from the center actually selected
+                'no_seats_text': target.get('no_seats_text') or '',
+                # Last notified date; the first target keeps the historical file name
+                'record_path': 'record.txt' if not self.targets else f"record_{target['name'].lower()}.txt",
+            }
+        self.state = {name: {'checks': 0, 'slots': 0, 'outcome': None, 'page_state': None,
+                             'slot_date': None, 'dates': [], 'checked_at': None, 'slot_at': None}
+                      for name in self.targets}
+
+    @property
+    def default(self):
+        return next(iter(self.targets.values()))
+
+    def get(self, name=None):
+        """Target by name; unknown or empty names resolve to the first target"""
+        name = (name or '').strip()
+        return self.targets.get(name) or self.targets.get(name.upper()) or self.default
+
+    def no_seats_text(self, target, selected_center=None):
+        """
+        Page text meaning "no seats" for a target.
+
+        Args:
+            selected_center: Full text of the LocationId option that was selected; the
+                configured `center` is only a substring of it and never appears verbatim
+        """
+        if target['no_seats_text']:
+            return target['no_seats_text']
+        return self.NO_SEATS_TEXT.format(center=selected_center or target['center'] or self.DEFAULT_CENTER)
+
+    def record(self, name, outcome, slot_date=None, page_state=None, dates=None):
+        """Update a target's state with the result of one check (`dates`: every available date, if known)"""
+        state = self.state.get(name)
+        if state is None or outcome is None:
+            return
+        now = time.time()
+        state['checks'] += 1
+        state['outcome'] = outcome
+        state['page_state'] = page_state
+        state['checked_at'] = now
+        if outcome == 'slot_found':
+            state['slots'] += 1
+            state['slot_date'] = slot_date
+            state['slot_at'] = now
+            state['dates'] = list(dates or [slot_date])
+        elif outcome == 'no_slots':
+            state['dates'] = []
+
+
+AVAILABILITY_URL_PATTERNS = ('GetEarliestVisaSlotDate', 'EarliestVisaSlot', 'VisaSlotDate', 'CheckIsSlotAvailable')
+# A slot date is a bare date; datetimes such as server timestamps are never slots
+AVAILABILITY_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}|\d{1,2}[./]\d{1,2}[./]\d{4}')
+# VFS sends MM/DD/YYYY; day-first dotted dates are accepted as well
+AVAILABILITY_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%d.%m.%Y')
+AVAILABILITY_DATE_KEY = re.compile(r'date|slot', re.IGNORECASE)
+NO_SEATS_MARKERS = ('no open seats', 'no slots', 'no appointment')
+
+
+def parse_slot_date(value):
+    """Parse a bare slot date sent by the availability API; None for anything else."""
+    value = value.strip()
+    if not AVAILABILITY_DATE_PATTERN.fullmatch(value):
+        return None
+    for fmt in AVAILABILITY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def availability_responses(entries, patterns=AVAILABILITY_URL_PATTERNS):
+    """
+    Pick availability API responses out of Chrome performance log entries.
+
+    Args:
+        entries: `driver.get_log('performance')` entries
+        patterns: Case-insensitive URL substrings of the availability endpoints
+
+    Returns:
+        list: (request_id, url, status) of matching successful responses, oldest first
+    """
+    patterns = [pattern.lower() for pattern in patterns if pattern]
+    responses = []
+    for entry in entries:
+        message = entry.get('message', '')
+        # Cheap substring test first: the log holds every network and page event
+        if 'Network.responseReceived' not in message:
+            continue
+        try:
+            event = json.loads(message)['message']
+        except (ValueError, KeyError, TypeError):
+            continue
+        if event.get('method') != 'Network.responseReceived':
+            continue
+        params = event.get('params', {})
+        response = params.get('response', {})
+        url = response.get('url', '')
+        if params.get('type') not in ('XHR', 'Fetch') or not any(pattern in url.lower() for pattern in patterns):
+            continue
+        if 200 <= response.get('status', 0) < 300:
+            responses.append((params.get('requestId'), url, response.get('status')))
+    return responses
+
+
+def parse_availability_payload(payload, source=None):
+    """
+    Turn an availability API response body into a structured availability object.
+
+    Args:
+        payload: Response body (JSON text, or already decoded)
+        source: URL of the response, kept in the result
+
+    Returns:
+        dict: {'source', 'dates': [ISO dates, sorted], 'earliest': the earliest date as sent,
+        'no_seats'}, or None if the body says nothing about availability
+    """
+    if isinstance(payload, (str, bytes)):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            return None
+    found = {}
+    no_seats = False
+    # (value, whether it sits under a date-like key such as EarliestDate or availableDates)
+    stack = [(payload, False)]
+    while stack:
+        value, date_key = stack.pop()
+        if isinstance(value, dict):
+            stack.extend((item, bool(AVAILABILITY_DATE_KEY.search(str(key)))) for key, item in value.items())
+        elif isinstance(value, list):
+            stack.extend((item, date_key) for item in value)
+        elif isinstance(value, str):
+            if any(marker in value.lower() for marker in NO_SEATS_MARKERS):
+                no_seats = True
+            parsed = parse_slot_date(value) if date_key else None
+            if parsed is not None:
+                found.setdefault(parsed, value.strip())
+    if not found and not no_seats:
+        return None
+    dates = sorted(found)
+    return {
+        'source': source,
+        'dates': [day.isoformat() for day in dates],
+        'earliest': found[dates[0]] if dates else None,
+        'no_seats': no_seats and not dates,
+    }
+
+
+class DocumentCache:
+    """
+    Content-addressed cache of JPG->PDF conversions.
+
+    Converted files live in `cache_dir` as `<sha256 of source>.pdf`. `manifest.json`
+    maps every source path to its size, mtime, digest and PDF, so a source is only
+    re-hashed when it changes and a PDF is only regenerated when it is missing or invalid.
+    """
+
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+    def __init__(self, cache_dir='dokuments/.cache', workers=2):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self._lock = threading.Lock()
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as stream:
+                return json.load(stream)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as stream:
+            json.dump(self.manifest, stream, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.manifest_path)
+
+    @staticmethod
+    def scan(directory):
+        """One pass over `directory`: {file name: (absolute path, size, mtime)}."""
+        index = {}
+        if not os.path.isdir(directory):
+            return index
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                stat = entry.stat()
+                index[entry.name] = (os.path.abspath(entry.path), stat.st_size, stat.st_mtime)
+        return index
+
+    def _entry(self, source):
+        """Manifest entry for `source`, refreshed (re-hashed) only if size or mtime changed."""
+        source = os.path.abspath(source)
+        stat = os.stat(source)
+        entry = self.manifest.get(source)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            return source, entry
+        digest = file_digest(source)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest,
+                 'pdf': os.path.abspath(os.path.join(self.cache_dir, digest + '.pdf'))}
+        return source, entry
+
+    def prepare(self, sources):
+        """
+        Convert every image in `sources` that has no valid cached PDF, in a process pool.
+
+        Args:
+            sources: Iterable of image paths (non-images and missing files are ignored)
+
+        Returns:
+            dict: {absolute source path: PDF path} for every source that is ready
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        ready, pending = {}, {}
+        for source in dict.fromkeys(sources):
+            if not source or not source.lower().endswith(self.IMAGE_EXTENSIONS) or not os.path.exists(source):
+                continue
+            source, entry = self._entry(source)
+            if is_pdf_file(entry['pdf']):
+                ready[source] = entry['pdf']
+                self.manifest[source] = entry
+            else:
+                pending[source] = entry
+
+        if pending:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with ProcessPoolExecutor(max_workers=max(1, min(self.workers, len(pending)))) as pool:
+                futures = {source: pool.submit(convert_jpg_to_pdf, source, entry['pdf'])
+                           for source, entry in pending.items()}
+                for source, future in futures.items():
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning(f"⚠️ Не удалось конвертировать {source}: {e}")
+                        continue
+                    if result:
+                        ready[source] = result
+                        self.manifest[source] = pending[source]
+
+        with self._lock:
+            self._save_manifest()
+        return ready
+
+
+class CaptchaBroker:
+    """
+    Hands manual captcha answers from Telegram to the waiting login.
+
+    Each captcha photo sent to Telegram gets a future keyed by the photo's
+    message id; an admin's reply to that message resolves it.
+    """
+
+    def __init__(self):
+        self._pending = {}  # message_id -> asyncio.Future
+
+    def open(self, message_id):
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        return future
+
+    def resolve(self, message_id, answer):
+        """Deliver `answer` for the captcha sent as `message_id`; False if nobody is waiting."""
+        future = self._pending.pop(message_id, None)
+        if future is None or future.done():
+            return False
+        future.set_result(answer)
+        return True
+
+    async def wait(self, message_id, timeout):
+        """Answer for `message_id`, or None if no reply arrives within `timeout` seconds."""
+        future = self._pending.get(message_id) or self.open(message_id)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._pending.pop(message_id, None)
+
+    def pending(self):
+        return len(self._pending)
+
+
+class DomMirror:
+    """
+    Local snapshot of the page DOM for cheap selector probing.
+
+    One `outerHTML` fetch is parsed with lxml and whole locator lists are evaluated
+    against it locally; the browser is then asked only about the locators that
+    matched. The snapshot is dropped by `invalidate()` (after navigation, clicks,
+    page-changing scripts) or once it is older than `max_age` seconds.
+
+    lxml is optional (cssselect too, for CSS locators). Without them every locator
+    is reported as a candidate, i.e. callers fall back to probing the full list.
+    """
+
+    def __init__(self, fetch_html, max_age=2.0, enabled=True):
+        self.fetch_html = fetch_html
+        self.max_age = max_age
+        self.enabled = enabled
+        self.snapshots = 0
+        self._tree = None
+        self._taken_at = 0.0
+        self._compiled = {}
+        self._lxml_html = None
+        self._css_selector = None
+        if enabled:
+            try:
+                with import_timer('lxml'):
+                    from lxml import html as lxml_html
+                self._lxml_html = lxml_html
+            except ImportError:
+                logger.info("ℹ️ lxml не установлен - DOM-зеркало отключено")
+            try:
+                from lxml.cssselect import CSSSelector
+                self._css_selector = CSSSelector
+            except ImportError:
+                pass
+
+    @property
+    def available(self):
+        return self.enabled and self._lxml_html is not None
+
+    def invalidate(self, *args, **kwargs):
+        self._tree = None
+
+    def _snapshot(self):
+        if self._tree is None or time.monotonic() - self._taken_at > self.max_age:
+            self._tree = self._lxml_html.document_fromstring(self.fetch_html() or '<html></html>')
+            self._taken_at = time.monotonic()
+            self.snapshots += 1
+        return self._tree
+
+    def _compile(self, by, value):
+        """XPath string or compiled matcher for a Selenium locator; None if it cannot be mirrored."""
+        key = (by, value)
+        if key not in self._compiled:
+            if by == 'xpath':
+                compiled = value
+            elif by == 'id':
+                compiled = f'//*[@id="{value}"]' if '"' not in value else None
+            elif by == 'name':
+                compiled = f'//*[@name="{value}"]' if '"' not in value else None
+            elif by == 'tag name':
+                compiled = f'//{value}' if value.isalnum() else None
+            elif by in ('css selector', 'class name') and self._css_selector is not None:
+                selector = value if by == 'css selector' else '.' + value
+                try:
+                    compiled = self._css_selector(selector)
+                except Exception:
+                    compiled = None
+            else:
+                compiled = None
+            self._compiled[key] = compiled
+        return self._compiled[key]
+
+    def matches(self, by, value):
+        """True/False if the snapshot can answer for this locator, None if it cannot."""
+        compiled = self._compile(by, value)
+        if compiled is None:
+            return None
+        try:
+            tree = self._snapshot()
+            found = tree.xpath(compiled) if isinstance(compiled, str) else compiled(tree)
+            return bool(found)
+        except Exception:
+            return None
+
+    def candidates(self, locators):
+        """
+        Locators worth asking the browser about, in their original priority order.
+
+        Args:
+            locators: List of (by, value) Selenium locators
+
+        Returns:
+            list: Locators that matched the snapshot or could not be evaluated locally
+        """
+        if not self.available:
+            return list(locators)
+        try:
+            self._snapshot()
+        except Exception as e:
+            logger.debug(f"⚠️ DOM-зеркало недоступно: {e}")
+            return list(locators)
+        return [locator for locator in locators if self.matches(*locator) is not False]
+
+
+class ClickStrategyCache:
+    """
+    Learns which click method works for each (page, element kind).
+
+    Every attempt updates an exponentially decayed success score
+    (score = decay * score + (1 - decay) * outcome), so a method that stops
+    working after a site change drops below the alternatives within a few clicks.
+    Methods without history keep their default order behind proven ones.
+    """
+
+    def __init__(self, decay=0.7, prior=0.5):
+        self.decay = decay
+        self.prior = prior
+        self._scores = {}  # (context, method) -> score
+
+    def order(self, context, methods):
+        """`methods` sorted by learned score (stable, so ties keep the caller's order)."""
+        return sorted(methods, key=lambda method: -self._scores.get((context, method), self.prior))
+
+    def record(self, context, method, success):
+        key = (context, method)
+        score = self._scores.get(key, self.prior)
+        self._scores[key] = self.decay * score + (1 - self.decay) * (1.0 if success else 0.0)
+
+
+# CSS selectors tried (in order) for each applicant form field.
+# Exact VFS names come first: FILL_PLAN_SCRIPT never gives one element to two fields,
+# so a generic selector listed first could take another field's input.
+FORM_FIELD_PATTERNS = {
+    'country': ['[name*="country"]', '[id*="country"]', 'select[name*="Country"]', '[name="country"]', '#country'],
+    'passportValidityDate': ['[name*="PassportExpiryDate"]', '[name*="validity"]', '[name*="expiry"]', '[name*="passport"]', '[id*="passport"]'],
+    'appointmentCategory': ['[name*="category"]', '[name*="appointment"]', '[id*="category"]', 'select[name*="Category"]', '[name="appointmentCategory"]'],
+    'firstName': ['[name="FirstName"]', '[name="firstName"]', '[name*="first"]', '[name*="First"]', '[id*="first"]', 'input[name*="name"]'],
+    'lastName': ['[name="LastName"]', '[name="lastName"]', '[name*="last"]', '[name*="Last"]', '[id*="last"]', '[name*="surname"]'],
+    'dateOfBirth': ['[name="DateOfBirth"]', '[name="dateOfBirth"]', '[name*="birth"]', '[name*="Birth"]', '[id*="birth"]'],
+    'passportNumber': ['[name="PassportNumber"]', '[name="passportNumber"]', '[name*="passport"]', '[id*="passport"]', '[name*="number"]'],
+    'nationality': ['[name*="nationality"]', '[id*="nationality"]', '[name*="Nationality"]', '[name="nationality"]', '#nationality'],
+    'phoneNumber': ['[name*="phone"]', '[id*="phone"]', '[name*="mobile"]', 'input[type="tel"]', '[name="phoneNumber"]', '[name="PhoneNumber"]'],
+    'email': ['[name*="email"]', '[id*="email"]', 'input[type="email"]', '[name="email"]', '#email'],
+    'address': ['[name*="address"]', '[id*="address"]', 'textarea', '[name="address"]', '#address'],
+    'purpose': ['[name*="purpose"]', '[id*="purpose"]', '[name*="Purpose"]', '[name="purpose"]', '#purpose']
+}
+
+# Element kind each field must resolve to (checked by `accepts` in VFSBot.FILL_PLAN_SCRIPT)
+FORM_FIELD_KINDS = {
+    'country': 'select',
+    'nationality': 'select',
+    'appointmentCategory': 'select',
+    'dateOfBirth': 'date',
+    'passportValidityDate': 'date',
+    'email': 'email',
+    'phoneNumber': 'phone',
+    'address': 'textarea',
+}
+
+# Applicant dates are entered day-first; <input type="date"> only takes YYYY-MM-DD
+FORM_DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%d-%m-%Y')
+
+
+def normalize_text(text):
+    """Casefold and collapse whitespace, the form used to compare option labels."""
+    return re.sub(r'\s+', ' ', str(text or '')).strip().casefold()
+
+
+def form_iso_date(value):
+    """YYYY-MM-DD form of an applicant date for native date inputs; None if it is not a date."""
+    value = str(value).strip()
+    for fmt in FORM_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def compile_fill_plan(values, patterns=None):
+    """
+    Compile an applicant's form values into a fill plan for FILL_PLAN_SCRIPT.
+
+    Args:
+        values: {field_name: value}; empty values are left out of the plan
+        patterns: {field_name: [css selectors]}, FORM_FIELD_PATTERNS by default
+
+    Returns:
+        list of {'field', 'kind', 'selectors', 'value', 'match', 'iso'} steps, where
+        `match` is the normalized value used to pick select options and `iso` the
+        YYYY-MM-DD value written into native date inputs (date fields only)
+    """
+    patterns = FORM_FIELD_PATTERNS if patterns is None else patterns
+    plan = []
+    for field, selectors in patterns.items():
+        value = values.get(field)
+        if not value:
+            continue
+        plan.append({
+            'field': field,
+            'kind': FORM_FIELD_KINDS.get(field, 'text'),
+            'selectors': list(selectors),
+            'value': str(value),
+            'match': normalize_text(value),
+            'iso': form_iso_date(value) if FORM_FIELD_KINDS.get(field) == 'date' else None,
+        })
+    return plan
+
+
+class GridClient:
+    """
+    Reads Selenium Grid 4 capacity from `<hub_url>/status` and picks nodes for new sessions.
+
+    Nodes that dropped a session are avoided for `node_cooldown` seconds (`mark_lost`).
+    Grid routes a new session to a node whose slot stereotype matches the requested
+    capabilities, so `placement_capabilities` returns the node's own extension
+    capabilities (e.g. `vfs:node` set in the node's TOML) to pin the session to it.
+    """
+
+    def __init__(self, hub_url, browser_name='chrome', timeout=3, node_cooldown=300):
+        self.hub_url = hub_url.rstrip('/')
+        self.browser_name = browser_name
+        self.timeout = timeout
+        self.node_cooldown = node_cooldown
+        self._lost = {}  # node id -> monotonic time until which it is avoided
+
+    def status(self):
+        """Raw `value` of the hub /status response."""
+        with urllib.request.urlopen(f"{self.hub_url}/status", timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8')).get('value', {})
+
+    def nodes(self, status=None):
+        """
+        Nodes as seen by the hub.
+
+        Returns:
+            list of {'id', 'uri', 'up', 'max_sessions', 'busy', 'free', 'stereotypes', 'sessions'},
+            where `free` counts idle slots for `browser_name`
+        """
+        status = self.status() if status is None else status
+        nodes = []
+        for node in status.get('nodes', []):
+            slots = node.get('slots', [])
+            matching = [slot for slot in slots
+                        if slot.get('stereotype', {}).get('browserName', self.browser_name) == self.browser_name]
+            busy = sum(1 for slot in slots if slot.get('session'))
+            free_slots = max(0, min(sum(1 for slot in matching if not slot.get('session')),
+                                    node.get('maxSessions', len(slots)) - busy))
+            nodes.append({
+                'id': node.get('id'),
+                'uri': node.get('uri'),
+                'up': node.get('availability', 'UP') == 'UP',
+                'max_sessions': node.get('maxSessions', len(slots)),
+                'busy': busy,
+                'free': free_slots,
+                'stereotypes': [slot.get('stereotype', {}) for slot in matching],
+                'sessions': [slot['session'].get('sessionId') for slot in slots if slot.get('session')],
+            })
+        return nodes
+
+    def capacity(self, nodes=None):
+        """Idle `browser_name` slots over all usable nodes."""
+        return sum(node['free'] for node in (self.nodes() if nodes is None else nodes) if self._usable(node))
+
+    def mark_lost(self, node_id):
+        self._lost[node_id] = time.monotonic() + self.node_cooldown
+
+    def _usable(self, node):
+        return node['up'] and self._lost.get(node['id'], 0) <= time.monotonic()
+
+    def pick_node(self, nodes=None):
+        """Usable node with the most idle slots, or None when the grid is full."""
+        candidates = [node for node in (self.nodes() if nodes is None else nodes) if self._usable(node) and node['free'] > 0]
+        return max(candidates, key=lambda node: (node['free'], -node['busy'])) if candidates else None
+
+    def node_of_session(self, session_id, nodes=None):
+        """Id of the node running `session_id`, or None if the hub no longer lists it."""
+        for node in (self.nodes() if nodes is None else nodes):
+            if session_id in node['sessions']:
+                return node['id']
+        return None
+
+    @staticmethod
+    def placement_capabilities(node):
+        """Vendor extension capabilities (`prefix:name`) of the node's stereotype, used to target it."""
+        if not node or not node['stereotypes']:
+            return {}
+        return {key: value for key, value in node['stereotypes'][0].items()
+                if ':' in key and not key.startswith(('goog:', 'moz:', 'ms:', 'se:', 'webauthn:'))}
+
+
+class CdpSession:
+    """
+    DevTools websocket to one page of a local Chrome, for batched hot-path reads.
+
+    Selenium keeps every action; reads that would each cost a WebDriver HTTP round
+    trip plus a CDP hop (URL, readyState, title, element existence) are answered by
+    a single `Runtime.evaluate` over the page's own websocket. Needs the optional
+    `websocket-client` package.
+    """
+
+    def __init__(self, ws_url, timeout=5):
+        self.ws_url = ws_url
+        self.timeout = timeout
+        self._ws = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_page(cls, debugger_address, target_id, timeout=5):
+        """
+        Session for the page target `target_id` (ChromeDriver window handles are target ids).
+
+        Args:
+            debugger_address: `goog:chromeOptions.debuggerAddress` capability (host:port)
+            target_id: Window handle of the page
+        """
+        with urllib.request.urlopen(f"http://{debugger_address}/json/list", timeout=timeout) as response:
+            targets = json.loads(response.read().decode('utf-8'))
+        for target in targets:
+            if target.get('id') == target_id and target.get('webSocketDebuggerUrl'):
+                return cls(target['webSocketDebuggerUrl'], timeout=timeout).connect()
+        raise LookupError(f"DevTools target {target_id} not found at {debugger_address}")
+
+    @property
+    def connected(self):
+        return self._ws is not None
+
+    def connect(self):
+        import websocket  # websocket-client
+        # Chrome rejects websocket clients that send an Origin it was not told to allow
+        self._ws = websocket.create_connection(self.ws_url, timeout=self.timeout, suppress_origin=True)
+        return self
+
+    def call(self, method, params=None):
+        """Send one CDP command and return its result (page events in between are skipped)."""
+        with self._lock:
+            if self._ws is None:
+                raise ConnectionError("CDP session is closed")
+            message_id = next(self._ids)
+            self._ws.send(json.dumps({'id': message_id, 'method': method, 'params': params or {}}))
+            while True:
+                message = json.loads(self._ws.recv())
+                if message.get('id') != message_id:
+                    continue
+                if 'error' in message:
+                    raise RuntimeError(f"{method}: {message['error'].get('message')}")
+                return message.get('result', {})
+
+    def evaluate(self, script, *args):
+        """
+        Run a WebDriver-style script body (`arguments[i]`, `return ...`) in the page.
+
+        Returns:
+            The JSON value returned by the script
+        """
+        expression = f"(function () {{{script}}}).apply(null, {json.dumps(list(args))})"
+        result = self.call('Runtime.evaluate', {'expression': expression, 'returnByValue': True})
+        if result.get('exceptionDetails'):
+            details = result['exceptionDetails']
+            raise RuntimeError(details.get('exception', {}).get('description') or details.get('text'))
+        return result.get('result', {}).get('value')
+
+    def close(self):
+        with self._lock:
+            if self._ws is not None:
+                try:
+                    self._ws.close()
+                except Exception:
+                    pass
+                self._ws = None
+
+
+def shard_path(path, index):
+    """Per-shard variant of a file path: events/events.jsonl -> events/shard1/events.jsonl."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'shard{index}', name)
+
+
+class ShardBotProxy:
+    """
+    Stand-in for telegram.Bot inside a shard worker process.
+
+    Any `await proxy.send_message(...)` / `send_photo(...)` is put on the shared
+    `outbox` queue as {'type': 'call', 'shard', 'id', 'method', 'kwargs'}; the
+    supervisor performs it with the real bot and answers on the worker's inbox.
+    `deliver()` completes the awaiting call with an object exposing `message_id`.
+    File-like arguments are read into bytes so the request can be pickled.
+    """
+
+    def __init__(self, shard, outbox, timeout=60):
+        self.shard = shard
+        self.outbox = outbox
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._pending = {}  # request id -> (loop, future)
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        async def call(**kwargs):
+            return await self._call(method, kwargs)
+        return call
+
+    async def _call(self, method, kwargs):
+        kwargs = {key: value.read() if hasattr(value, 'read') else value for key, value in kwargs.items()}
+        request_id = next(self._ids)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[request_id] = (loop, future)
+        self.outbox.put({'type': 'call', 'shard': self.shard, 'id': request_id, 'method': method, 'kwargs': kwargs})
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+        if result.get('error'):
+            raise RuntimeError(f"{method}: {result['error']}")
+        return SimpleNamespace(message_id=result.get('message_id'))
+
+    def deliver(self, request_id, result):
+        """Complete call `request_id` with the supervisor's `result` dict (safe from any thread)."""
+        loop, future = self._pending.get(request_id, (None, None))
+        if future is not None:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(result))
+
+
+class _MemoryLeaseBackend:
+    """In-process stand-in for the shared store (single node, tests)."""
+
+    def __init__(self):
+        self._data = {}  # key -> (owner, expires_at)
+        self._lock = threading.Lock()
+
+    def claim(self, key, owner, ttl, now):
+        with self._lock:
+            current = self._data.get(key)
+            if current and current[0] != owner and current[1] > now:
+                return False
+            self._data[key] = (owner, now + ttl)
+            return True
+
+    def release(self, key, owner):
+        with self._lock:
+            if self._data.get(key, (None,))[0] == owner:
+                del self._data[key]
+
+    def items(self, prefix, now):
+        with self._lock:
+            return {key: owner for key, (owner, expires) in self._data.items()
+                    if key.startswith(prefix) and expires > now}
+
+
+class _SqliteLeaseBackend:
+    """Leases in one SQLite file on a path every node can reach."""
+
+    def __init__(self, path, timeout=10):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.timeout = timeout
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _connect(self):
+        # A short-lived connection per call: no handle survives a network share hiccup
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def claim(self, key, owner, ttl, now):
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT owner, expires FROM leases WHERE key = ?", (key,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                db.execute("ROLLBACK")
+                return False
+            db.execute("INSERT OR REPLACE INTO leases (key, owner, expires) VALUES (?, ?, ?)", (key, owner, now + ttl))
+            db.execute("COMMIT")
+            return True
+        finally:
+            db.close()
+
+    def release(self, key, owner):
+        db = self._connect()
+        try:
+            db.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+        finally:
+            db.close()
+
+    def items(self, prefix, now):
+        db = self._connect()
+        try:
+            rows = db.execute("SELECT key, owner FROM leases WHERE key >= ? AND key < ? AND expires > ?",
+                              (prefix, prefix + '\uffff', now)).fetchall()
+        finally:
+            db.close()
+        return dict(rows)
+
+
+class _RedisLeaseBackend:
+    """Leases as expiring keys on a Redis-compatible server (requires the optional redis package)."""
+
+    # Take the key if free, or extend it if we already own it
+    CLAIM_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+    RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+    def __init__(self, url, namespace='vfsbot:'):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.namespace = namespace
+        self._claim = self.redis.register_script(self.CLAIM_SCRIPT)
+        self._release = self.redis.register_script(self.RELEASE_SCRIPT)
+
+    def claim(self, key, owner, ttl, now):
+        return bool(self._claim(keys=[self.namespace + key], args=[owner, int(ttl * 1000)]))
+
+    def release(self, key, owner):
+        self._release(keys=[self.namespace + key], args=[owner])
+
+    def items(self, prefix, now):
+        keys = list(self.redis.scan_iter(match=self.namespace + prefix + '*'))
+        owners = self.redis.mget(keys) if keys else []
+        return {key[len(self.namespace):]: owner for key, owner in zip(keys, owners) if owner is not None}
+
+
+class LeaseStore:
+    """
+    Cluster coordination: node heartbeats, applicant leases and alert deduplication.
+
+    Every node heartbeats a `node:<id>` key and holds at most its fair share
+    (ceil(applicants / live nodes)) of `applicant:<key>` leases, renewing them
+    on each heartbeat. Leases of a node that stops heartbeating expire after
+    `ttl` seconds and are picked up by the others; when a node joins, the
+    others shed leases above their new share. `claim_once` lets exactly one
+    node act on an event (e.g. a slot alert) within `ttl`.
+
+    Backends: 'sqlite' (file on a shared path), 'redis' (Redis-compatible
+    server, optional `redis` package) or 'memory' (in-process stand-in).
+    """
+
+    def __init__(self, node_id, backend='memory', path='leases.db', url='redis://localhost:6379/0', ttl=90):
+        self.node_id = node_id
+        self.ttl = ttl
+        self.backend_name = backend
+        if backend == 'sqlite':
+            self.backend = _SqliteLeaseBackend(path)
+        elif backend == 'redis':
+            self.backend = _RedisLeaseBackend(url)
+        elif backend == 'memory':
+            self.backend = _MemoryLeaseBackend()
+        else:
+            raise ValueError(f"Unknown lease backend: {backend}")
+        self.held = set()
+
+    def heartbeat(self, now=None):
+        return self.backend.claim(f'node:{self.node_id}', self.node_id, self.ttl, now or time.time())
+
+    def live_nodes(self, now=None):
+        return sorted(self.backend.items('node:', now or time.time()).values())
+
+    def fair_share(self, total, now=None):
+        nodes = max(1, len(self.live_nodes(now)))
+        return -(-total // nodes)
+
+    def rebalance(self, keys, now=None):
+        """
+        Heartbeat, renew held leases and move towards the fair share of `keys`.
+
+        Args:
+            keys: Applicant keys this node is configured for (ordered by preference)
+
+        Returns:
+            set of keys leased to this node after the pass
+        """
+        now = now or time.time()
+        self.heartbeat(now)
+        share = self.fair_share(len(keys), now)
+        held = set()
+        for key in keys:
+            if key in self.held and self.backend.claim(f'applicant:{key}', self.node_id, self.ttl, now):
+                held.add(key)
+        # Shed leases above the share so a newly joined node gets work
+        for key in sorted(held)[share:]:
+            self.backend.release(f'applicant:{key}', self.node_id)
+            held.discard(key)
+        # Take over free or expired leases up to the share
+        taken = self.backend.items('applicant:', now)
+        for key in keys:
+            if len(held) >= share:
+                break
+            if key not in held and f'applicant:{key}' not in taken:
+                if self.backend.claim(f'applicant:{key}', self.node_id, self.ttl, now):
+                    held.add(key)
+        self.held = held
+        return held
+
+    def release_all(self):
+        for key in self.held:
+            self.backend.release(f'applicant:{key}', self.node_id)
+        self.backend.release(f'node:{self.node_id}', self.node_id)
+        self.held = set()
+
+    def claim_once(self, key, ttl, now=None):
+        """True for the first node claiming `key` within `ttl` seconds (and again for that node)."""
+        return self.backend.claim(f'once:{key}', self.node_id, ttl, now or time.time())
+
+    def status(self, now=None):
+        now = now or time.time()
+        return {
+            'node': self.node_id,
+            'backend': self.backend_name,
+            'nodes': self.live_nodes(now),
+            'held': sorted(self.held),
+            'leases': {key[len('applicant:'):]: owner for key, owner in self.backend.items('applicant:', now).items()},
+        }